@@ -1,27 +1,113 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # 定义 SQLite 数据库的地址
 # 这里的 ./database.db 表示会在项目根目录生成数据库文件
-SQLALCHEMY_DATABASE_URL = "sqlite:///./database.db"
+DATABASE_PATH = os.environ.get("AICOMIC_DB_PATH", "./database.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+# 路由走异步驱动（aiosqlite）；后台线程、脚本仍用同步引擎
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
 
-# 创建引擎
-# connect_args={"check_same_thread": False} 是 SQLite 必须的配置
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# 引擎参数（环境变量可调）
+# - tuned：WAL + synchronous=NORMAL + mmap + 大页缓存 + busy_timeout + 外键约束，读写分池
+# - default：旧行为，SQLite 默认配置、单一连接池（用于对比/排查）
+SQLITE_PROFILE = os.environ.get("AICOMIC_SQLITE_PROFILE", "tuned")
+SQLITE_MMAP_MB = int(os.environ.get("AICOMIC_SQLITE_MMAP_MB", "256"))
+SQLITE_CACHE_MB = int(os.environ.get("AICOMIC_SQLITE_CACHE_MB", "64"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("AICOMIC_SQLITE_BUSY_TIMEOUT_MS", "10000"))
+SQLITE_READ_POOL_SIZE = int(os.environ.get("AICOMIC_SQLITE_READ_POOL", "8"))
+# SQLite 同一时刻只有一个写者：写池固定单连接，写请求在池上排队，
+# 而不是多个连接各自开事务再抢写锁（读快照升级写锁时会直接 SQLITE_BUSY，busy_timeout 也救不了）
+SQLITE_WRITE_POOL_SIZE = 1
+
+
+def sqlite_pragmas(profile: str, readonly: bool = False) -> list:
+    """按连接执行的 PRAGMA 列表（顺序有意义：journal_mode 要先于其他设置）"""
+    if profile != "tuned":
+        return []
+    pragmas = []
+    if not readonly:
+        # WAL 是库文件级别的持久设置，由写连接负责切换
+        pragmas.append(("journal_mode", "WAL"))
+    pragmas += [
+        ("synchronous", "NORMAL"),  # WAL 下只在 checkpoint 时 fsync，断电最多丢最后几个事务，不会损坏
+        ("busy_timeout", SQLITE_BUSY_TIMEOUT_MS),  # 锁冲突时等待而不是立刻报 database is locked
+        ("mmap_size", SQLITE_MMAP_MB * 1024 * 1024),
+        ("cache_size", -SQLITE_CACHE_MB * 1024),  # 负数表示 KiB
+        ("temp_store", "MEMORY"),
+        ("foreign_keys", "ON"),
+    ]
+    if readonly:
+        pragmas.append(("query_only", "ON"))  # 读池误写直接报错
+    return pragmas
+
+
+def _install_pragmas(sync_engine, pragmas: list):
+    if not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _engine_kwargs(profile: str, readonly: bool, pool_size: int = None) -> dict:
+    # connect_args={"check_same_thread": False} 是 SQLite 必须的配置
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if profile == "tuned":
+        kwargs["connect_args"]["timeout"] = SQLITE_BUSY_TIMEOUT_MS / 1000
+        kwargs["pool_size"] = pool_size or (SQLITE_READ_POOL_SIZE if readonly else SQLITE_WRITE_POOL_SIZE)
+        kwargs["max_overflow"] = 0
+    return kwargs
+
+
+def make_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = SQLITE_PROFILE, readonly: bool = False, pool_size: int = None):
+    new_engine = create_engine(url, **_engine_kwargs(profile, readonly, pool_size))
+    _install_pragmas(new_engine, sqlite_pragmas(profile, readonly))
+    return new_engine
+
+
+def make_async_engine(url: str = ASYNC_DATABASE_URL, profile: str = SQLITE_PROFILE, readonly: bool = False, pool_size: int = None):
+    new_engine = create_async_engine(url, **_engine_kwargs(profile, readonly, pool_size))
+    _install_pragmas(new_engine.sync_engine, sqlite_pragmas(profile, readonly))
+    return new_engine
+
+
+# 创建引擎：engine / SessionLocal 给后台任务线程和脚本用（同步）
+engine = make_engine()
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 同步只读引擎：线程池里的纯读计算、长时间的导出快照用（不占唯一的写连接）
+read_engine = make_engine(readonly=True) if SQLITE_PROFILE == "tuned" else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# 路由用异步引擎：async_engine 负责写，async_read_engine 只给 GET 路由用
+# expire_on_commit=False：提交后访问属性不会触发隐式 IO（异步会话里会报 MissingGreenlet）
+async_engine = make_async_engine()
+async_read_engine = make_async_engine(readonly=True) if SQLITE_PROFILE == "tuned" else async_engine
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 # 创建 Base 类，所有的 Model 都继承自它
 Base = declarative_base()
 
 # 获取数据库会话的依赖函数 (用于 FastAPI)
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# 只读会话：WAL 下读不会被写阻塞，也不占写连接
+async def get_read_db():
+    async with AsyncReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,285 @@
+# backend/app/file_gc.py
+# 延迟文件回收：删除接口只在自己的事务里登记墓碑（file_tombstones），立刻返回；后台清扫任务分批真正删文件
+# - 墓碑和删行同一个事务：回滚时墓碑也没了，不会误删；提交后才可能被清扫
+# - 清扫在写锁里先认领一批墓碑，再逐个确认没有行还在引用（素材 / 镜头视频 / blob），
+#   把文件或目录改名进 data/_trash/ 后提交，最后在锁外 rmtree（大目录也只占写锁一瞬间）
+# - blob：release 只把 ref_count 减到 0，清扫时仍为 0 且没有素材指向才删行删文件；期间同内容重新上传会直接复活
+# - 对账扫描：data/ 下没有任何行引用的文件（孤儿），以及文件已不存在的行
+import os
+import shutil
+import time
+import uuid
+from sqlalchemy import delete, exists, func, or_, select
+from sqlalchemy.orm import Session
+
+from . import jobs, models
+from .utils import blob_store
+
+DATA_ROOT = blob_store.DATA_ROOT
+TRASH_DIR_NAME = "_trash"
+SWEEP_BATCH = 200
+ORPHAN_GRACE_SECONDS = 3600  # 对账时跳过最近改动过的文件（可能是还没提交的上传）
+REPORT_LIMIT = 200  # 对账报告里最多列出的路径 / id 数
+SKIP_DIRS = {TRASH_DIR_NAME, f"{blob_store.BLOB_DIR_NAME}/tmp"}
+SIDE_SUFFIXES = (".br", ".gz")  # 预压缩副本，跟着原文件走
+
+
+def _normalize(relative_path: str) -> str:
+    return relative_path.replace("\\", "/").strip("/")
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# =======================
+# 登记墓碑（在调用方事务里，不提交）
+# =======================
+
+def tombstone_path(db: Session, relative_path: str):
+    """登记 data/ 下的文件或目录；绝对路径（data/ 以外的历史文件）不删"""
+    if not relative_path or os.path.isabs(relative_path):
+        return
+    db.add(models.FileTombstone(file_path=_normalize(relative_path)))
+    schedule_sweep(db)
+
+
+def tombstone_replaced(db: Session, old_relative, new_relative):
+    """文件被替换（如镜头视频）后登记旧文件；同名说明内容没变，blob 由引用计数管理，都不登记"""
+    if not old_relative or old_relative == new_relative or blob_store.is_blob_path(old_relative):
+        return
+    tombstone_path(db, old_relative)
+
+
+def discard_asset(db: Session, asset: models.Asset):
+    """删除 Asset 前调用：blob 资产减引用，历史资产登记文件"""
+    if asset.blob_sha256:
+        blob_store.release(db, asset.blob_sha256)
+        db.add(models.FileTombstone(blob_sha256=asset.blob_sha256))
+        schedule_sweep(db)
+    elif asset.file_path:
+        tombstone_path(db, asset.file_path)
+
+
+def discard_shots(db: Session, shot_ids):
+    """镜头删除前调用：素材行删掉（镜头 -> 素材没有级联），素材文件和视频登记墓碑"""
+    shot_ids = list(shot_ids)
+    if not shot_ids:
+        return
+    assets = db.execute(select(models.Asset).where(models.Asset.shot_id.in_(shot_ids))).scalars().all()
+    for asset in assets:
+        discard_asset(db, asset)
+        db.delete(asset)
+    videos = db.execute(
+        select(models.Shot.video_path).where(models.Shot.id.in_(shot_ids), models.Shot.video_path.is_not(None))
+    ).scalars()
+    for video_path in videos:
+        tombstone_path(db, video_path)
+
+
+def schedule_sweep(db: Session):
+    """已经有排队中的清扫任务就不再登记（同一会话只查一次）"""
+    if db.info.get("sweep_scheduled"):
+        return
+    db.info["sweep_scheduled"] = True
+    pending = db.execute(
+        select(models.Job.id).where(models.Job.kind == "sweep_files", models.Job.status == "pending").limit(1)
+    ).first()
+    if pending is None:
+        jobs.enqueue(db, "sweep_files", {})
+
+
+# =======================
+# 清扫
+# =======================
+
+def _referenced(db: Session, relative_path: str) -> bool:
+    """路径本身或目录下的文件还被素材 / 镜头视频 / blob 引用"""
+    prefix = _escape_like(relative_path) + "/%"
+    checks = []
+    for column in (models.Asset.file_path, models.Shot.video_path, models.Blob.file_path):
+        checks.append(exists().where(or_(column == relative_path, column.like(prefix, escape="\\"))))
+    return db.execute(select(or_(*checks))).scalar()
+
+
+def _to_trash(relative_path: str, trash_dir: str, moved: list):
+    full_path = os.path.join(DATA_ROOT, relative_path)
+    candidates = [full_path] + [full_path + suffix for suffix in SIDE_SUFFIXES]
+    for path in candidates:
+        if not os.path.lexists(path):
+            continue
+        os.makedirs(trash_dir, exist_ok=True)
+        target = os.path.join(trash_dir, str(len(moved)))
+        os.rename(path, target)
+        moved.append((path, target))
+
+
+def sweep_batch(db: Session, limit: int = SWEEP_BATCH) -> dict:
+    """认领并处理一批墓碑（会提交）；返回 {claimed, removed, kept}"""
+    # DELETE ... RETURNING 是这批里的第一条写：拿到写锁，之后的引用检查和改名都在锁里完成
+    tombstone = models.FileTombstone
+    claimed = db.execute(
+        delete(tombstone)
+        .where(tombstone.id.in_(select(tombstone.id).order_by(tombstone.id).limit(limit)))
+        .returning(tombstone.file_path, tombstone.blob_sha256)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not claimed:
+        db.commit()
+        return {"claimed": 0, "removed": 0, "kept": 0}
+
+    trash_dir = os.path.join(DATA_ROOT, TRASH_DIR_NAME, uuid.uuid4().hex)
+    moved = []
+    kept = 0
+    seen = set()
+    try:
+        for file_path, blob_sha256 in claimed:
+            if blob_sha256:
+                file_path = db.execute(
+                    delete(models.Blob)
+                    .where(
+                        models.Blob.sha256 == blob_sha256,
+                        models.Blob.ref_count <= 0,
+                        ~exists().where(models.Asset.blob_sha256 == blob_sha256),
+                    )
+                    .returning(models.Blob.file_path)
+                    .execution_options(synchronize_session=False)
+                ).scalar()
+                if file_path is None:  # 又被引用了 / 已经删过
+                    kept += 1
+                    continue
+            elif file_path in seen or _referenced(db, file_path):
+                kept += 1
+                continue
+            seen.add(file_path)
+            _to_trash(file_path, trash_dir, moved)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        # 没提交成功：改名挪走的文件放回原处，墓碑随回滚恢复，下次再清
+        for original, target in reversed(moved):
+            try:
+                os.rename(target, original)
+            except OSError as e:
+                print(f"[GC][Error] Failed to restore {original}: {e}")
+        raise
+    if os.path.isdir(trash_dir):
+        shutil.rmtree(trash_dir, ignore_errors=True)
+    return {"claimed": len(claimed), "removed": len(moved), "kept": kept}
+
+
+def empty_trash():
+    """进程在改名后、rmtree 前退出时留下的垃圾"""
+    shutil.rmtree(os.path.join(DATA_ROOT, TRASH_DIR_NAME), ignore_errors=True)
+
+
+@jobs.job_handler("sweep_files")
+def handle_sweep_files(db: Session, payload: dict):
+    totals = {"batches": 0, "claimed": 0, "removed": 0, "kept": 0}
+    while True:
+        result = sweep_batch(db)
+        if not result["claimed"]:
+            break
+        totals["batches"] += 1
+        for key in ("claimed", "removed", "kept"):
+            totals[key] += result[key]
+        if result["claimed"] < SWEEP_BATCH:
+            break
+    if totals["removed"]:
+        print(f"[GC] Swept {totals['removed']} file(s) in {totals['batches']} batch(es)")
+    return totals
+
+
+def stats(db: Session) -> dict:
+    count, oldest = db.execute(
+        select(func.count(models.FileTombstone.id), func.min(models.FileTombstone.created_at))
+    ).one()
+    unreferenced = db.execute(select(func.count()).where(models.Blob.ref_count <= 0)).scalar()
+    return {"pending_tombstones": count, "oldest_tombstone_at": oldest, "unreferenced_blobs": unreferenced}
+
+
+# =======================
+# 对账
+# =======================
+
+def _walk_files(skip_dirs):
+    """(相对路径, stat)；跳过垃圾箱、blob 暂存目录"""
+    for root, dirs, files in os.walk(DATA_ROOT):
+        relative_root = _normalize(os.path.relpath(root, DATA_ROOT)) if root != DATA_ROOT else ""
+        dirs[:] = [d for d in dirs if f"{relative_root}/{d}".strip("/") not in skip_dirs]
+        for name in files:
+            relative_path = f"{relative_root}/{name}".strip("/")
+            try:
+                yield relative_path, os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+
+
+def reconcile(db: Session, apply: bool = False) -> dict:
+    """
+    同步执行（后台任务里跑，data/ 很大时要走很久）
+    - orphans：data/ 下没有任何行引用、也不在墓碑里的文件；apply=True 时登记墓碑交给清扫任务
+      （清扫时还会在写锁里再确认一次没有引用）
+    - missing_assets / missing_videos：行还在、文件已经不在的素材 / 镜头
+    - 引用数为 0 却没有墓碑的 blob（进程中途退出留下的）apply 时补登记
+    """
+    referenced = set()
+    for column in (models.Asset.file_path, models.Shot.video_path, models.Blob.file_path):
+        referenced.update(_normalize(path) for path in db.execute(select(column).where(column.is_not(None))).scalars())
+    pending = {
+        _normalize(path) for path in db.execute(
+            select(models.FileTombstone.file_path).where(models.FileTombstone.file_path.is_not(None))
+        ).scalars()
+    }
+
+    report = {"orphans": [], "orphan_count": 0, "orphan_bytes": 0}
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    for relative_path, st in _walk_files(SKIP_DIRS):
+        base = relative_path
+        for suffix in SIDE_SUFFIXES:
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        if base in referenced or relative_path in referenced or relative_path in pending:
+            continue
+        if st.st_mtime > cutoff or relative_path.endswith(".part"):
+            continue
+        report["orphan_count"] += 1
+        report["orphan_bytes"] += st.st_size
+        if len(report["orphans"]) < REPORT_LIMIT:
+            report["orphans"].append(relative_path)
+        if apply:
+            tombstone_path(db, relative_path)
+
+    def missing(rows):
+        ids = [
+            row_id for row_id, path in rows
+            if not os.path.isabs(path) and not os.path.exists(os.path.join(DATA_ROOT, path))
+        ]
+        return {"count": len(ids), "ids": ids[:REPORT_LIMIT]}
+
+    report["missing_assets"] = missing(db.execute(
+        select(models.Asset.id, models.Asset.file_path).where(models.Asset.file_path.is_not(None))
+    ))
+    report["missing_videos"] = missing(db.execute(
+        select(models.Shot.id, models.Shot.video_path).where(models.Shot.video_path.is_not(None))
+    ))
+
+    stale_blobs = db.execute(
+        select(models.Blob.sha256).where(
+            models.Blob.ref_count <= 0,
+            ~exists().where(models.FileTombstone.blob_sha256 == models.Blob.sha256),
+        )
+    ).scalars().all()
+    report["unreferenced_blobs"] = len(stale_blobs)
+    if apply:
+        for sha256 in stale_blobs:
+            db.add(models.FileTombstone(blob_sha256=sha256))
+        if stale_blobs:
+            schedule_sweep(db)
+    report["applied"] = apply
+    return report
+
+
+@jobs.job_handler("reconcile_files")
+def handle_reconcile_files(db: Session, payload: dict):
+    return reconcile(db, apply=bool(payload.get("apply")))
@@ -0,0 +1,261 @@
+# backend/app/jobs.py
+# 进程内后台任务：任务落在 SQLite 的 jobs 表里，工作线程轮询领取执行
+# - 失败自动重试（指数退避），超过 max_attempts 标记 failed，并调用该类任务的 on_failure（如果有）
+# - 服务重启时把中断的 running 任务放回 pending，继续执行
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from .utils import blob_store, near_dup
+from .utils.image_hash import analyze_image, dhash_file
+from .utils.process_pool import get_process_pool
+
+JOB_WORKERS = int(os.environ.get("AICOMIC_JOB_WORKERS", "2"))
+POLL_INTERVAL = 1.0  # 秒；有新任务时会被提前唤醒
+
+DATA_ROOT = blob_store.DATA_ROOT
+
+_handlers = {}
+_failure_handlers = {}
+_wakeup = threading.Event()
+_stop = threading.Event()
+_threads = []
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job_handler(kind: str, on_failure=None):
+    """
+    注册任务处理函数：handler(db, payload) -> 可 JSON 序列化的结果
+    on_failure(db, payload, error)：最后一次尝试也失败时调用，与 failed 状态同一事务提交
+    """
+    def decorator(fn):
+        _handlers[kind] = fn
+        if on_failure is not None:
+            _failure_handlers[kind] = on_failure
+        return fn
+    return decorator
+
+
+def enqueue(db: Session, kind: str, payload: dict = None, max_attempts: int = 3) -> models.Job:
+    """
+    在调用方的事务里登记任务（随调用方 commit 一起生效）
+    """
+    job = models.Job(kind=kind, payload=payload or {}, status="pending", attempts=0, max_attempts=max_attempts)
+    db.add(job)
+    db.flush()
+    notify()
+    return job
+
+
+def notify():
+    """唤醒空闲的工作线程"""
+    _wakeup.set()
+
+
+def _claim(db: Session):
+    """原子领取一个到期的 pending 任务（UPDATE ... RETURNING，多线程不会重复领取）"""
+    now = _utcnow()
+    next_id = select(models.Job.id).where(
+        models.Job.status == "pending",
+        or_(models.Job.run_after.is_(None), models.Job.run_after <= now),
+    ).order_by(models.Job.id).limit(1).scalar_subquery()
+    stmt = update(models.Job).where(
+        models.Job.id == next_id, models.Job.status == "pending"
+    ).values(
+        status="running", attempts=models.Job.attempts + 1, updated_at=now
+    ).returning(
+        models.Job.id, models.Job.kind, models.Job.payload, models.Job.attempts, models.Job.max_attempts
+    ).execution_options(synchronize_session=False)
+    row = db.execute(stmt).first()
+    db.commit()
+    return row
+
+
+def _finish(db: Session, job_id: int, **values):
+    db.execute(
+        update(models.Job).where(models.Job.id == job_id)
+        .values(updated_at=_utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def run_one() -> bool:
+    """领取并执行一个任务；没有可执行任务时返回 False"""
+    db = SessionLocal()
+    try:
+        row = _claim(db)
+        if row is None:
+            return False
+        job_id, kind, payload, attempts, max_attempts = row
+        handler = _handlers.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind '{kind}'")
+            result = handler(db, payload or {})
+            db.commit()
+            _finish(db, job_id, status="done", result=result, last_error=None)
+        except Exception as e:
+            db.rollback()
+            error = f"{e}\n{traceback.format_exc()}"
+            print(f"[Jobs][Error] Job {job_id} ({kind}) attempt {attempts} failed: {e}")
+            if attempts < max_attempts:
+                backoff = timedelta(seconds=2 ** attempts)
+                _finish(db, job_id, status="pending", last_error=error, run_after=_utcnow() + backoff)
+            else:
+                _run_failure_handler(db, job_id, kind, payload or {}, e)
+                _finish(db, job_id, status="failed", last_error=error)
+        return True
+    finally:
+        db.close()
+
+
+def _run_failure_handler(db: Session, job_id: int, kind: str, payload: dict, error: Exception):
+    on_failure = _failure_handlers.get(kind)
+    if on_failure is None:
+        return
+    try:
+        on_failure(db, payload, error)
+    except Exception as e:
+        db.rollback()
+        print(f"[Jobs][Error] Failure handler of job {job_id} ({kind}) failed: {e}")
+
+
+def _worker_loop():
+    while not _stop.is_set():
+        try:
+            if run_one():
+                continue
+        except Exception as e:
+            # 数据库被锁等瞬时错误：稍后重试，不让线程退出
+            print(f"[Jobs][Error] Worker loop error: {e}")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def recover_interrupted_jobs():
+    """上次进程退出时还在 running 的任务重新排队"""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(models.Job).where(models.Job.status == "running")
+            .values(status="pending", run_after=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if result.rowcount:
+            print(f"[Jobs] Re-queued {result.rowcount} interrupted job(s)")
+    finally:
+        db.close()
+
+
+def start_workers(count: int = JOB_WORKERS):
+    if _threads:
+        return
+    _stop.clear()
+    recover_interrupted_jobs()
+    for i in range(count):
+        t = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+        t.start()
+        _threads.append(t)
+
+
+def stop_workers(timeout: float = 5.0):
+    _stop.set()
+    _wakeup.set()
+    for t in _threads:
+        t.join(timeout)
+    _threads.clear()
+
+
+# =======================
+# 任务处理函数
+# =======================
+
+def enqueue_metadata_extraction(db: Session, asset: models.Asset) -> models.Job:
+    """上传后先把 meta_data 标成 pending，由后台补齐"""
+    db.flush()
+    job = enqueue(db, "extract_metadata", {"asset_id": asset.id})
+    asset.meta_data = {"status": "pending", "job_id": job.id}
+    return job
+
+
+def _asset_path(asset: models.Asset) -> str:
+    return asset.file_path if os.path.isabs(asset.file_path) else os.path.join(DATA_ROOT, asset.file_path)
+
+
+def _mark_metadata_failed(db: Session, payload: dict, error: Exception):
+    """重试用尽：meta_data 不再停在 pending，前端可以据此提示或重新提取"""
+    asset = db.query(models.Asset).filter(models.Asset.id == payload["asset_id"]).first()
+    if asset is not None:
+        asset.meta_data = {"status": "failed", "error": str(error)}
+
+
+@job_handler("extract_metadata", on_failure=_mark_metadata_failed)
+def handle_extract_metadata(db: Session, payload: dict):
+    asset = db.query(models.Asset).filter(models.Asset.id == payload["asset_id"]).first()
+    if asset is None:
+        return {"skipped": "asset deleted"}
+    # Pillow 回退路径是 CPU 密集的，放到进程池里跑；感知哈希顺带一起算
+    meta, phash = get_process_pool().submit(analyze_image, _asset_path(asset)).result()
+    asset.meta_data = meta
+    asset.phash = phash
+    if isinstance(meta.get("prompt"), str):
+        schedule_prompt_indexing_for_asset(db, asset)
+    return {"asset_id": asset.id, "fields": sorted(meta.keys())}
+
+
+def schedule_prompt_indexing(db: Session, project_id: int):
+    """登记项目的提示词签名补算；该项目已有排队中的任务就不再登记（在调用方事务里，不提交）"""
+    if project_id is None:
+        return
+    pending = db.execute(
+        select(models.Job.id).where(
+            models.Job.kind == "index_prompts",
+            models.Job.status == "pending",
+            func.json_extract(models.Job.payload, "$.project_id") == project_id,
+        ).limit(1)
+    ).first()
+    if pending is None:
+        enqueue(db, "index_prompts", {"project_id": project_id})
+
+
+def schedule_prompt_indexing_for_asset(db: Session, asset: models.Asset):
+    db.flush()
+    schedule_prompt_indexing(db, near_dup.asset_project_id(db, asset.id))
+
+
+@job_handler("index_prompts")
+def handle_index_prompts(db: Session, payload: dict):
+    """提示词 MinHash 签名和 LSH 桶：素材写入提示词后补算，近似去重接口只读这两张表"""
+    return {"project_id": payload["project_id"], "indexed": near_dup.ensure_signatures(db, payload["project_id"])}
+
+
+BACKFILL_BATCH = 256
+
+
+@job_handler("backfill_image_hashes")
+def handle_backfill_image_hashes(db: Session, payload: dict):
+    """
+    给还没有 phash 的历史图片补算（进程池并行），每批提交后登记下一批
+    按 id 游标推进：解不开的图片 phash 仍为空，但不会被反复重试
+    """
+    after_id = payload.get("after_id", 0)
+    assets = db.query(models.Asset).filter(
+        models.Asset.file_type == "image", models.Asset.phash.is_(None), models.Asset.id > after_id
+    ).order_by(models.Asset.id).limit(BACKFILL_BATCH).all()
+    if not assets:
+        return {"hashed": 0, "done": True}
+    hashes = list(get_process_pool().map(dhash_file, [_asset_path(asset) for asset in assets], chunksize=16))
+    for asset, phash in zip(assets, hashes):
+        asset.phash = phash  # ORM 写入：记变更日志，图片索引据此增量更新
+    enqueue(db, "backfill_image_hashes", {"after_id": assets[-1].id})
+    return {"hashed": sum(phash is not None for phash in hashes), "failed": sum(phash is None for phash in hashes), "last_id": assets[-1].id}
@@ -1,34 +1,18 @@
 # backend/app/main.py
 import os
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import storyboard, assets, projects, events
-from .database import engine, Base
-from sqlalchemy import text
+from .routers import storyboard, assets, projects, events, derivatives, uploads, search, files, storage, jobs as jobs_router
+from .database import engine, async_engine, async_read_engine, Base
+from .utils.process_pool import shutdown_process_pool
+from .utils.response_cache import response_cache
+from . import file_gc, jobs, ordering, revisions, storage_usage  # ordering/revisions: 注册分配排序键、记录修订号的 Session 事件；file_gc / storage_usage: 注册清扫、统计重算任务
+from .migrations import run_migrations
 
 Base.metadata.create_all(bind=engine)
 
-def ensure_characters_category_column():
-    """
-    轻量 SQLite 迁移（无 Alembic）：
-    - 若 characters 表缺少 category 列，则补齐，并将历史数据默认置为 persona
-    """
-    try:
-        with engine.begin() as conn:
-            cols = conn.execute(text("PRAGMA table_info(characters)")).fetchall()
-            col_names = {row[1] for row in cols}  # (cid, name, type, notnull, dflt_value, pk)
-            if "category" not in col_names:
-                conn.execute(text("ALTER TABLE characters ADD COLUMN category TEXT NOT NULL DEFAULT 'persona_visual'"))
-                # 保险起见：把历史 NULL 补齐（正常情况下 NOT NULL + DEFAULT 已覆盖）
-                conn.execute(text("UPDATE characters SET category='persona_visual' WHERE category IS NULL"))
-            # 历史兼容：将旧值 persona 归一化为 persona_visual
-            conn.execute(text("UPDATE characters SET category='persona_visual' WHERE category='persona'"))
-    except Exception as e:
-        # 不阻断服务启动，但打印错误便于排查
-        print(f"[Migration][Warning] ensure_characters_category_column failed: {e}")
-
-ensure_characters_category_column()
+# 版本化迁移：补列、补索引，并在 schema_migrations 里记录版本
+run_migrations(engine)
 
 app = FastAPI(title="AI Comic Studio")
 
@@ -38,17 +22,44 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Content-Range", "Accept-Ranges"],  # 前端从 ETag 里取项目修订号做增量同步；视频按段读取
 )
 
 DATA_DIR = os.path.join(os.getcwd(), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
-app.mount("/files", StaticFiles(directory=DATA_DIR), name="files")
+app.include_router(files.router)  # /files：版本化 URL + ETag + Range
 
 app.include_router(storyboard.router)
 app.include_router(assets.router)
 app.include_router(projects.router)
 app.include_router(events.router)
+app.include_router(derivatives.router)
+app.include_router(uploads.router)
+app.include_router(search.router)
+app.include_router(storage.router)
+app.include_router(jobs_router.router)
+
+@app.on_event("startup")
+def start_workers():
+    file_gc.empty_trash()
+    jobs.start_workers()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    jobs.stop_workers()
+    shutdown_process_pool()
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
 
 @app.get("/")
 def read_root():
-    return {"message": "Server is running"}
\ No newline at end of file
+    return {"message": "Server is running"}
+
+@app.get("/cache/stats")
+def get_response_cache_stats():
+    """剧本树/事件接口响应缓存的命中率与占用"""
+    return response_cache.stats()
\ No newline at end of file
@@ -0,0 +1,359 @@
+# backend/app/migrations.py
+# 版本化的 SQLite 迁移（无 Alembic）
+# - schema_migrations 表记录已执行的版本号，启动时按顺序补跑未执行的迁移
+# - 每个迁移在独立事务里执行，成功后才写入版本号；失败就停在这一步，下次启动重试
+# - 新库由 create_all 建表，迁移需要幂等（列/索引已存在时跳过）
+# 新增迁移：在 MIGRATIONS 末尾追加 (版本号, 名称, 函数)，版本号只增不改
+from sqlalchemy import text
+
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}  # (cid, name, type, ...)
+
+
+def m001_characters_category(conn):
+    """characters 表补齐 category 列，旧值 persona 归一化为 persona_visual"""
+    if "category" not in _columns(conn, "characters"):
+        conn.execute(text("ALTER TABLE characters ADD COLUMN category TEXT NOT NULL DEFAULT 'persona_visual'"))
+        conn.execute(text("UPDATE characters SET category='persona_visual' WHERE category IS NULL"))
+    conn.execute(text("UPDATE characters SET category='persona_visual' WHERE category='persona'"))
+
+
+def m002_assets_blob_columns(conn):
+    """assets 表补齐内容寻址存储需要的列"""
+    cols = _columns(conn, "assets")
+    if "blob_sha256" not in cols:
+        conn.execute(text("ALTER TABLE assets ADD COLUMN blob_sha256 VARCHAR REFERENCES blobs (sha256)"))
+    if "original_filename" not in cols:
+        conn.execute(text("ALTER TABLE assets ADD COLUMN original_filename VARCHAR"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_assets_blob_sha256 ON assets (blob_sha256)"))
+
+
+def m003_projects_revision(conn):
+    """projects 表补齐 revision 列（增量同步用）"""
+    if "revision" not in _columns(conn, "projects"):
+        conn.execute(text("ALTER TABLE projects ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_change_log_project_revision ON change_log (project_id, revision)"))
+
+
+# 层级查询 / 外键检查用到的列（索引名与 models 里 index=True 生成的一致）
+FK_LOOKUP_INDEXES = [
+    ("episodes", "project_id"),
+    ("scenes", "episode_id"),
+    ("shots", "scene_id"),
+    ("shots", "selected_asset_id"),
+    ("assets", "shot_id"),
+    ("assets", "character_id"),
+    ("characters", "project_id"),
+    ("characters", "avatar_asset_id"),
+    ("events", "project_id"),
+]
+
+
+def m004_fk_lookup_indexes(conn):
+    """外键列补索引：按父级查子级、删除资产时的外键检查不再全表扫描"""
+    for table, column in FK_LOOKUP_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+
+
+def m005_event_nodes_unique_target(conn):
+    """
+    event_nodes (event_id, target_type, target_id) 唯一索引
+    历史数据里并发 upsert 可能留下重复节点：保留 id 最小的那条（upsert 一直更新的就是它）
+    """
+    removed = conn.execute(text(
+        "DELETE FROM event_nodes WHERE id NOT IN ("
+        "SELECT MIN(id) FROM event_nodes GROUP BY event_id, target_type, target_id)"
+    )).rowcount
+    if removed:
+        print(f"[Migration] removed {removed} duplicate event_nodes")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_event_nodes_target ON event_nodes (event_id, target_type, target_id)"
+    ))
+
+
+# (表, 父级外键, 旧的排序列)
+SORT_KEY_TABLES = [
+    ("episodes", "project_id", '"order"'),
+    ("scenes", "episode_id", "sequence_number"),
+    ("shots", "scene_id", "sequence_number"),
+]
+
+
+def m006_sort_keys(conn):
+    """
+    集/场/镜头加 sort_key 排序键，按旧排序（编号, id）回填成 1024 的间隔
+    之后插入/移动只改一行，间隔用完由后台任务重排（见 ordering.py）
+    """
+    for table, parent, legacy_order in SORT_KEY_TABLES:
+        if "sort_key" not in _columns(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN sort_key FLOAT"))
+        conn.execute(text(
+            f"UPDATE {table} SET sort_key = ranked.rn * 1024.0 FROM ("
+            f"SELECT id, ROW_NUMBER() OVER (PARTITION BY {parent} ORDER BY COALESCE({legacy_order}, 0), id) AS rn "
+            f"FROM {table}) AS ranked "
+            f"WHERE ranked.id = {table}.id AND {table}.sort_key IS NULL"
+        ))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{parent}_sort_key ON {table} ({parent}, sort_key)"))
+
+
+# 全文检索：每种来源一张 FTS5 表，rowid 就是源表 id（触发器按 rowid 删改，不扫表）
+# trigram 分词：中文没有空格分词，按三字滑窗建索引，任意 >= 3 字的子串都能走索引（短词见 utils/fulltext.py）
+# project_id 只存不索引，查询时过滤
+_SHOT_PROJECT = (
+    "(SELECT e.project_id FROM scenes s JOIN episodes e ON e.id = s.episode_id WHERE s.id = new.scene_id)"
+)
+_ASSET_PROJECT = (
+    "COALESCE("
+    "(SELECT e.project_id FROM shots sh JOIN scenes s ON s.id = sh.scene_id JOIN episodes e ON e.id = s.episode_id "
+    "WHERE sh.id = new.shot_id), "
+    "(SELECT c.project_id FROM characters c WHERE c.id = new.character_id))"
+)
+_ASSET_PROMPT = "CASE WHEN json_valid(new.meta_data) THEN json_extract(new.meta_data, '$.{key}') END"
+
+# (FTS 表, 源表, 索引列, 写入时的取值表达式, 源表里会影响索引内容的列, 只索引满足条件的行)
+SEARCH_TABLES = [
+    (
+        "search_shots", "shots",
+        ["title", "action_text", "dialogue", "prompt"],
+        [_SHOT_PROJECT, "new.title", "new.action_text", "new.dialogue", "new.prompt"],
+        ["scene_id", "title", "action_text", "dialogue", "prompt"],
+        None,
+    ),
+    (
+        "search_characters", "characters",
+        ["name", "description", "base_prompt"],
+        ["new.project_id", "new.name", "new.description", "new.base_prompt"],
+        ["project_id", "name", "description", "base_prompt"],
+        None,
+    ),
+    (
+        "search_assets", "assets",
+        ["prompt", "negative_prompt"],
+        [_ASSET_PROJECT, _ASSET_PROMPT.format(key="prompt"), _ASSET_PROMPT.format(key="negative_prompt")],
+        ["shot_id", "character_id", "meta_data"],
+        # 没有提示词的素材（上传的原图、文本）不进索引
+        "json_valid(new.meta_data) AND (json_extract(new.meta_data, '$.prompt') IS NOT NULL "
+        "OR json_extract(new.meta_data, '$.negative_prompt') IS NOT NULL)",
+    ),
+]
+
+
+def _search_insert(fts: str, columns, values, condition, row: str) -> str:
+    """INSERT ... SELECT：row 为 new 时用在触发器里，为源表名时用来回填整表"""
+    exprs = [value.replace("new.", f"{row}.") for value in values]
+    sql = f"INSERT INTO {fts} (rowid, project_id, {', '.join(columns)}) SELECT {row}.id, {', '.join(exprs)}"
+    if row != "new":
+        sql += f" FROM {row}"
+    if condition:
+        sql += f" WHERE {condition.replace('new.', f'{row}.')}"
+    return sql
+
+
+def m007_search_index(conn):
+    """剧本文本 / 人设 / 素材提示词的 FTS5 全文索引，触发器保持同步，建好后按现有数据回填"""
+    for fts, source, columns, values, watched, condition in SEARCH_TABLES:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"project_id UNINDEXED, {', '.join(columns)}, tokenize='trigram')"
+        ))
+        insert = _search_insert(fts, columns, values, condition, "new") + ";"
+        delete = f"DELETE FROM {fts} WHERE rowid = old.id;"
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN {insert} END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN {delete} END"))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {', '.join(watched)} ON {source} "
+            f"BEGIN {delete} {insert} END"
+        ))
+        conn.execute(text(f"DELETE FROM {fts}"))
+        conn.execute(text(_search_insert(fts, columns, values, condition, source)))
+
+
+def m008_asset_minhash_triggers(conn):
+    """
+    提示词 MinHash 签名 / LSH 桶（表由 create_all 建）随素材失效：
+    meta_data 或归属变了就删掉，下次查询补算；删素材前先删（两张表对 assets 有外键）
+    """
+    invalidate = (
+        "DELETE FROM asset_lsh_buckets WHERE asset_id = old.id; "
+        "DELETE FROM asset_minhash WHERE asset_id = old.id;"
+    )
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS asset_minhash_bd BEFORE DELETE ON assets BEGIN {invalidate} END"))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS asset_minhash_au AFTER UPDATE OF meta_data, shot_id, character_id ON assets "
+        f"BEGIN {invalidate} END"
+    ))
+
+
+def m009_assets_phash(conn):
+    """assets 表补 phash 列（图片感知哈希）；历史图片由 backfill_image_hashes 任务补算"""
+    if "phash" not in _columns(conn, "assets"):
+        conn.execute(text("ALTER TABLE assets ADD COLUMN phash INTEGER"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_assets_phash ON assets (phash)"))
+
+
+def _usage_upsert(owner_type: str, owner_id: str, bytes_expr: str, files_expr: str, where: str) -> str:
+    return (
+        f"INSERT INTO storage_usage (owner_type, owner_id, bytes, files) "
+        f"SELECT '{owner_type}', {owner_id}, {bytes_expr}, {files_expr} WHERE {where} "
+        "ON CONFLICT (owner_type, owner_id) DO UPDATE SET bytes = bytes + excluded.bytes, files = files + excluded.files;"
+    )
+
+
+def _asset_usage(row: str, sign: str) -> str:
+    """一个素材对所在场（镜头素材）或资产条目的贡献"""
+    size = f"{sign}IFNULL({row}.file_size, 0)"
+    return (
+        _usage_upsert(
+            "scene", f"(SELECT scene_id FROM shots WHERE id = {row}.shot_id)", size, f"{sign}1",
+            f"{row}.file_path IS NOT NULL AND (SELECT scene_id FROM shots WHERE id = {row}.shot_id) IS NOT NULL",
+        )
+        + _usage_upsert(
+            "asset_item", f"{row}.character_id", size, f"{sign}1",
+            f"{row}.file_path IS NOT NULL AND {row}.shot_id IS NULL AND {row}.character_id IS NOT NULL",
+        )
+    )
+
+
+def _shot_usage(row: str, sign: str) -> str:
+    """一个镜头（视频 + 名下素材）对所在场的贡献"""
+    assets = f"FROM assets WHERE shot_id = {row}.id AND file_path IS NOT NULL"
+    size = (
+        f"{sign}((SELECT IFNULL(SUM(IFNULL(file_size, 0)), 0) {assets}) "
+        f"+ CASE WHEN {row}.video_path IS NOT NULL THEN IFNULL({row}.video_size, 0) ELSE 0 END)"
+    )
+    files = f"{sign}((SELECT COUNT(*) {assets}) + ({row}.video_path IS NOT NULL))"
+    return _usage_upsert("scene", f"{row}.scene_id", size, files, f"{row}.scene_id IS NOT NULL")
+
+
+STORAGE_USAGE_TRIGGERS = {
+    "storage_usage_asset_ai": f"AFTER INSERT ON assets BEGIN {_asset_usage('new', '')} END",
+    "storage_usage_asset_ad": f"AFTER DELETE ON assets BEGIN {_asset_usage('old', '-')} END",
+    "storage_usage_asset_au": (
+        "AFTER UPDATE OF file_path, file_size, shot_id, character_id ON assets "
+        f"BEGIN {_asset_usage('old', '-')} {_asset_usage('new', '')} END"
+    ),
+    "storage_usage_shot_ai": f"AFTER INSERT ON shots BEGIN {_shot_usage('new', '')} END",
+    "storage_usage_shot_ad": f"AFTER DELETE ON shots BEGIN {_shot_usage('old', '-')} END",
+    # 换场（移动镜头）或换视频：整个镜头从旧场减掉、加到新场（只换视频时素材部分正负抵消）
+    "storage_usage_shot_au": (
+        "AFTER UPDATE OF scene_id, video_path, video_size ON shots "
+        f"BEGIN {_shot_usage('old', '-')} {_shot_usage('new', '')} END"
+    ),
+    "storage_usage_scene_ad": "AFTER DELETE ON scenes BEGIN DELETE FROM storage_usage WHERE owner_type = 'scene' AND owner_id = old.id; END",
+    "storage_usage_character_ad": (
+        "AFTER DELETE ON characters BEGIN DELETE FROM storage_usage WHERE owner_type = 'asset_item' AND owner_id = old.id; END"
+    ),
+}
+
+
+def rebuild_storage_usage(conn):
+    """按 file_size / video_size 列整体重算 storage_usage（迁移和修复任务共用）"""
+    conn.execute(text("DELETE FROM storage_usage"))
+    conn.execute(text(
+        "INSERT INTO storage_usage (owner_type, owner_id, bytes, files) "
+        "SELECT 'scene', scene_id, SUM(bytes), SUM(files) FROM ("
+        "  SELECT sh.scene_id AS scene_id, IFNULL(a.file_size, 0) AS bytes, 1 AS files "
+        "  FROM assets a JOIN shots sh ON sh.id = a.shot_id WHERE a.file_path IS NOT NULL"
+        "  UNION ALL"
+        "  SELECT scene_id, IFNULL(video_size, 0), 1 FROM shots WHERE video_path IS NOT NULL"
+        ") WHERE scene_id IS NOT NULL GROUP BY scene_id"
+    ))
+    conn.execute(text(
+        "INSERT INTO storage_usage (owner_type, owner_id, bytes, files) "
+        "SELECT 'asset_item', character_id, SUM(IFNULL(file_size, 0)), COUNT(*) FROM assets "
+        "WHERE shot_id IS NULL AND character_id IS NOT NULL AND file_path IS NOT NULL GROUP BY character_id"
+    ))
+
+
+def m010_storage_usage(conn):
+    """
+    assets.file_size / shots.video_size 两列 + storage_usage 触发器（表由 create_all 建）
+    blob 素材的大小直接从 blobs 表补；历史文件和视频的大小要读盘，交给 rebuild_storage_usage 任务（m012 登记）
+    """
+    if "file_size" not in _columns(conn, "assets"):
+        conn.execute(text("ALTER TABLE assets ADD COLUMN file_size INTEGER"))
+    if "video_size" not in _columns(conn, "shots"):
+        conn.execute(text("ALTER TABLE shots ADD COLUMN video_size INTEGER"))
+    conn.execute(text(
+        "UPDATE assets SET file_size = (SELECT size FROM blobs WHERE blobs.sha256 = assets.blob_sha256) "
+        "WHERE file_size IS NULL AND blob_sha256 IS NOT NULL"
+    ))
+    for name, body in STORAGE_USAGE_TRIGGERS.items():
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {body}"))
+    rebuild_storage_usage(conn)
+
+
+def m011_index_prompts(conn):
+    """近似去重的签名改由后台任务补算：给已有带提示词素材的项目各登记一个 index_prompts 任务"""
+    conn.execute(text(
+        "INSERT INTO jobs (kind, payload, status, attempts, max_attempts) "
+        "SELECT 'index_prompts', json_object('project_id', p.id), 'pending', 0, 3 FROM projects p "
+        "WHERE EXISTS ("
+        "SELECT 1 FROM assets a "
+        "LEFT JOIN shots sh ON sh.id = a.shot_id LEFT JOIN scenes s ON s.id = sh.scene_id "
+        "LEFT JOIN episodes e ON e.id = s.episode_id LEFT JOIN characters c ON c.id = a.character_id "
+        "WHERE json_type(a.meta_data, '$.prompt') = 'text' AND (e.project_id = p.id OR c.project_id = p.id) "
+        "AND NOT EXISTS (SELECT 1 FROM asset_minhash m WHERE m.asset_id = a.id))"
+    ))
+
+
+def m012_rebuild_storage_usage(conn):
+    """m010 之前上传的非 blob 文件、视频没有大小，统计里一直按 0 算：登记一次 rebuild_storage_usage 任务读盘补齐"""
+    conn.execute(text(
+        "INSERT INTO jobs (kind, payload, status, attempts, max_attempts) "
+        "SELECT 'rebuild_storage_usage', json_object(), 'pending', 0, 3 "
+        "WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = 'rebuild_storage_usage' AND status IN ('pending', 'running')) "
+        "AND (EXISTS (SELECT 1 FROM assets WHERE file_path IS NOT NULL AND file_size IS NULL) "
+        "OR EXISTS (SELECT 1 FROM shots WHERE video_path IS NOT NULL AND video_size IS NULL))"
+    ))
+
+
+MIGRATIONS = [
+    (1, "characters_category", m001_characters_category),
+    (2, "assets_blob_columns", m002_assets_blob_columns),
+    (3, "projects_revision", m003_projects_revision),
+    (4, "fk_lookup_indexes", m004_fk_lookup_indexes),
+    (5, "event_nodes_unique_target", m005_event_nodes_unique_target),
+    (6, "sort_keys", m006_sort_keys),
+    (7, "search_index", m007_search_index),
+    (8, "asset_minhash_triggers", m008_asset_minhash_triggers),
+    (9, "assets_phash", m009_assets_phash),
+    (10, "storage_usage", m010_storage_usage),
+    (11, "index_prompts", m011_index_prompts),
+    (12, "rebuild_storage_usage", m012_rebuild_storage_usage),
+]
+
+
+def current_version(conn) -> int:
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def run_migrations(engine) -> int:
+    """按版本号补跑未执行的迁移，返回当前 schema 版本"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+            "applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                migrate(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {"version": version, "name": name},
+                )
+            print(f"[Migration] applied {version:03d}_{name}")
+        except Exception as e:
+            # 不阻断服务启动，但后面的迁移可能依赖这一步，先停下
+            print(f"[Migration][Error] {version:03d}_{name} failed: {e}")
+            break
+
+    with engine.connect() as conn:
+        return current_version(conn)
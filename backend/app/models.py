@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, Float, String, Text, ForeignKey, DateTime, Boolean, JSON, Enum, Index, LargeBinary
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, relationship
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import func
 from .database import Base 
 
@@ -12,15 +14,17 @@ class Project(Base):
     name = Column(String, index=True)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # 单调递增的修订号：集/场/镜/素材/事件 任一写入都会 +1（见 revisions.py）
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
     
     characters = relationship("Character", back_populates="project", cascade="all, delete-orphan")
-    episodes = relationship("Episode", back_populates="project", cascade="all, delete-orphan")
+    episodes = relationship("Episode", back_populates="project", cascade="all, delete-orphan", order_by="[Episode.sort_key, Episode.id]")
     events = relationship("Event", back_populates="project", cascade="all, delete-orphan")
 
 class Character(Base):
     __tablename__ = "characters"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     name = Column(String, index=True)
     description = Column(Text)
     base_prompt = Column(Text)
@@ -29,7 +33,7 @@ class Character(Base):
     # 说明：对外 API 不再暴露“角色”概念，但为兼容旧数据与关系，这里保留表名与模型名。
     # 默认分类：角色（视觉）
     category = Column(String, nullable=False, default="persona_visual")
-    avatar_asset_id = Column(Integer, ForeignKey("assets.id"), nullable=True)
+    avatar_asset_id = Column(Integer, ForeignKey("assets.id"), nullable=True, index=True)
     project = relationship("Project", back_populates="characters")
     assets = relationship("Asset", back_populates="character", cascade="all, delete-orphan", foreign_keys="Asset.character_id")
 
@@ -40,39 +44,46 @@ class Character(Base):
 
 class Episode(Base):
     __tablename__ = "episodes"
+    __table_args__ = (Index("ix_episodes_project_id_sort_key", "project_id", "sort_key"),)
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     title = Column(String) # 例如 "第一集：初入青云"
-    order = Column(Integer, default=0) # 排序用
+    order = Column(Integer, default=0) # 显示用集号
+    sort_key = Column(Float) # 排序键（稀疏/分数），见 ordering.py
     
     project = relationship("Project", back_populates="episodes")
-    scenes = relationship("Scene", back_populates="episode", cascade="all, delete-orphan")
+    scenes = relationship("Scene", back_populates="episode", cascade="all, delete-orphan", order_by="[Scene.sort_key, Scene.id]")
 
 class Scene(Base):
     __tablename__ = "scenes"
+    __table_args__ = (Index("ix_scenes_episode_id_sort_key", "episode_id", "sort_key"),)
     id = Column(Integer, primary_key=True, index=True)
     # 【重大变更】Scene 现在属于 Episode，而不是直接属于 Project
-    episode_id = Column(Integer, ForeignKey("episodes.id")) 
-    sequence_number = Column(Integer) 
+    episode_id = Column(Integer, ForeignKey("episodes.id"), index=True)
+    sequence_number = Column(Integer) # 显示用场号
+    sort_key = Column(Float) # 排序键
     title = Column(String) 
     
     episode = relationship("Episode", back_populates="scenes")
-    shots = relationship("Shot", back_populates="scene", cascade="all, delete-orphan")
+    shots = relationship("Shot", back_populates="scene", cascade="all, delete-orphan", order_by="[Shot.sort_key, Shot.id]")
 
 class Shot(Base):
     __tablename__ = "shots"
+    __table_args__ = (Index("ix_shots_scene_id_sort_key", "scene_id", "sort_key"),)
     id = Column(Integer, primary_key=True, index=True)
-    scene_id = Column(Integer, ForeignKey("scenes.id"))
-    sequence_number = Column(Integer) 
+    scene_id = Column(Integer, ForeignKey("scenes.id"), index=True)
+    sequence_number = Column(Integer) # 显示用镜头号
+    sort_key = Column(Float) # 排序键
     title = Column(String, nullable=True)
     
     action_text = Column(Text) 
     dialogue = Column(Text, nullable=True) 
     prompt = Column(Text) 
     negative_prompt = Column(Text, nullable=True)
-    selected_asset_id = Column(Integer, ForeignKey("assets.id"), nullable=True)
+    selected_asset_id = Column(Integer, ForeignKey("assets.id"), nullable=True, index=True)
     status = Column(String, default="draft") 
     video_path = Column(String, nullable=True)
+    video_size = Column(Integer, nullable=True)  # 字节数，存储统计用（见 storage_usage.py）
     
     scene = relationship("Scene", back_populates="shots")
     assets = relationship("Asset", back_populates="shot", foreign_keys="Asset.shot_id")
@@ -80,16 +91,31 @@ class Shot(Base):
 class Asset(Base):
     __tablename__ = "assets"
     id = Column(Integer, primary_key=True, index=True)
-    character_id = Column(Integer, ForeignKey("characters.id"), nullable=True)
-    shot_id = Column(Integer, ForeignKey("shots.id"), nullable=True) 
+    character_id = Column(Integer, ForeignKey("characters.id"), nullable=True, index=True)
+    shot_id = Column(Integer, ForeignKey("shots.id"), nullable=True, index=True)
     file_path = Column(String) 
     file_type = Column(String) 
     meta_data = Column(JSON, nullable=True) 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     is_favorite = Column(Boolean, default=False) 
+    # 内容寻址存储：file_path 指向 _blobs/ 下的文件，原始文件名单独保存
+    blob_sha256 = Column(String, ForeignKey("blobs.sha256"), nullable=True, index=True)
+    original_filename = Column(String, nullable=True)
+    phash = Column(Integer, nullable=True, index=True)  # 图片 dHash（有符号 64 位，见 utils/image_hash.py）
+    file_size = Column(Integer, nullable=True)  # 字节数，存储统计用（blob 共用时每个引用都计一次）
     
     shot = relationship("Shot", back_populates="assets", foreign_keys=[shot_id])
     character = relationship("Character", back_populates="assets", foreign_keys=[character_id])
+    # 只用于让同一次 flush 里先删 Asset 再删 Blob（外键约束开启时顺序反了会报错）
+    blob = relationship("Blob", foreign_keys=[blob_sha256])
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    sha256 = Column(String, primary_key=True)
+    file_path = Column(String)  # 相对 data/ 的路径：_blobs/ab/cd/<sha256><ext>
+    size = Column(Integer)
+    ref_count = Column(Integer, default=0)  # 引用它的 Asset 数；归零后由 file_gc 清扫任务删行删文件
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 # =======================
 # 3. 事件逻辑层 (The Overlay)
@@ -98,7 +124,7 @@ class Asset(Base):
 class Event(Base):
     __tablename__ = "events"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True)
     
     name = Column(String, index=True)   # 事件名，如 "张小凡黑化"
     color = Column(String, default="#3B82F6") # 显示颜色，默认蓝色
@@ -111,6 +137,10 @@ class Event(Base):
 
 class EventNode(Base):
     __tablename__ = "event_nodes"
+    # 同一事件在同一目标上只有一个节点，upsert_event_node 靠它查找/兜底
+    __table_args__ = (
+        Index("ux_event_nodes_target", "event_id", "target_type", "target_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     event_id = Column(Integer, ForeignKey("events.id"))
     
@@ -121,4 +151,148 @@ class EventNode(Base):
     
     description = Column(Text) # 该粒度下的描述
     
-    event = relationship("Event", back_populates="nodes")
\ No newline at end of file
+    event = relationship("Event", back_populates="nodes")
+# =======================
+# 4. 分片上传会话 (断点续传)
+# =======================
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id = Column(String, primary_key=True, index=True)  # uuid
+    # 上传完成后挂到哪里："shot_video" / "shot_asset" / "asset_item"
+    target_type = Column(String)
+    target_id = Column(Integer)
+
+    filename = Column(String)
+    content_type = Column(String, nullable=True)
+    total_size = Column(Integer)
+    chunk_size = Column(Integer)
+    received_chunks = Column(Integer, default=0)  # 已确认的连续分片数（下一个应传的分片号）
+    received_bytes = Column(Integer, default=0)
+    sha256 = Column(String, nullable=True)  # 完成后写入最终摘要
+    status = Column(String, default="uploading")  # uploading / completed
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# =======================
+# 5. 后台任务队列 (持久化，重启后继续)
+# =======================
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True)  # 任务类型，如 "extract_metadata"
+    payload = Column(JSON, nullable=True)
+    status = Column(String, default="pending", index=True)  # pending / running / done / failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
+    run_after = Column(DateTime(timezone=True), nullable=True)  # 重试退避：此时间之前不执行
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# =======================
+# 6. 变更日志 (增量同步)
+# =======================
+
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_project_revision", "project_id", "revision"),  # changes_since 按 (项目, 修订号) 范围扫
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, index=True)
+    revision = Column(Integer, index=True)  # 该变更所属的项目修订号
+    table_name = Column(String)  # "episodes" / "scenes" / "shots" / "assets" / "events" / "event_nodes" / "characters"
+    row_id = Column(Integer)
+    op = Column(String)  # "upsert" / "delete"
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# =======================
+# 7. 提示词近似去重 (MinHash / LSH)
+# =======================
+# 都是可重建的派生数据：素材的 meta_data / 归属变化或删除时由触发器清掉（见 migrations.m008），由后台任务 index_prompts 补算
+
+class AssetMinHash(Base):
+    __tablename__ = "asset_minhash"
+    asset_id = Column(Integer, ForeignKey("assets.id"), primary_key=True)
+    project_id = Column(Integer, index=True)
+    signature = Column(LargeBinary)  # NUM_PERM 个 uint32（见 utils/near_dup.py）
+
+class AssetLshBucket(Base):
+    __tablename__ = "asset_lsh_buckets"
+    __table_args__ = (
+        Index("ix_asset_lsh_buckets_lookup", "project_id", "band", "bucket"),  # 同桶查找 / 按项目分组
+    )
+    asset_id = Column(Integer, ForeignKey("assets.id"), primary_key=True)
+    band = Column(Integer, primary_key=True)
+    bucket = Column(Integer)  # 该 band 的签名片段哈希（有符号 64 位）
+    project_id = Column(Integer)
+
+
+# =======================
+# 8. 文件墓碑 (延迟删除)
+# =======================
+# 删除接口只在自己的事务里登记要删的文件，后台清扫任务分批真正删除（见 file_gc.py）
+
+class FileTombstone(Base):
+    __tablename__ = "file_tombstones"
+    id = Column(Integer, primary_key=True, index=True)
+    file_path = Column(String, nullable=True)  # 相对 data/ 的文件或目录
+    blob_sha256 = Column(String, nullable=True)  # blob 引用释放：清扫时 ref_count 仍为 0 才删
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# =======================
+# 9. 存储统计 (触发器维护)
+# =======================
+# 叶子级汇总：镜头素材 + 视频按所在场，资产条目素材按条目；集 / 项目 / 分类在查询时由叶子聚合
+# 素材、镜头的增删改由 SQLite 触发器在同一事务里更新（见 migrations.m010），Core 批量写入也不会漏
+
+class StorageUsage(Base):
+    __tablename__ = "storage_usage"
+    owner_type = Column(String, primary_key=True)  # "scene" / "asset_item"
+    owner_id = Column(Integer, primary_key=True)
+    bytes = Column(Integer, nullable=False, default=0)
+    files = Column(Integer, nullable=False, default=0)
+
+
+# =======================
+# 外键引用清理
+# =======================
+
+# 删除 Asset 前把指向它的 selected_asset_id / avatar_asset_id 置空
+# 这两列建表时没有 ON DELETE SET NULL，开启 foreign_keys 后不清理会删除失败
+ASSET_REFERENCES = ((Shot, "selected_asset_id"), (Character, "avatar_asset_id"))
+
+
+@event.listens_for(Session, "before_flush")
+def _clear_asset_references(session, flush_context, instances):
+    asset_ids = [obj.id for obj in session.deleted if isinstance(obj, Asset) and obj.id is not None]
+    if not asset_ids:
+        return
+    from . import revisions  # 避免循环导入
+    conn = session.connection()
+    for model, column in ASSET_REFERENCES:
+        row_ids = conn.execute(
+            update(model.__table__)
+            .where(getattr(model.__table__.c, column).in_(asset_ids))
+            .values({column: None})
+            .returning(model.__table__.c.id)
+        ).scalars().all()
+        # Core UPDATE 不经过 ORM 事件，被置空的行按项目手动记修订号
+        table_name = revisions.TRACKED_MODELS[model]
+        by_project = {}
+        for row_id in row_ids:
+            by_project.setdefault(revisions.project_id_for(conn, table_name, row_id), []).append(row_id)
+        for project_id, ids in by_project.items():
+            if project_id is not None:
+                revisions.record_changes(session, project_id, table_name, ids)
+        # 会话里已加载的对象同步成新值，避免后续 flush 又写回旧 id
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, model) and getattr(obj, column) in asset_ids:
+                set_committed_value(obj, column, None)
@@ -0,0 +1,171 @@
+# backend/app/ordering.py
+# 集/场/镜头的排序键：sort_key 是稀疏的浮点数，初始间隔 SORT_KEY_STEP
+# - 新建追加到末尾：同父级 MAX(sort_key) + STEP（走 (父级, sort_key) 索引）
+# - 插入/移动：取相邻两行的中点，只改被移动的那一行
+# - 间隔小于 REBALANCE_GAP 时登记后台任务把该父级重新拉开；中点已经分不开（浮点精度用尽）时当场重排
+from collections import defaultdict
+from sqlalchemy import bindparam, event, func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from . import jobs, models, revisions
+
+SORT_KEY_STEP = 1024.0
+REBALANCE_GAP = 1e-3  # 约 20 次对半插入后触发
+
+# 实体 -> (模型, 父级外键列名, 父级关系名, change_log 表名, 父级所在表)
+ORDERED = {
+    "episode": (models.Episode, "project_id", "project", "episodes", None),
+    "scene": (models.Scene, "episode_id", "episode", "scenes", "episodes"),
+    "shot": (models.Shot, "scene_id", "scene", "shots", "scenes"),
+}
+ENTITY_BY_MODEL = {spec[0]: entity for entity, spec in ORDERED.items()}
+
+
+class OrderingError(ValueError):
+    pass
+
+
+def _max_key(db: Session, entity: str, parent_id: int):
+    model, parent_col, *_ = ORDERED[entity]
+    return db.execute(
+        select(func.max(model.sort_key)).where(getattr(model, parent_col) == parent_id)
+    ).scalar()
+
+
+def append_key(db: Session, entity: str, parent_id: int) -> float:
+    last = _max_key(db, entity, parent_id)
+    return (last or 0.0) + SORT_KEY_STEP
+
+
+def key_between(lo, hi) -> float:
+    if lo is None and hi is None:
+        return SORT_KEY_STEP
+    if lo is None:
+        return hi - SORT_KEY_STEP
+    if hi is None:
+        return lo + SORT_KEY_STEP
+    return (lo + hi) / 2
+
+
+def _neighbors(db: Session, entity: str, parent_id: int, obj, before_id, after_id):
+    """返回新位置两侧的排序键 (lo, hi)；被移动的行自己不算邻居"""
+    model, parent_col, *_ = ORDERED[entity]
+    siblings = select(model.sort_key).where(getattr(model, parent_col) == parent_id, model.id != obj.id)
+
+    def anchor(anchor_id):
+        row = db.execute(
+            select(model.sort_key, getattr(model, parent_col)).where(model.id == anchor_id)
+        ).first()
+        if row is None or row[1] != parent_id or anchor_id == obj.id:
+            raise OrderingError(f"{entity} {anchor_id} is not a sibling in the target {ORDERED[entity][2]}")
+        return row[0]
+
+    if after_id is not None:
+        lo = anchor(after_id)
+        hi = db.execute(siblings.where(model.sort_key > lo).order_by(model.sort_key).limit(1)).scalar()
+        return lo, hi
+    if before_id is not None:
+        hi = anchor(before_id)
+        lo = db.execute(siblings.where(model.sort_key < hi).order_by(model.sort_key.desc()).limit(1)).scalar()
+        return lo, hi
+    return db.execute(siblings.with_only_columns(func.max(model.sort_key))).scalar(), None
+
+
+def place(db: Session, entity: str, obj, parent_id: int, before_id: int = None, after_id: int = None) -> float:
+    """
+    把 obj 放到 parent_id 下 before_id 之前 / after_id 之后（都不给就放末尾）
+    只改 obj 一行（父级外键 + sort_key），不提交
+    """
+    parent_col = ORDERED[entity][1]
+    lo, hi = _neighbors(db, entity, parent_id, obj, before_id, after_id)
+    key = key_between(lo, hi)
+    if (lo is not None and key <= lo) or (hi is not None and key >= hi):
+        # 两个相邻键已经挤在一起：先重排这个父级再算一次
+        rebalance(db, entity, parent_id)
+        lo, hi = _neighbors(db, entity, parent_id, obj, before_id, after_id)
+        key = key_between(lo, hi)
+    elif lo is not None and hi is not None and hi - lo < REBALANCE_GAP:
+        enqueue_rebalance(db, entity, parent_id)
+    setattr(obj, parent_col, parent_id)
+    obj.sort_key = key
+    return key
+
+
+def sibling_ids(db: Session, entity: str, parent_id: int) -> list:
+    """父级下的行 id，按当前排序"""
+    model, parent_col, *_ = ORDERED[entity]
+    return list(db.execute(
+        select(model.id).where(getattr(model, parent_col) == parent_id).order_by(model.sort_key, model.id)
+    ).scalars())
+
+
+def rebalance(db: Session, entity: str, parent_id: int) -> int:
+    """按当前顺序把该父级下的行重新拉开成 STEP 间隔（一条 executemany），并记变更日志"""
+    return renumber(db, entity, parent_id, sibling_ids(db, entity, parent_id))
+
+
+def renumber(db: Session, entity: str, parent_id: int, ids: list) -> int:
+    """按 ids 给出的顺序把该父级下的行排成 STEP 间隔，并记变更日志"""
+    model, parent_col, _, table_name, parent_table = ORDERED[entity]
+    if not ids:
+        return 0
+    keys = {row_id: (i + 1) * SORT_KEY_STEP for i, row_id in enumerate(ids)}
+    table = model.__table__
+    db.execute(
+        update(table).where(table.c.id == bindparam("_id")).values(sort_key=bindparam("_key")),
+        [{"_id": row_id, "_key": key} for row_id, key in keys.items()],
+    )
+    # 会话里已加载的行同步成新键，避免后续 flush 把旧键写回
+    for row_id, key in keys.items():
+        loaded = db.identity_map.get(identity_key(model, row_id))
+        if loaded is not None:
+            set_committed_value(loaded, "sort_key", key)
+    project_id = parent_id if parent_table is None else revisions.project_id_for(db.connection(), parent_table, parent_id)
+    revisions.record_changes(db, project_id, table_name, ids)
+    return len(ids)
+
+
+def enqueue_rebalance(db: Session, entity: str, parent_id: int):
+    """同一父级已经有排队中的重排任务就不再登记"""
+    payload = {"entity": entity, "parent_id": parent_id}
+    pending = db.execute(
+        select(models.Job.payload).where(models.Job.kind == "rebalance_sort_keys", models.Job.status == "pending")
+    ).scalars()
+    if any(existing == payload for existing in pending):
+        return None
+    return jobs.enqueue(db, "rebalance_sort_keys", payload)
+
+
+@jobs.job_handler("rebalance_sort_keys")
+def handle_rebalance_sort_keys(db: Session, payload: dict):
+    entity = payload["entity"]
+    if entity not in ORDERED:
+        raise ValueError(f"Unknown entity '{entity}'")
+    return {"entity": entity, "parent_id": payload["parent_id"], "rows": rebalance(db, entity, payload["parent_id"])}
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_sort_keys(session, flush_context, instances):
+    """新建行没给 sort_key 时追加到父级末尾；同一次 flush 里同父级的多行依次往后排"""
+    pending = defaultdict(list)
+    for obj in session.new:
+        entity = ENTITY_BY_MODEL.get(type(obj))
+        if entity is None or obj.sort_key is not None:
+            continue
+        _, parent_col, parent_rel, *_ = ORDERED[entity]
+        parent_id = getattr(obj, parent_col)
+        parent = None if parent_id is not None else getattr(obj, parent_rel)
+        if parent_id is None and parent is not None and parent.id is not None:
+            parent_id = parent.id
+        pending[(entity, parent_id if parent_id is not None else id(parent))].append((obj, parent_id))
+    if not pending:
+        return
+    with session.no_autoflush:
+        for (entity, _), rows in pending.items():
+            parent_id = rows[0][1]
+            last = _max_key(session, entity, parent_id) if parent_id is not None else None
+            for obj, _ in rows:
+                last = (last or 0.0) + SORT_KEY_STEP
+                obj.sort_key = last
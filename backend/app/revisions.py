@@ -0,0 +1,198 @@
+# backend/app/revisions.py
+# 项目修订号 + 变更日志：前端凭 revision 做 ETag/304，凭 change_log 做增量同步
+# - ORM 写入通过 Session 事件自动记录（一次 flush 内同一项目只 +1）
+# - 绕过 ORM 的 Core 批量语句需要手动调用 record_changes()
+from collections import defaultdict
+from fastapi import Request, Response
+from sqlalchemy import event, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .utils.response_cache import response_cache
+
+# 模型 -> change_log.table_name
+TRACKED_MODELS = {
+    models.Episode: "episodes",
+    models.Scene: "scenes",
+    models.Shot: "shots",
+    models.Asset: "assets",
+    models.Character: "characters",
+    models.Event: "events",
+    models.EventNode: "event_nodes",
+}
+MODELS_BY_TABLE = {name: model for model, name in TRACKED_MODELS.items()}
+
+# 行 -> 所属项目（直接查库，不走 ORM，避免在 flush 事件里触发 autoflush）
+PROJECT_LOOKUP_SQL = {
+    "episodes": "SELECT project_id FROM episodes WHERE id = :id",
+    "scenes": "SELECT e.project_id FROM scenes s JOIN episodes e ON e.id = s.episode_id WHERE s.id = :id",
+    "shots": (
+        "SELECT e.project_id FROM shots sh JOIN scenes s ON s.id = sh.scene_id "
+        "JOIN episodes e ON e.id = s.episode_id WHERE sh.id = :id"
+    ),
+    "characters": "SELECT project_id FROM characters WHERE id = :id",
+    "events": "SELECT project_id FROM events WHERE id = :id",
+}
+
+
+def project_id_for(conn, table_name: str, row_id):
+    """按父表链路查出 project_id；查不到返回 None"""
+    if row_id is None:
+        return None
+    return conn.execute(text(PROJECT_LOOKUP_SQL[table_name]), {"id": row_id}).scalar()
+
+
+def _resolve_project(conn, obj, cache: dict):
+    if isinstance(obj, (models.Episode, models.Character, models.Event)):
+        return obj.project_id
+    if isinstance(obj, models.Scene):
+        parent = ("episodes", obj.episode_id)
+    elif isinstance(obj, models.Shot):
+        parent = ("scenes", obj.scene_id)
+    elif isinstance(obj, models.EventNode):
+        parent = ("events", obj.event_id)
+    elif obj.shot_id is not None:  # Asset
+        parent = ("shots", obj.shot_id)
+    else:
+        parent = ("characters", obj.character_id)
+    if parent not in cache:
+        cache[parent] = project_id_for(conn, *parent)
+    return cache[parent]
+
+
+def _bump(conn, project_id: int) -> int:
+    return conn.execute(
+        update(models.Project.__table__)
+        .where(models.Project.__table__.c.id == project_id)
+        .values(revision=models.Project.__table__.c.revision + 1)
+        .returning(models.Project.__table__.c.revision)
+    ).scalar()
+
+
+def _write(session: Session, changes_by_project: dict):
+    """changes_by_project: {project_id: {(table_name, row_id): op}}"""
+    conn = session.connection()
+    touched = session.info.setdefault("revision_touched", {})
+    for project_id, changes in changes_by_project.items():
+        if project_id is None or not changes:
+            continue
+        revision = _bump(conn, project_id)
+        if revision is None:  # 项目本身已被删除
+            continue
+        conn.execute(insert(models.ChangeLog.__table__), [
+            {"project_id": project_id, "revision": revision, "table_name": table_name, "row_id": row_id, "op": op}
+            for (table_name, row_id), op in changes.items()
+        ])
+        touched.setdefault(project_id, set()).update(table_name for table_name, _ in changes)
+
+
+def record_changes(session: Session, project_id: int, table_name: str, row_ids, op: str = "upsert"):
+    """给绕过 ORM 的 Core 批量写入用：在调用方事务里 +1 修订号并记日志"""
+    row_ids = list(row_ids)
+    if not row_ids:
+        return
+    _write(session, {project_id: {(table_name, row_id): op for row_id in row_ids}})
+
+
+async def current_revision(db: AsyncSession, project_id: int):
+    return (await db.execute(
+        select(models.Project.revision).where(models.Project.id == project_id)
+    )).scalar()
+
+
+def project_etag(project_id: int, revision: int) -> str:
+    return f'W/"p{project_id}-r{revision}"'
+
+
+async def check_not_modified(request: Request, response: Response, db: AsyncSession, project_id: int):
+    """
+    项目级 GET 的条件请求：If-None-Match 命中当前修订号时返回 304 响应，否则返回 None 并带上 ETag
+    Cache-Control: no-cache 让浏览器每次都带 ETag 回来验证
+    """
+    revision = await current_revision(db, project_id)
+    if revision is None:
+        return None
+    etag = project_etag(project_id, revision)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    response.headers.update(headers)
+    candidates = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if "*" in candidates or etag.removeprefix("W/") in candidates:
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def changes_since(db: Session, project_id: int, since: int) -> dict:
+    """返回 since 之后新增/修改的完整行与被删除的 id（同一行多次变更只取最后一次；同步，异步路由经 run_sync 调用）"""
+    latest = {}
+    rows = db.execute(
+        select(models.ChangeLog.table_name, models.ChangeLog.row_id, models.ChangeLog.op)
+        .where(models.ChangeLog.project_id == project_id, models.ChangeLog.revision > since)
+        .order_by(models.ChangeLog.id)
+    )
+    for table_name, row_id, op in rows:
+        latest[(table_name, row_id)] = op
+
+    upsert_ids = defaultdict(list)
+    deleted = defaultdict(list)
+    for (table_name, row_id), op in latest.items():
+        (deleted if op == "delete" else upsert_ids)[table_name].append(row_id)
+
+    upserted = {}
+    for table_name, ids in upsert_ids.items():
+        model = MODELS_BY_TABLE[table_name]
+        columns = [attr.key for attr in model.__mapper__.column_attrs]
+        table = model.__table__
+        found = db.execute(select(table).where(table.c.id.in_(ids)).order_by(table.c.id)).mappings().all()
+        # 期间又被删掉的行查不到，当作删除处理
+        missing = set(ids) - {row["id"] for row in found}
+        if missing:
+            deleted[table_name].extend(sorted(missing))
+        upserted[table_name] = [{key: row[key] for key in columns if key in row} for row in found]
+    return {"upserted": upserted, "deleted": dict(deleted)}
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changes(session, flush_context, instances):
+    # 删除/修改在 flush 前解析项目（删除后父链路就查不到了）；新建行要等 flush 后才有 id
+    pending = defaultdict(dict)
+    cache = {}
+    conn = None
+    with session.no_autoflush:
+        for obj in list(session.dirty) + list(session.deleted):
+            table_name = TRACKED_MODELS.get(type(obj))
+            if table_name is None:
+                continue
+            if obj not in session.deleted and not session.is_modified(obj, include_collections=False):
+                continue
+            conn = conn or session.connection()
+            op = "delete" if obj in session.deleted else "upsert"
+            pending[_resolve_project(conn, obj, cache)][(table_name, obj.id)] = op
+    session.info["revision_pending"] = pending
+    session.info["revision_new"] = [obj for obj in session.new if type(obj) in TRACKED_MODELS]
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, flush_context):
+    pending = session.info.pop("revision_pending", None) or defaultdict(dict)
+    new_objects = session.info.pop("revision_new", None) or []
+    if new_objects:
+        conn = session.connection()
+        cache = {}
+        for obj in new_objects:
+            pending[_resolve_project(conn, obj, cache)][(TRACKED_MODELS[type(obj)], obj.id)] = "upsert"
+    if pending:
+        _write(session, pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_changes(session):
+    session.info.pop("revision_touched", None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_touched(session):
+    # 提交成功后才让响应缓存失效；回滚的写入不影响缓存
+    touched = session.info.pop("revision_touched", None) or {}
+    for project_id, tables in touched.items():
+        response_cache.invalidate_tables(project_id, tables)
@@ -1,10 +1,15 @@
 import os
 import shutil
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from .. import models, schemas
-from ..database import get_db
-from ..utils.metadata_parser import extract_metadata
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, UploadFile, File
+from PIL import Image
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from .. import file_gc, jobs, models, schemas, storage_usage
+from ..database import get_db, get_read_db
+from ..utils import blob_store, bulk_ingest, file_serving, image_hash, near_dup
 from ..models import Project, Character, Asset, Shot
 
 router = APIRouter(
@@ -12,11 +17,11 @@ router = APIRouter(
     tags=["Assets (资源管理)"]
 )
 
-# 配置根存储目录
-DATA_ROOT = os.path.join(os.getcwd(), "data")
+# 配置根存储目录（与 blob_store 共用一个定义）
+DATA_ROOT = blob_store.DATA_ROOT
 
-def get_project_name(db: Session, project_id: int):
-    project = db.query(models.Project).filter(models.Project.id == project_id).first()
+async def get_project_name(db: AsyncSession, project_id: int):
+    project = await db.get(models.Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     return project.name
@@ -38,6 +43,50 @@ def determine_file_type(content_type: str, filename: str) -> str:
     
     return "other"
 
+# 资产条目分类 -> 落盘目录（固定枚举）
+CATEGORY_FOLDER_MAP = {
+    "persona_visual": "characters",
+    "persona_voice": "voices",
+    "background": "backgrounds",
+    "element": "elements",
+    "prop": "props",
+    "pose": "poses",
+    "vfx": "vfx",
+    "layout": "layout",
+    "audio_music": "audio_music",
+    "audio_sfx": "audio_sfx",
+    "branding": "branding",
+    "ai_preset": "ai_preset",
+}
+
+def asset_item_folder(item: models.Character) -> str:
+    """按分类决定落盘目录（兼容历史 persona -> persona_visual）"""
+    category = (item.category or "persona_visual").lower()
+    if category == "persona":
+        category = "persona_visual"
+    return CATEGORY_FOLDER_MAP.get(category, category)
+
+async def get_shot_hierarchy(db: AsyncSession, shot: models.Shot):
+    """Shot -> Scene -> Episode -> Project，返回 (project_name, 层级目录)"""
+    scene = await db.get(models.Scene, shot.scene_id)
+    episode = await db.get(models.Episode, scene.episode_id)
+    project = await db.get(models.Project, episode.project_id)
+
+    # 使用 ID 命名文件夹比使用 Title 更安全，因为 Title 会变，ID 不会
+    hierarchy_path = os.path.join(
+        "storyboard",
+        f"episode_{episode.id}",
+        f"scene_{scene.id}",
+        f"shot_{shot.id}",
+    )
+    project_name = project.name if project else "unknown_project"
+    return project_name, hierarchy_path
+
+def save_upload_file(src, dst_path: str):
+    """同步拷贝（调用方负责丢进线程池）"""
+    with open(dst_path, "wb") as buffer:
+        shutil.copyfileobj(src, buffer, length=1024 * 1024)
+
 # ==========================================
 # 1. 资产条目资源上传 (支持文档)
 # ==========================================
@@ -45,62 +94,36 @@ def determine_file_type(content_type: str, filename: str) -> str:
 async def upload_asset_item_asset(
     item_id: int,
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    item = db.query(models.Character).filter(models.Character.id == item_id).first()
+    item = await db.get(models.Character, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Asset item not found")
     
-    project_name = get_project_name(db, item.project_id)
-    
-    # 按分类决定落盘目录（固定枚举；兼容历史 persona -> persona_visual）
-    category = (item.category or "persona_visual").lower()
-    if category == "persona":
-        category = "persona_visual"
-
-    category_folder_map = {
-        "persona_visual": "characters",
-        "persona_voice": "voices",
-        "background": "backgrounds",
-        "element": "elements",
-        "prop": "props",
-        "pose": "poses",
-        "vfx": "vfx",
-        "layout": "layout",
-        "audio_music": "audio_music",
-        "audio_sfx": "audio_sfx",
-        "branding": "branding",
-        "ai_preset": "ai_preset",
-    }
-    folder = category_folder_map.get(category, category)
-    save_dir = os.path.join(DATA_ROOT, project_name, folder)
-    os.makedirs(save_dir, exist_ok=True)
-    
-    file_path = os.path.join(save_dir, file.filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # 内容寻址落盘：相同字节只存一份（写盘与哈希放到线程池）
+    blob = await blob_store.store_upload(db, file.file, file.filename)
         
     # --- 修改点：使用通用类型判断 ---
     file_type = determine_file_type(file.content_type, file.filename)
-        
-    meta = {}
-    if file_type == "image":
-        meta = extract_metadata(file_path)
 
-    relative_path = f"{project_name}/{folder}/{file.filename}"
-    
     db_asset = models.Asset(
         character_id=item.id,
-        file_path=relative_path,
+        file_path=blob.file_path,
         file_type=file_type,
-        meta_data=meta,
-        is_favorite=True 
+        meta_data={},
+        is_favorite=True,
+        blob_sha256=blob.sha256,
+        original_filename=file.filename,
+        file_size=blob.size,
     )
-    
     db.add(db_asset)
-    db.commit()
-    db.refresh(db_asset)
+
+    # metadata 交给后台任务补齐，上传立即返回
+    if file_type == "image":
+        await db.run_sync(jobs.enqueue_metadata_extraction, db_asset)
+
+    await db.commit()
+    await db.refresh(db_asset)
     return db_asset
 
 # -----------------------
@@ -110,7 +133,7 @@ async def upload_asset_item_asset(
 async def upload_character_asset(
     char_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     return await upload_asset_item_asset(item_id=char_id, file=file, db=db)
 
@@ -121,132 +144,278 @@ async def upload_character_asset(
 async def upload_shot_asset(
     shot_id: int, 
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # 1. 获取镜头及完整的层级关系
-    shot = db.query(models.Shot).filter(models.Shot.id == shot_id).first()
+    # 1. 获取镜头
+    shot = await db.get(models.Shot, shot_id)
     if not shot:
         raise HTTPException(status_code=404, detail="Shot not found")
     
-    # 关联查询: Shot -> Scene -> Episode -> Project
-    # 也可以使用 db.query(models.Project).join(...).filter(...) 的方式
-    # 这里为了简单直接查对象
-    scene = db.query(models.Scene).filter(models.Scene.id == shot.scene_id).first()
-    episode = db.query(models.Episode).filter(models.Episode.id == scene.episode_id).first()
-    project = db.query(models.Project).filter(models.Project.id == episode.project_id).first()
-    
-    project_name = project.name
-
-    # 2. 构建层级路径: data/{Project}/storyboard/episode_{id}/scene_{id}/shot_{id}/assets/
-    # 使用 ID 命名文件夹比使用 Title 更安全，因为 Title 会变，ID 不会
-    hierarchy_path = os.path.join(
-        "storyboard",
-        f"episode_{episode.id}",
-        f"scene_{scene.id}",
-        f"shot_{shot.id}",
-        "assets"
-    )
-    
-    save_dir = os.path.join(DATA_ROOT, project_name, hierarchy_path)
-    os.makedirs(save_dir, exist_ok=True)
-
-    # 3. 保存文件
-    # 既然已经分了 shot_{id} 文件夹，文件名冲突概率大大降低，直接用原名即可
-    file_path = os.path.join(save_dir, file.filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # 2. 保存文件：内容寻址存储 data/_blobs/..，同一张参考图传到多个镜头只占一份空间
+    blob = await blob_store.store_upload(db, file.file, file.filename)
 
-    # 4. 判断类型
+    # 3. 判断类型
     file_type = determine_file_type(file.content_type, file.filename)
-    
-    # 5. 提取 Metadata
-    meta = {}
-    if file_type == "image":
-        meta = extract_metadata(file_path)
 
-    # 6. 入库 (存储相对路径)
-    # Windows下 path separator 是 \, 需要转成 / 供前端 URL 使用
-    relative_path_part = os.path.join(project_name, hierarchy_path, file.filename)
-    relative_path = relative_path_part.replace("\\", "/")
-    
+    # 4. 入库 (存储相对路径)
     db_asset = models.Asset(
         shot_id=shot.id,
-        file_path=relative_path,
+        file_path=blob.file_path,
         file_type=file_type,
-        meta_data=meta,
-        is_favorite=False
+        meta_data={},
+        is_favorite=False,
+        blob_sha256=blob.sha256,
+        original_filename=file.filename,
+        file_size=blob.size,
     )
-    
     db.add(db_asset)
-    db.commit()
-    db.refresh(db_asset)
+
+    # 5. Metadata 由后台任务提取，meta_data 先标记为 pending
+    if file_type == "image":
+        await db.run_sync(jobs.enqueue_metadata_extraction, db_asset)
+
+    await db.commit()
+    await db.refresh(db_asset)
     return db_asset
 
 # 2. 为镜头关联资产 (保持原有逻辑，但适配新路径)
 @router.post("/shot/{shot_id}", response_model=schemas.AssetRead)
-def register_asset_for_shot(
+async def register_asset_for_shot(
     shot_id: int, 
     file_path: str, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # 这里逻辑暂时不变，如果用户手动粘贴路径，需要确保路径在 data/ 下
     # 建议后续也将此改为 upload 模式，存到 data/{project_name}/{ep_scene_shot}/ 下
     
     # 简单兼容：如果 file_path 是绝对路径，尝试读取
-    meta = extract_metadata(file_path)
+    meta, phash = await run_in_threadpool(image_hash.analyze_image, file_path)
+    file_size = await run_in_threadpool(storage_usage.file_size, file_path)
     
     db_asset = models.Asset(
         shot_id=shot_id,
         file_path=file_path,
         file_type="image",
-        meta_data=meta
+        meta_data=meta,
+        phash=phash,
+        file_size=file_size,
     )
     
     db.add(db_asset)
-    db.commit()
-    db.refresh(db_asset)
+    if meta and isinstance(meta.get("prompt"), str):
+        await db.run_sync(jobs.schedule_prompt_indexing_for_asset, db_asset)
+    await db.commit()
+    await db.refresh(db_asset)
     return db_asset
 
 @router.post("/shot/{shot_id}/video", response_model=schemas.ShotRead)
 async def upload_shot_video(
     shot_id: int, 
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # 1. 查找分镜
-    shot = db.query(models.Shot).filter(models.Shot.id == shot_id).first()
+    # 1. 查找分镜（ShotRead 带 assets，先预加载）
+    shot = (await db.execute(
+        select(models.Shot).options(selectinload(models.Shot.assets)).where(models.Shot.id == shot_id)
+    )).scalar_one_or_none()
     if not shot:
         raise HTTPException(status_code=404, detail="Shot not found")
     
     # 2. 获取项目名用于构建路径
     # 需要关联查询找到 project_name，路径稍微绕一点 Shot -> Scene -> Episode -> Project
     # 简单起见，我们先反查或者直接用 ID 命名文件夹，这里为了文件结构好看，我们尝试查一下
-    scene = db.query(models.Scene).filter(models.Scene.id == shot.scene_id).first()
-    episode = db.query(models.Episode).filter(models.Episode.id == scene.episode_id).first()
-    project = db.query(models.Project).filter(models.Project.id == episode.project_id).first()
+    scene = await db.get(models.Scene, shot.scene_id)
+    episode = await db.get(models.Episode, scene.episode_id)
+    project = await db.get(models.Project, episode.project_id)
     
     project_name = project.name if project else "unknown_project"
     
     # 3. 构建保存路径: data/{project_name}/videos/
     save_dir = os.path.join(DATA_ROOT, project_name, "videos")
-    os.makedirs(save_dir, exist_ok=True)
     
-    # 4. 生成文件名 (建议保留原后缀，前面加 shot_id 防止重名)
+    # 4. 保存文件：shot_{id}_<内容摘要>.ext，替换视频时 URL 跟着变，浏览器缓存不会拿到旧视频
     file_ext = os.path.splitext(file.filename)[1]
-    new_filename = f"shot_{shot_id}_video{file_ext}"
-    file_full_path = os.path.join(save_dir, new_filename)
-    
-    # 5. 保存文件
-    with open(file_full_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    new_filename, video_size = await run_in_threadpool(file_serving.save_versioned, file.file, save_dir, file_ext, f"shot_{shot_id}_")
         
-    # 6. 更新数据库 Shot 记录
+    # 5. 更新数据库 Shot 记录
     # 存储相对路径 "项目名/videos/文件名"
     relative_path = f"{project_name}/videos/{new_filename}"
+    await db.run_sync(file_gc.tombstone_replaced, shot.video_path, relative_path)  # 旧视频和改行同一个事务登记
     shot.video_path = relative_path
+    shot.video_size = video_size
     
-    db.commit()
-    db.refresh(shot)
+    await db.commit()
     
-    return shot
\ No newline at end of file
+    return shot
+
+# ==========================================
+# 3. 批量导入（多文件 / zip / 服务器本地目录）
+# ==========================================
+# 允许导入的服务器目录（os.pathsep 分隔）；未配置时不限制
+INGEST_ROOTS = [p for p in os.environ.get("AICOMIC_INGEST_ROOTS", "").split(os.pathsep) if p]
+
+def _check_ingest_directory(directory: str) -> str:
+    real = os.path.realpath(directory)
+    if not os.path.isdir(real):
+        raise HTTPException(status_code=400, detail="Directory not found")
+    if INGEST_ROOTS and not any(
+        real == os.path.realpath(root) or real.startswith(os.path.realpath(root) + os.sep)
+        for root in INGEST_ROOTS
+    ):
+        raise HTTPException(status_code=403, detail="Directory is outside the allowed ingest roots")
+    return real
+
+@router.post("/shot/{shot_id}/bulk", response_model=schemas.IngestStatus)
+async def bulk_upload_shot_assets(
+    shot_id: int,
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    一次上传多个文件（.zip 会被展开），立即返回导入任务，
+    后台并行解析 metadata 并在一个事务里插入全部 Asset
+    """
+    shot = await db.get(models.Shot, shot_id)
+    if not shot:
+        raise HTTPException(status_code=404, detail="Shot not found")
+
+    job = bulk_ingest.create_job(shot_id, total=len(files))
+    staging_dir = bulk_ingest.job_staging_dir(job)
+    sources = []
+    # 请求结束后 UploadFile 会被关闭，所以先暂存到磁盘再交给后台
+    for index, file in enumerate(files):
+        staged_path = os.path.join(staging_dir, f"{index}_{os.path.basename(file.filename)}")
+        await run_in_threadpool(save_upload_file, file.file, staged_path)
+        is_zip = file.filename.lower().endswith(".zip")
+        sources.append(("zip" if is_zip else "staged", staged_path, file.filename, file.content_type))
+
+    background_tasks.add_task(bulk_ingest.run_ingest, job, shot_id, sources)
+    return bulk_ingest.get_job(job["id"])
+
+@router.post("/shot/{shot_id}/ingest-directory", response_model=schemas.IngestStatus)
+async def ingest_shot_directory(
+    shot_id: int,
+    request: schemas.IngestDirectoryRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+):
+    """导入服务器本地目录（源文件只读不动）"""
+    shot = await db.get(models.Shot, shot_id)
+    if not shot:
+        raise HTTPException(status_code=404, detail="Shot not found")
+
+    directory = _check_ingest_directory(request.directory)
+    sources = [
+        ("file", path, name, None)
+        for path, name in await run_in_threadpool(bulk_ingest.list_directory, directory, request.recursive)
+    ]
+    job = bulk_ingest.create_job(shot_id, total=len(sources))
+    background_tasks.add_task(bulk_ingest.run_ingest, job, shot_id, sources)
+    return bulk_ingest.get_job(job["id"])
+
+@router.get("/ingest/{job_id}", response_model=schemas.IngestStatus)
+def get_ingest_status(job_id: str):
+    job = bulk_ingest.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+# -----------------------
+# 提示词近似去重
+# -----------------------
+# 签名由后台任务补算（jobs.index_prompts），这几个 GET 只读，比对放在线程池里
+@router.get("/project/{project_id}/near-duplicates", response_model=schemas.NearDuplicateClusters)
+async def get_near_duplicate_clusters(
+    project_id: int,
+    threshold: float = Query(default=near_dup.DEFAULT_THRESHOLD, ge=0.3, le=1.0),
+    limit: int = Query(default=50, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db),
+):
+    await get_project_name(db, project_id)
+    return await run_in_threadpool(near_dup.clusters, project_id, threshold, limit)
+
+@router.get("/{asset_id}/near-duplicates", response_model=List[schemas.NearDuplicateMember])
+async def get_asset_near_duplicates(
+    asset_id: int,
+    threshold: float = Query(default=near_dup.DEFAULT_THRESHOLD, ge=0.3, le=1.0),
+    db: AsyncSession = Depends(get_read_db),
+):
+    project_id = await db.run_sync(near_dup.asset_project_id, asset_id)
+    if project_id is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    return await run_in_threadpool(near_dup.near_duplicates, asset_id, project_id, threshold)
+
+# 批量删除（折叠近似重复后清理多余的变体）；任何一个 id 不在项目里就整批拒绝
+@router.post("/project/{project_id}/prune", response_model=schemas.AssetPruneResult)
+async def prune_assets(project_id: int, request: schemas.AssetPruneRequest, db: AsyncSession = Depends(get_db)):
+    await get_project_name(db, project_id)
+    wanted = set(request.asset_ids)
+    found = await db.run_sync(near_dup.project_asset_ids, project_id, wanted) if wanted else set()
+    missing = sorted(wanted - found)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Assets not found in project {project_id}: {missing}")
+    assets = (await db.execute(select(Asset).where(Asset.id.in_(found)))).scalars().all()
+    for asset in assets:
+        await db.run_sync(file_gc.discard_asset, asset)
+        await db.delete(asset)
+    await db.commit()
+    return {"deleted": sorted(found)}
+
+# -----------------------
+# 相似图片（感知哈希）
+# -----------------------
+@router.get("/{asset_id}/similar-images", response_model=List[schemas.SimilarImage])
+async def get_similar_images(
+    asset_id: int,
+    max_distance: int = Query(default=image_hash.DEFAULT_DISTANCE, ge=0, le=image_hash.MAX_DISTANCE),
+    limit: int = Query(default=50, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db),
+):
+    asset = await db.get(Asset, asset_id)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    if asset.phash is None:
+        return []
+    project_id = await db.run_sync(near_dup.asset_project_id, asset_id)
+    return await run_in_threadpool(image_hash.search, project_id, asset.phash, max_distance, limit, asset_id)
+
+def _hash_upload(file) -> int:
+    try:
+        with Image.open(file) as img:
+            return image_hash.dhash_image(img)
+    except Exception:
+        return None
+
+# 上传前查重：传文件（可以是前端缩小后的图）或已算好的 phash（16 位十六进制）
+@router.post("/project/{project_id}/image-check", response_model=schemas.ImageCheckResult)
+async def check_image_duplicates(
+    project_id: int,
+    phash: Optional[str] = Query(default=None),
+    max_distance: int = Query(default=image_hash.DEFAULT_DISTANCE, ge=0, le=image_hash.MAX_DISTANCE),
+    limit: int = Query(default=20, ge=1, le=500),
+    file: Optional[UploadFile] = File(default=None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if phash is not None:
+        try:
+            value = image_hash.parse_hash(phash)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="phash must be 16 hex digits")
+    elif file is not None:
+        value = await run_in_threadpool(_hash_upload, file.file)
+        if value is None:
+            raise HTTPException(status_code=400, detail="File is not a readable image")
+    else:
+        raise HTTPException(status_code=400, detail="Either phash or file is required")
+    await get_project_name(db, project_id)
+    matches = await run_in_threadpool(image_hash.search, project_id, value, max_distance, limit)
+    return {"phash": image_hash.format_hash(value), "matches": matches}
+
+# 历史图片补算 phash（后台分批执行）
+@router.post("/image-hashes/backfill", response_model=schemas.JobRead)
+async def backfill_image_hashes(db: AsyncSession = Depends(get_db)):
+    job = await db.run_sync(jobs.enqueue, "backfill_image_hashes", {"after_id": 0})
+    await db.commit()
+    await db.refresh(job)
+    return job
@@ -0,0 +1,90 @@
+import asyncio
+import os
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from ..utils.derivatives import (
+    DERIVATIVE_PRESETS,
+    DERIVATIVE_FORMATS,
+    derivative_cache,
+    derivative_key,
+    render_derivative,
+)
+from ..utils.process_pool import get_process_pool
+from ..utils import blob_store, file_serving
+
+router = APIRouter(
+    prefix="/derivatives",
+    tags=["Derivatives (缩略图)"]
+)
+
+DATA_ROOT = blob_store.DATA_ROOT
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+
+# 同一个 key 正在生成时，后来的请求直接等同一个 future，避免重复渲染
+_inflight = {}
+
+
+def resolve_data_path(file_path: str) -> str:
+    """把 /files 下的相对路径转成绝对路径，并防止 ../ 越界"""
+    full_path = os.path.realpath(os.path.join(DATA_ROOT, file_path))
+    if not full_path.startswith(os.path.realpath(DATA_ROOT) + os.sep):
+        raise HTTPException(status_code=400, detail="Invalid file path")
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return full_path
+
+
+@router.get("/stats")
+def get_derivative_cache_stats():
+    return derivative_cache.stats()
+
+
+@router.get("/{preset}/{file_path:path}")
+async def get_derivative(
+    preset: str,
+    file_path: str,
+    format: str = Query(default="webp"),
+):
+    """
+    返回 data/{file_path} 的缩放版本（如 /derivatives/thumb/项目/characters/a.png）
+    命中磁盘缓存直接返回；未命中则在进程池里生成后写入缓存
+    """
+    if preset not in DERIVATIVE_PRESETS:
+        raise HTTPException(status_code=400, detail=f"Unknown preset: {preset}")
+    if format not in DERIVATIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    if os.path.splitext(file_path)[1].lower() not in IMAGE_EXTS:
+        raise HTTPException(status_code=415, detail="Derivatives are only available for images")
+
+    src_path = resolve_data_path(file_path)
+    key = derivative_key(file_path, os.stat(src_path), preset, format)
+    media_type = DERIVATIVE_FORMATS[format]["media_type"]
+    # blob 源文件内容不会变，缩略图也就不会变
+    headers = {"Cache-Control": file_serving.IMMUTABLE if blob_store.is_blob_path(file_path) else file_serving.REVALIDATE}
+
+    cached = derivative_cache.get(key)
+    if cached:
+        return FileResponse(cached, media_type=media_type, headers=headers)
+
+    dst_path = derivative_cache.path_for(key, format)
+    future = _inflight.get(key)
+    if future is None:
+        spec = DERIVATIVE_PRESETS[preset]
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            get_process_pool(), render_derivative,
+            src_path, dst_path, spec["width"], spec["quality"], format,
+        )
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    try:
+        size = await asyncio.shield(future)
+    except Exception as e:
+        print(f"[Derivative][Error] Failed to render {file_path}: {e}")
+        raise HTTPException(status_code=422, detail="Failed to render derivative")
+
+    derivative_cache.put(key, dst_path, size)
+    return FileResponse(dst_path, media_type=media_type, headers=headers)
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from collections import defaultdict
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List
-from .. import models, schemas
-from ..database import get_db
+from .. import models, revisions, schemas
+from ..database import get_db, get_read_db
+from ..utils import event_matrix, tree_json
+from ..utils.response_cache import cached_json
 from typing import Dict, Any
 
 router = APIRouter(
@@ -10,60 +16,115 @@ router = APIRouter(
     tags=["Event System (事件系统)"]
 )
 
-# 获取项目的所有事件
+async def _load_event(db: AsyncSession, event_id: int):
+    """EventRead 带 nodes，异步会话里不能懒加载，统一预加载"""
+    result = await db.execute(
+        select(models.Event).options(selectinload(models.Event.nodes)).where(models.Event.id == event_id)
+    )
+    return result.scalar_one_or_none()
+
+# 获取项目的所有事件（序列化结果走响应缓存）
 @router.get("/project/{project_id}", response_model=List[schemas.EventRead])
-def get_project_events(project_id: int, db: Session = Depends(get_db)):
-    from sqlalchemy.orm import joinedload
-    return db.query(models.Event)\
-              .options(joinedload(models.Event.nodes))\
-              .filter(models.Event.project_id == project_id).all()
+async def get_project_events(project_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    not_modified = await revisions.check_not_modified(request, response, db, project_id)
+    if not_modified is not None:
+        return not_modified
+
+    async def build():
+        return tree_json.dumps(await db.run_sync(tree_json.event_list, project_id))
+
+    return await cached_json(project_id, "events", "list", build, response=response)
 
 # 创建事件
 @router.post("/project/{project_id}", response_model=schemas.EventRead)
-def create_event(project_id: int, event: schemas.EventCreate, db: Session = Depends(get_db)):
+async def create_event(project_id: int, event: schemas.EventCreate, db: AsyncSession = Depends(get_db)):
     db_event = models.Event(**event.dict(), project_id=project_id)
     db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
-    return db_event
+    await db.commit()
+    return await _load_event(db, db_event.id)
+
+# 节点写入：一条 INSERT ... ON CONFLICT DO UPDATE（ux_event_nodes_target 唯一索引兜底），不再先查后写
+NODE_TARGET_TYPES = ("episode", "scene", "shot")
+NODE_BULK_CHUNK = 5000  # SQLite 单条语句最多 32766 个参数，每行 4 个
+
+def _apply_node_bulk(db: Session, upserts, deletes) -> dict:
+    """
+    同步执行（经 run_sync 调用），不提交；先 upsert 后 delete
+    Core 语句绕过 ORM，修订号/变更日志手动记
+    """
+    event_ids = {item.event_id for item in upserts} | {key.event_id for key in deletes}
+    projects = dict(db.execute(
+        select(models.Event.id, models.Event.project_id).where(models.Event.id.in_(event_ids))
+    ).all()) if event_ids else {}
+    missing = event_ids - projects.keys()
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Event not found: {sorted(missing)}")
+    for item in (*upserts, *deletes):
+        if item.target_type not in NODE_TARGET_TYPES:
+            raise HTTPException(status_code=400, detail=f"target_type must be one of {NODE_TARGET_TYPES}")
+
+    table = models.EventNode.__table__
+    # 同一个目标出现多次时以最后一条为准
+    rows = list({(i.event_id, i.target_type, i.target_id): i.description for i in upserts}.items())
+    upserted = []
+    for start in range(0, len(rows), NODE_BULK_CHUNK):
+        stmt = sqlite_insert(table).values([
+            {"event_id": event_id, "target_type": target_type, "target_id": target_id, "description": description}
+            for (event_id, target_type, target_id), description in rows[start:start + NODE_BULK_CHUNK]
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.event_id, table.c.target_type, table.c.target_id],
+            set_={"description": stmt.excluded.description},
+        ).returning(table.c.id, table.c.event_id, table.c.target_type, table.c.target_id, table.c.description)
+        upserted += [dict(row) for row in db.execute(stmt).mappings()]
+
+    keys = list({(k.event_id, k.target_type, k.target_id) for k in deletes})
+    deleted = []
+    for start in range(0, len(keys), NODE_BULK_CHUNK):
+        deleted += db.execute(
+            delete(table)
+            .where(tuple_(table.c.event_id, table.c.target_type, table.c.target_id).in_(keys[start:start + NODE_BULK_CHUNK]))
+            .returning(table.c.id, table.c.event_id)
+        ).all()
+
+    by_project = defaultdict(lambda: ([], []))
+    for row in upserted:
+        by_project[projects[row["event_id"]]][0].append(row["id"])
+    for node_id, event_id in deleted:
+        by_project[projects[event_id]][1].append(node_id)
+    deleted_ids = {node_id for node_id, _ in deleted}
+    for project_id, (upsert_ids, delete_ids) in by_project.items():
+        revisions.record_changes(db, project_id, "event_nodes", [i for i in upsert_ids if i not in deleted_ids])
+        revisions.record_changes(db, project_id, "event_nodes", delete_ids, op="delete")
+
+    return {
+        "upserted": [row for row in upserted if row["id"] not in deleted_ids],
+        "deleted": sorted(deleted_ids),
+    }
+
+@router.post("/nodes/bulk", response_model=schemas.EventNodeBulkResult)
+async def bulk_event_nodes(bulk: schemas.EventNodeBulk, db: AsyncSession = Depends(get_db)):
+    """矩阵里一笔刷过几百个镜头：一个请求、一个事务"""
+    result = await db.run_sync(_apply_node_bulk, bulk.upserts, bulk.deletes)
+    await db.commit()
+    return result
 
 @router.post("/nodes/{event_id}", response_model=schemas.EventNodeRead)
-def upsert_event_node(
-    event_id: int, 
-    node_data: schemas.EventNodeUpdate, 
-    db: Session = Depends(get_db)
+async def upsert_event_node(
+    event_id: int,
+    node_data: schemas.EventNodeUpdate,
+    db: AsyncSession = Depends(get_db)
 ):
-    # 1. 查找是否存在已有节点
-    existing_node = db.query(models.EventNode).filter(
-        models.EventNode.event_id == event_id,
-        models.EventNode.target_type == node_data.target_type,
-        models.EventNode.target_id == node_data.target_id
-    ).first()
-
-    if existing_node:
-        # 更新
-        existing_node.description = node_data.description
-        db.commit()
-        db.refresh(existing_node)
-        return existing_node
-    else:
-        # 新建
-        new_node = models.EventNode(
-            event_id=event_id,
-            target_type=node_data.target_type,
-            target_id=node_data.target_id,
-            description=node_data.description
-        )
-        db.add(new_node)
-        db.commit()
-        db.refresh(new_node)
-        return new_node
+    item = schemas.EventNodeBulkItem(event_id=event_id, **node_data.dict())
+    result = await db.run_sync(_apply_node_bulk, [item], [])
+    await db.commit()
+    return result["upserted"][0]
 
 
 # 更新事件详情
 @router.patch("/{event_id}", response_model=schemas.EventRead)
-def update_event(event_id: int, event_update: schemas.EventUpdate, db: Session = Depends(get_db)):
-    db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
+async def update_event(event_id: int, event_update: schemas.EventUpdate, db: AsyncSession = Depends(get_db)):
+    db_event = await _load_event(db, event_id)
     if not db_event:
         raise HTTPException(status_code=404, detail="Event not found")
 
@@ -76,25 +137,20 @@ def update_event(event_id: int, event_update: schemas.EventUpdate, db: Session =
     if event_update.color is not None:
         db_event.color = event_update.color
 
-    db.commit()
-    db.refresh(db_event)
+    await db.commit()
     return db_event
 
 @router.get("/matrix/{project_id}")
-def get_event_matrix(project_id: int, db: Session = Depends(get_db)):
+async def get_event_matrix(project_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     """
-    聚合查询：返回该项目下所有事件、以及所有事件关联的节点
-    前端拿到后，自己在内存里组装矩阵
+    稀疏事件矩阵：行 = 事件，列 = 按剧本顺序排好的 集/场/镜头，每层一份 CSR
+    镜头上的节点已上卷到场和集，前端不用再自己拼矩阵（格式见 utils/event_matrix.py）
     """
-    # 1. 获取所有事件
-    events = db.query(models.Event).filter(models.Event.project_id == project_id).all()
-    
-    # 2. 获取所有节点 (通过 join 优化性能)
-    # 逻辑：找出属于这些 events 的所有 nodes
-    event_ids = [e.id for e in events]
-    nodes = db.query(models.EventNode).filter(models.EventNode.event_id.in_(event_ids)).all()
-    
-    return {
-        "events": events, # 包含 id, name, color
-        "nodes": nodes    # 包含 target_type, target_id, description, event_id
-    }
\ No newline at end of file
+    not_modified = await revisions.check_not_modified(request, response, db, project_id)
+    if not_modified is not None:
+        return not_modified
+
+    async def build():
+        return tree_json.dumps(await db.run_sync(event_matrix.build_event_matrix, project_id))
+
+    return await cached_json(project_id, "matrix", "sparse", build, response=response)
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Request
+
+from ..utils import file_serving
+
+router = APIRouter(
+    tags=["Files (静态文件)"]
+)
+
+# 取代原来的 StaticFiles 挂载：缓存策略 / ETag / Range / 预压缩见 utils/file_serving.py
+# 同步路由：stat 和打开文件在线程池里做
+@router.api_route("/files/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def get_file(file_path: str, request: Request):
+    return file_serving.serve(request, file_path)
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import jobs, models, schemas
+from ..database import get_db, get_read_db
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs (后台任务)"]
+)
+
+@router.get("/", response_model=List[schemas.JobRead])
+async def list_jobs(
+    status: Optional[str] = Query(default=None),
+    kind: Optional[str] = Query(default=None),
+    limit: int = Query(default=50, le=500),
+    db: AsyncSession = Depends(get_read_db),
+):
+    stmt = select(models.Job)
+    if status:
+        stmt = stmt.where(models.Job.status == status)
+    if kind:
+        stmt = stmt.where(models.Job.kind == kind)
+    return (await db.execute(stmt.order_by(models.Job.id.desc()).limit(limit))).scalars().all()
+
+@router.get("/{job_id}", response_model=schemas.JobRead)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_read_db)):
+    job = await db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# 失败的任务手动重试
+@router.post("/{job_id}/retry", response_model=schemas.JobRead)
+async def retry_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    job = await db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "failed":
+        raise HTTPException(status_code=400, detail="Only failed jobs can be retried")
+    job.status = "pending"
+    job.attempts = 0
+    job.run_after = None
+    await db.commit()
+    await db.refresh(job)
+    jobs.notify()
+    return job
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from pydantic import BaseModel
-from .. import models, schemas
-from ..database import get_db
+from .. import file_gc, models, revisions, schemas
+from ..database import get_db, get_read_db
+from ..utils import project_archive, tree_json
+from ..utils.response_cache import cached_json
+import asyncio
 import os
+from urllib.parse import quote
 from ..models import Character, Asset, Project
 
 router = APIRouter(
@@ -41,21 +49,21 @@ class CharacterUpdate(BaseModel):
 # =======================
 
 @router.get("/", response_model=List[schemas.ProjectBase])
-def get_projects(db: Session = Depends(get_db)):
-    return db.query(models.Project).all()
+async def get_projects(db: AsyncSession = Depends(get_read_db)):
+    return (await db.execute(select(models.Project))).scalars().all()
 
 @router.post("/", response_model=schemas.ProjectBase)
-def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
+async def create_project(project: ProjectCreate, db: AsyncSession = Depends(get_db)):
     db_project = models.Project(name=project.name, description=project.description)
     db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    await db.refresh(db_project)
     return db_project
 
 # 【新增】修改项目 (重命名)
 @router.patch("/{project_id}", response_model=schemas.ProjectBase)
-def update_project(project_id: int, project_update: ProjectUpdate, db: Session = Depends(get_db)):
-    db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
+async def update_project(project_id: int, project_update: ProjectUpdate, db: AsyncSession = Depends(get_db)):
+    db_project = await db.get(models.Project, project_id)
     if not db_project:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -64,33 +72,83 @@ def update_project(project_id: int, project_update: ProjectUpdate, db: Session =
     if project_update.description is not None:
         db_project.description = project_update.description
         
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    await db.refresh(db_project)
     return db_project
 
+# 【新增】导出整个项目：单个 tar 流式写进响应（清单 + 引用到的文件），不落临时文件
+@router.get("/{project_id}/export")
+async def export_project(project_id: int, db: AsyncSession = Depends(get_read_db)):
+    db_project = await db.get(models.Project, project_id)
+    if not db_project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    filename = f"project_{project_id}.tar"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}; filename*=UTF-8''{quote(db_project.name or filename)}.tar",
+    }
+    return StreamingResponse(project_archive.export_project(project_id), media_type="application/x-tar", headers=headers)
+
+# 【新增】导入 export 生成的归档（请求体就是 tar / tar.gz），总是建成新项目；同名时自动加后缀
+@router.post("/import", response_model=schemas.ProjectImportResult)
+async def import_project(request: Request, name: Optional[str] = Query(default=None)):
+    reader = project_archive.BodyReader()
+    # 工作线程边收边解包入库；这里只负责把请求体块塞进有界队列
+    worker = asyncio.ensure_future(run_in_threadpool(project_archive.import_archive, reader, name))
+    try:
+        async for chunk in request.stream():
+            if worker.done():
+                break
+            if chunk:
+                await run_in_threadpool(reader.feed, chunk)
+        await run_in_threadpool(reader.feed, None)
+    except BaseException:
+        reader.abort()
+        raise
+    try:
+        return await worker
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # =======================
 # 2. 资产条目管理接口（对外不再暴露“人设/角色”概念）
 # =======================
 
+async def _load_asset_item(db: AsyncSession, item_id: int):
+    """AssetItemRead 带 assets，异步会话里不能懒加载，统一预加载"""
+    result = await db.execute(
+        select(models.Character)
+        .options(selectinload(models.Character.assets))
+        .where(models.Character.id == item_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
+async def _find_asset_item_by_name(db: AsyncSession, project_id: int, name: str):
+    return (await db.execute(select(models.Character).where(
+        models.Character.project_id == project_id,
+        models.Character.name == name
+    ))).scalars().first()
+
 @router.get("/{project_id}/asset-items", response_model=List[schemas.AssetItemRead])
-def get_project_asset_items(
+async def get_project_asset_items(
     project_id: int,
+    request: Request,
+    response: Response,
     category: Optional[str] = Query(default=None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    q = db.query(models.Character).options(joinedload(models.Character.assets)).filter(
-        models.Character.project_id == project_id
-    )
-    if category:
-        q = q.filter(models.Character.category == category)
-    return q.all()
+    not_modified = await revisions.check_not_modified(request, response, db, project_id)
+    if not_modified is not None:
+        return not_modified
+
+    async def build():
+        return tree_json.dumps(await db.run_sync(tree_json.asset_items, project_id, category))
+
+    return await cached_json(project_id, "asset_items", "list", build, response=response, variant=category)
 
 @router.post("/{project_id}/asset-items", response_model=schemas.AssetItemRead)
-def create_asset_item(project_id: int, item: CharacterCreate, db: Session = Depends(get_db)):
-    exists = db.query(models.Character).filter(
-        models.Character.project_id == project_id,
-        models.Character.name == item.name
-    ).first()
+async def create_asset_item(project_id: int, item: CharacterCreate, db: AsyncSession = Depends(get_db)):
+    exists = await _find_asset_item_by_name(db, project_id, item.name)
     
     if exists:
         raise HTTPException(status_code=400, detail="该项目下已存在同名角色")
@@ -103,26 +161,19 @@ def create_asset_item(project_id: int, item: CharacterCreate, db: Session = Depe
         category=item.category or "persona_visual",
     )
     db.add(new_char)
-    db.commit()
-    db.refresh(new_char)
+    await db.commit()
     # 重新加载以包含 assets 关系
-    db_char = db.query(models.Character).options(
-        joinedload(models.Character.assets)
-    ).filter(models.Character.id == new_char.id).first()
-    return db_char
+    return await _load_asset_item(db, new_char.id)
 
 @router.patch("/asset-items/{item_id}", response_model=schemas.AssetItemRead)
-def update_asset_item(item_id: int, item_update: CharacterUpdate, db: Session = Depends(get_db)):
-    db_char = db.query(models.Character).filter(models.Character.id == item_id).first()
+async def update_asset_item(item_id: int, item_update: CharacterUpdate, db: AsyncSession = Depends(get_db)):
+    db_char = await db.get(models.Character, item_id)
     if not db_char:
         raise HTTPException(status_code=404, detail="Asset item not found")
     
 
     if item_update.name and item_update.name != db_char.name:
-        exists = db.query(models.Character).filter(
-            models.Character.project_id == db_char.project_id,
-            models.Character.name == item_update.name
-        ).first()
+        exists = await _find_asset_item_by_name(db, db_char.project_id, item_update.name)
         if exists:
             raise HTTPException(status_code=400, detail="该项目下已存在同名角色")
 
@@ -142,90 +193,60 @@ def update_asset_item(item_id: int, item_update: CharacterUpdate, db: Session =
             is_favorite=True 
         )
         db.add(new_asset)
-        db.flush() 
+        await db.flush() 
         db_char.avatar_asset_id = new_asset.id
 
-    db.commit()
+    await db.commit()
     # 重新加载以包含 assets 关系
-    db_char = db.query(models.Character).options(
-        joinedload(models.Character.assets)
-    ).filter(models.Character.id == item_id).first()
-    return db_char
+    return await _load_asset_item(db, item_id)
     
 @router.delete("/asset-items/{item_id}")
-def delete_asset_item(item_id: int, db: Session = Depends(get_db)):
+async def delete_asset_item(item_id: int, db: AsyncSession = Depends(get_db)):
     # 查询资产条目
-    character = db.query(models.Character).options(joinedload(models.Character.assets)).filter(models.Character.id == item_id).first()
+    character = await _load_asset_item(db, item_id)
     if not character:
         raise HTTPException(status_code=404, detail="Asset item not found")
     
-    # --- 新增逻辑：物理删除关联的文件 ---
-    # 假设你的 DATA_DIR 是项目根目录下的 data 文件夹
-    base_data_dir = os.path.join(os.getcwd(), "data")
-    
-    # 遍历该角色的所有资产进行删除
-    # 注意：确保 character.assets 是正确关联的列表
+    # 关联文件登记墓碑，后台清扫（blob 资产按引用计数，其他镜头/条目还在用的文件会保留）
     for asset in character.assets:
-        if asset.file_path:
-            # 拼接完整路径
-            file_full_path = os.path.join(base_data_dir, asset.file_path)
-            try:
-                if os.path.exists(file_full_path):
-                    os.remove(file_full_path)
-                    print(f"Deleted file: {file_full_path}")
-            except Exception as e:
-                print(f"Error deleting file {file_full_path}: {e}")
-    # -----------------------------------
+        await db.run_sync(file_gc.discard_asset, asset)
 
     # 删除数据库记录
-    db.delete(character)
-    db.commit()
+    await db.delete(character)
+    await db.commit()
     return {"message": "Asset item and associated files deleted"}
 
 # -----------------------
 # 兼容旧接口（前端已切到 /asset-items；此处仅避免旧客户端断掉）
 # -----------------------
 @router.get("/{project_id}/characters", response_model=List[schemas.AssetItemRead])
-def get_project_characters(project_id: int, db: Session = Depends(get_db)):
-    return get_project_asset_items(project_id=project_id, category=None, db=db)
+async def get_project_characters(project_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    return await get_project_asset_items(project_id=project_id, request=request, response=response, category=None, db=db)
 
 @router.post("/{project_id}/characters", response_model=schemas.AssetItemRead)
-def create_character(project_id: int, char: CharacterCreate, db: Session = Depends(get_db)):
-    return create_asset_item(project_id=project_id, item=char, db=db)
+async def create_character(project_id: int, char: CharacterCreate, db: AsyncSession = Depends(get_db)):
+    return await create_asset_item(project_id=project_id, item=char, db=db)
 
 @router.patch("/characters/{char_id}", response_model=schemas.AssetItemRead)
-def update_character(char_id: int, char_update: CharacterUpdate, db: Session = Depends(get_db)):
-    return update_asset_item(item_id=char_id, item_update=char_update, db=db)
+async def update_character(char_id: int, char_update: CharacterUpdate, db: AsyncSession = Depends(get_db)):
+    return await update_asset_item(item_id=char_id, item_update=char_update, db=db)
 
 @router.delete("/characters/{character_id}")
-def delete_character(character_id: int, db: Session = Depends(get_db)):
-    return delete_asset_item(item_id=character_id, db=db)
+async def delete_character(character_id: int, db: AsyncSession = Depends(get_db)):
+    return await delete_asset_item(item_id=character_id, db=db)
 
 @router.delete("/assets/{asset_id}")
-def delete_asset(asset_id: int, db: Session = Depends(get_db)):
+async def delete_asset(asset_id: int, db: AsyncSession = Depends(get_db)):
     # 👇 修正：查询 Asset 表
-    asset = db.query(Asset).filter(Asset.id == asset_id).first()
+    asset = await db.get(Asset, asset_id)
     
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
     
-    # 物理删除文件
-    base_data_dir = os.path.join(os.getcwd(), "data")
-    if asset.file_path:
-        # 防止路径拼接错误，根据你的实际存储逻辑调整
-        # 如果 file_path 已经是相对路径 "characters/1/xxx.jpg"，直接拼
-        file_full_path = os.path.join(base_data_dir, asset.file_path)
-        
-        try:
-            if os.path.exists(file_full_path):
-                os.remove(file_full_path)
-                print(f"Deleted asset file: {file_full_path}")
-            else:
-                print(f"File not found on disk: {file_full_path}")
-        except Exception as e:
-            print(f"Error deleting file {file_full_path}: {e}")
+    # 文件登记墓碑，后台清扫（blob 资产只有最后一个引用消失时才删）
+    await db.run_sync(file_gc.discard_asset, asset)
 
     # 删除数据库记录
-    db.delete(asset)
-    db.commit()
-    return {"message": "Asset deleted successfully"}
\ No newline at end of file
+    await db.delete(asset)
+    await db.commit()
+    return {"message": "Asset deleted successfully"}
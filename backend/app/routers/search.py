@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from .. import models, schemas
+from ..database import get_read_db
+from ..utils import fulltext
+
+router = APIRouter(
+    prefix="/search",
+    tags=["Search (全文检索)"]
+)
+
+# 在项目内检索镜头（标题/动作/台词/提示词）、资产条目（名称/描述/基础提示词）、素材生成参数里的提示词
+# types 逗号分隔，默认全部；按相关度排序，offset 分页
+@router.get("/project/{project_id}", response_model=schemas.SearchPage)
+async def search_project(
+    project_id: int,
+    q: str = Query(..., min_length=1, max_length=200),
+    types: Optional[str] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    db: AsyncSession = Depends(get_read_db),
+):
+    kinds = list(fulltext.SOURCES) if not types else [kind.strip() for kind in types.split(",") if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in fulltext.SOURCES]
+    if unknown or not kinds:
+        raise HTTPException(status_code=400, detail=f"types must be a subset of {sorted(fulltext.SOURCES)}")
+    indexed, short = fulltext.parse_query(q)
+    if not indexed and not short:
+        raise HTTPException(status_code=400, detail="Empty query")
+    if await db.get(models.Project, project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return await db.run_sync(fulltext.search, project_id, q, kinds, limit, offset)
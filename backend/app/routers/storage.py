@@ -0,0 +1,52 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import file_gc, jobs, schemas, storage_usage
+from ..database import get_db, get_read_db
+
+router = APIRouter(
+    prefix="/storage",
+    tags=["Storage (磁盘与文件回收)"]
+)
+
+# 待清扫的墓碑数、最老的一条、引用数已归零的 blob 数
+@router.get("/gc", response_model=schemas.GcStatus)
+async def get_gc_status(db: AsyncSession = Depends(get_read_db)):
+    return await db.run_sync(file_gc.stats)
+
+# 手动触发一次清扫（删除接口会自动登记，一般不需要）
+@router.post("/gc/sweep", response_model=schemas.JobRead)
+async def sweep_files(db: AsyncSession = Depends(get_db)):
+    job = await db.run_sync(jobs.enqueue, "sweep_files", {})
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+# 对账扫描（后台执行，结果在任务的 result 里）：孤儿文件 + 文件丢失的行；apply=true 时孤儿登记墓碑
+@router.post("/reconcile", response_model=schemas.JobRead)
+async def reconcile_files(apply: bool = Query(default=False), db: AsyncSession = Depends(get_db)):
+    job = await db.run_sync(jobs.enqueue, "reconcile_files", {"apply": apply})
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+# 各项目占用（字节数 + 文件数），按字节数倒序
+@router.get("/projects", response_model=List[schemas.ProjectStorageSummary])
+async def get_projects_storage(db: AsyncSession = Depends(get_read_db)):
+    return await db.run_sync(storage_usage.projects_usage)
+
+# 单个项目按分类、集、场拆分的占用
+@router.get("/project/{project_id}", response_model=schemas.ProjectStorage)
+async def get_project_storage(project_id: int, db: AsyncSession = Depends(get_read_db)):
+    usage = await db.run_sync(storage_usage.project_usage, project_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return usage
+
+# 读盘重填文件大小并整体重算统计（统计和磁盘对不上时用）
+@router.post("/usage/rebuild", response_model=schemas.JobRead)
+async def rebuild_storage_usage(db: AsyncSession = Depends(get_db)):
+    job = await db.run_sync(jobs.enqueue, "rebuild_storage_usage", {})
+    await db.commit()
+    await db.refresh(job)
+    return job
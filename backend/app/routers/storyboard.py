@@ -1,16 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException,  File, UploadFile
-from sqlalchemy.orm import Session
-from typing import List
-import shutil
+from fastapi import APIRouter, Depends, HTTPException,  File, UploadFile, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import base64
+import json
 import os
-import uuid
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 
 
 # 引入我们定义好的数据库模型和Pydantic模型
-from .. import models, schemas
-from ..database import get_db # 假设你有一个 get_db 依赖项
+from .. import file_gc, models, ordering, revisions, schemas
+from ..database import get_db, get_read_db # 假设你有一个 get_db 依赖项
+from ..utils import blob_store, file_serving, storyboard_batch, tree_json
+from ..utils.response_cache import cached_json
 
 router = APIRouter(
     prefix="/storyboard",  # 👈 修改这里：从 "/script" 改为 "/storyboard"
@@ -19,35 +24,182 @@ router = APIRouter(
 
 VIDEO_DIR = "user_projects/videos"
 
-# 1. 获取项目的剧本结构
+# 1. 获取项目的剧本结构（完整树）
+# 每层一条按列投影的查询，直接拼成 EpisodeRead 结构编码（utils/tree_json.py），不建 ORM 对象、不逐个校验
+# 带 If-None-Match 且项目修订号没变时直接 304；序列化结果放进响应缓存，写入提交后失效
+
 @router.get("/project/{project_id}", response_model=List[schemas.EpisodeRead])
-def get_full_script(project_id: int, db: Session = Depends(get_db)):
-    episodes = db.query(models.Episode)\
-                 .options(
-                     joinedload(models.Episode.scenes).joinedload(models.Scene.shots).joinedload(models.Shot.assets)
-                 )\
-                 .filter(models.Episode.project_id == project_id)\
-                 .order_by(models.Episode.order).all()
-    return episodes
+async def get_full_script(project_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    not_modified = await revisions.check_not_modified(request, response, db, project_id)
+    if not_modified is not None:
+        return not_modified
+
+    async def build():
+        return tree_json.dumps(await db.run_sync(tree_json.script_tree, project_id))
+
+    return await cached_json(project_id, "script", "full", build, response=response)
+
+# =======================
+# 分层加载接口：骨架 -> 按场/集分页加载镜头
+# =======================
+
+SHOT_PAGE_DEFAULT = 100
+SHOT_PAGE_MAX = 500
+ASSET_MODES = ("all", "selected", "none")
+
+def _encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+def _decode_cursor(cursor: str, size: int):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+async def _shot_page(db: AsyncSession, stmt, sort_keys, cursor: Optional[str], limit: int, assets: str):
+    """
+    游标分页：按 sort_keys 做 keyset 比较（row value >），多取一条判断是否还有下一页
+    """
+    if assets not in ASSET_MODES:
+        raise HTTPException(status_code=400, detail=f"assets must be one of {ASSET_MODES}")
+    if cursor:
+        stmt = stmt.where(tuple_(*sort_keys) > tuple_(*_decode_cursor(cursor, len(sort_keys))))
+    stmt = stmt.add_columns(*sort_keys).order_by(*sort_keys).limit(limit + 1)
+    if assets == "all":
+        stmt = stmt.options(selectinload(models.Shot.assets))
+
+    rows = (await db.execute(stmt)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    shots = [row[0] for row in rows]
+
+    if assets == "selected":
+        # 只加载每个镜头选中的那一张，一条 IN 查询
+        selected_ids = [s.selected_asset_id for s in shots if s.selected_asset_id]
+        by_id = {}
+        if selected_ids:
+            selected = await db.execute(select(models.Asset).where(models.Asset.id.in_(selected_ids)))
+            by_id = {a.id: a for a in selected.scalars()}
+        for shot in shots:
+            chosen = by_id.get(shot.selected_asset_id)
+            set_committed_value(shot, "assets", [chosen] if chosen else [])
+    elif assets == "none":
+        for shot in shots:
+            set_committed_value(shot, "assets", [])
+
+    next_cursor = _encode_cursor(rows[-1][1:]) if has_more and rows else None
+    return {"items": shots, "next_cursor": next_cursor}
+
+@router.get("/project/{project_id}/skeleton", response_model=List[schemas.EpisodeSkeleton])
+async def get_script_skeleton(project_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    """只返回 集 -> 场 骨架和每场镜头数，不带镜头与素材"""
+    not_modified = await revisions.check_not_modified(request, response, db, project_id)
+    if not_modified is not None:
+        return not_modified
+    episodes = (await db.execute(
+        select(models.Episode)
+        .options(selectinload(models.Episode.scenes))
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Episode.sort_key, models.Episode.id)
+    )).scalars().all()
+
+    scene_ids = [scene.id for ep in episodes for scene in ep.scenes]
+    counts = {}
+    if scene_ids:
+        counts = dict((await db.execute(
+            select(models.Shot.scene_id, func.count(models.Shot.id))
+            .where(models.Shot.scene_id.in_(scene_ids))
+            .group_by(models.Shot.scene_id)
+        )).all())
+
+    return [
+        {
+            "id": ep.id,
+            "title": ep.title,
+            "order": ep.order,
+            "sort_key": ep.sort_key,
+            "scenes": [
+                {
+                    "id": scene.id,
+                    "title": scene.title,
+                    "sequence_number": scene.sequence_number,
+                    "sort_key": scene.sort_key,
+                    "shot_count": counts.get(scene.id, 0),
+                }
+                for scene in ep.scenes  # 关系上已按 sort_key 排序
+            ],
+        }
+        for ep in episodes
+    ]
+
+@router.get("/project/{project_id}/changes", response_model=schemas.ChangeSet)
+async def get_project_changes(project_id: int, since: int = Query(default=0, ge=0), db: AsyncSession = Depends(get_read_db)):
+    """
+    增量同步：返回修订号 since 之后新增/修改/删除的行
+    客户端保存返回的 revision，下次带上它；reset=true 时整树重新拉取
+    """
+    revision = await revisions.current_revision(db, project_id)
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if since > revision:
+        return {"project_id": project_id, "since": since, "revision": revision, "reset": True}
+    if since == revision:
+        return {"project_id": project_id, "since": since, "revision": revision}
+    changes = await db.run_sync(revisions.changes_since, project_id, since)
+    return {"project_id": project_id, "since": since, "revision": revision, **changes}
+
+@router.get("/scene/{scene_id}/shots", response_model=schemas.ShotPage)
+async def get_scene_shots(
+    scene_id: int,
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=SHOT_PAGE_DEFAULT, ge=1, le=SHOT_PAGE_MAX),
+    assets: str = Query(default="all"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    sort_keys = (func.coalesce(models.Shot.sort_key, 0), models.Shot.id)
+    stmt = select(models.Shot).where(models.Shot.scene_id == scene_id)
+    return await _shot_page(db, stmt, sort_keys, cursor, limit, assets)
+
+@router.get("/episode/{episode_id}/shots", response_model=schemas.ShotPage)
+async def get_episode_shots(
+    episode_id: int,
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=SHOT_PAGE_DEFAULT, ge=1, le=SHOT_PAGE_MAX),
+    assets: str = Query(default="all"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """整集镜头按 场顺序 -> 镜头顺序 连续分页，用 scene_id 区分归属"""
+    sort_keys = (
+        func.coalesce(models.Scene.sort_key, 0),
+        models.Scene.id,
+        func.coalesce(models.Shot.sort_key, 0),
+        models.Shot.id,
+    )
+    stmt = select(models.Shot).join(models.Scene, models.Shot.scene_id == models.Scene.id)\
+                              .where(models.Scene.episode_id == episode_id)
+    return await _shot_page(db, stmt, sort_keys, cursor, limit, assets)
 
 # 2. 创建集
 @router.post("/project/{project_id}/episode", response_model=schemas.EpisodeRead)
-def create_episode(project_id: int, episode: schemas.EpisodeCreate, db: Session = Depends(get_db)):
+async def create_episode(project_id: int, episode: schemas.EpisodeCreate, db: AsyncSession = Depends(get_db)):
     db_ep = models.Episode(**episode.dict(), project_id=project_id)
     db.add(db_ep)
-    db.commit()
-    db.refresh(db_ep)
+    await db.commit()
+    await db.refresh(db_ep, ["scenes"])
     return db_ep
 
 # 3. 创建场
 @router.post("/episode/{episode_id}/scene", response_model=schemas.SceneRead)
-def create_scene(episode_id: int, scene: schemas.SceneCreate, db: Session = Depends(get_db)):
+async def create_scene(episode_id: int, scene: schemas.SceneCreate, db: AsyncSession = Depends(get_db)):
+    # sequence_number 只是显示用的场号；排序键由 ordering 在 flush 时追加到末尾
     if scene.sequence_number is None:
-        last_scene = db.query(models.Scene)\
-            .filter(models.Scene.episode_id == episode_id)\
-            .order_by(models.Scene.sequence_number.desc())\
-            .first()
-        new_seq = (last_scene.sequence_number + 1) if last_scene else 1
+        last_seq = (await db.execute(
+            select(func.max(models.Scene.sequence_number)).where(models.Scene.episode_id == episode_id)
+        )).scalar()
+        new_seq = (last_seq or 0) + 1
     else:
         new_seq = scene.sequence_number
 
@@ -57,27 +209,41 @@ def create_scene(episode_id: int, scene: schemas.SceneCreate, db: Session = Depe
 
     db_scene = models.Scene(episode_id=episode_id, sequence_number=new_seq, title=new_title)
     db.add(db_scene)
-    db.commit()
-    db.refresh(db_scene)
+    await db.commit()
+    await db.refresh(db_scene, ["shots"])
     return db_scene
 
+async def _load_scene(db: AsyncSession, scene_id: int):
+    """SceneRead 带镜头与素材，异步会话里不能懒加载，统一预加载"""
+    result = await db.execute(
+        select(models.Scene)
+        .options(selectinload(models.Scene.shots).selectinload(models.Shot.assets))
+        .where(models.Scene.id == scene_id)
+    )
+    return result.scalar_one_or_none()
+
+async def _load_shot(db: AsyncSession, shot_id: int):
+    result = await db.execute(
+        select(models.Shot).options(selectinload(models.Shot.assets)).where(models.Shot.id == shot_id)
+    )
+    return result.scalar_one_or_none()
+
 @router.patch("/scene/{scene_id}", response_model=schemas.SceneRead)
-def update_scene(scene_id: int, scene_update: schemas.SceneUpdate, db: Session = Depends(get_db)):
-    db_scene = db.query(models.Scene).filter(models.Scene.id == scene_id).first()
+async def update_scene(scene_id: int, scene_update: schemas.SceneUpdate, db: AsyncSession = Depends(get_db)):
+    db_scene = await _load_scene(db, scene_id)
     if not db_scene:
         raise HTTPException(status_code=404, detail="Scene not found")
     
     if scene_update.title is not None:
         db_scene.title = scene_update.title
         
-    db.commit()
-    db.refresh(db_scene)
+    await db.commit()
     return db_scene
     
 # 4. 镜头管理
 @router.patch("/shot/{shot_id}", response_model=schemas.ShotRead)
-def update_shot(shot_id: int, shot_update: schemas.ShotUpdate, db: Session = Depends(get_db)):
-    db_shot = db.query(models.Shot).filter(models.Shot.id == shot_id).first()
+async def update_shot(shot_id: int, shot_update: schemas.ShotUpdate, db: AsyncSession = Depends(get_db)):
+    db_shot = await _load_shot(db, shot_id)
     if not db_shot:
         raise HTTPException(status_code=404, detail="Shot not found")
     
@@ -85,120 +251,162 @@ def update_shot(shot_id: int, shot_update: schemas.ShotUpdate, db: Session = Dep
     for key, value in update_data.items():
         setattr(db_shot, key, value)
     
-    db.commit()
-    db.refresh(db_shot)
+    await db.commit()
     return db_shot
 
 @router.post("/scene/{scene_id}/shot", response_model=schemas.ShotRead)
-def create_shot(scene_id: int, shot: schemas.ShotCreate, db: Session = Depends(get_db)):
+async def create_shot(scene_id: int, shot: schemas.ShotCreate, db: AsyncSession = Depends(get_db)):
     db_shot = models.Shot(**shot.dict(), scene_id=scene_id)
     db.add(db_shot)
-    db.commit()
-    db.refresh(db_shot)
+    await db.commit()
+    await db.refresh(db_shot, ["assets"])
     return db_shot
 
+# 5. 排序/移动：稀疏排序键取相邻两行中点，只改被移动的一行（换父级也是同一条 UPDATE）
+async def _move(db: AsyncSession, entity: str, obj, parent_id: int, project_id: int, move: schemas.MoveRequest):
+    parent_table = {"scene": "episodes", "shot": "scenes"}.get(entity)
+    if parent_table and move.parent_id is not None and move.parent_id != parent_id:
+        # 只能在同一项目内移动
+        target_project = await db.run_sync(lambda s: revisions.project_id_for(s.connection(), parent_table, move.parent_id))
+        if target_project is None:
+            raise HTTPException(status_code=404, detail="Target parent not found")
+        if target_project != project_id:
+            raise HTTPException(status_code=400, detail="Cannot move across projects")
+        parent_id = move.parent_id
+    try:
+        await db.run_sync(ordering.place, entity, obj, parent_id, move.before_id, move.after_id)
+    except ordering.OrderingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+
+@router.post("/episode/{episode_id}/move", response_model=schemas.EpisodeRead)
+async def move_episode(episode_id: int, move: schemas.MoveRequest, db: AsyncSession = Depends(get_db)):
+    db_ep = await db.get(models.Episode, episode_id)
+    if not db_ep:
+        raise HTTPException(status_code=404, detail="Episode not found")
+    if move.parent_id is not None and move.parent_id != db_ep.project_id:
+        raise HTTPException(status_code=400, detail="Episodes cannot change project")
+    await _move(db, "episode", db_ep, db_ep.project_id, db_ep.project_id, move)
+    result = await db.execute(
+        select(models.Episode)
+        .options(selectinload(models.Episode.scenes).selectinload(models.Scene.shots).selectinload(models.Shot.assets))
+        .where(models.Episode.id == episode_id)
+    )
+    return result.scalar_one()
+
+@router.post("/scene/{scene_id}/move", response_model=schemas.SceneRead)
+async def move_scene(scene_id: int, move: schemas.MoveRequest, db: AsyncSession = Depends(get_db)):
+    db_scene = await db.get(models.Scene, scene_id)
+    if not db_scene:
+        raise HTTPException(status_code=404, detail="Scene not found")
+    project_id = await db.run_sync(lambda s: revisions.project_id_for(s.connection(), "scenes", scene_id))
+    await _move(db, "scene", db_scene, db_scene.episode_id, project_id, move)
+    return await _load_scene(db, scene_id)
+
+@router.post("/shot/{shot_id}/move", response_model=schemas.ShotRead)
+async def move_shot(shot_id: int, move: schemas.MoveRequest, db: AsyncSession = Depends(get_db)):
+    db_shot = await db.get(models.Shot, shot_id)
+    if not db_shot:
+        raise HTTPException(status_code=404, detail="Shot not found")
+    project_id = await db.run_sync(lambda s: revisions.project_id_for(s.connection(), "shots", shot_id))
+    await _move(db, "shot", db_shot, db_shot.scene_id, project_id, move)
+    return await _load_shot(db, shot_id)
+
+# 6. 批量编辑：一批 create/update/delete/move 一个事务提交，失败整批回滚
+@router.post("/project/{project_id}/batch", response_model=schemas.BatchResult)
+async def batch_edit(project_id: int, batch: schemas.BatchRequest, db: AsyncSession = Depends(get_db)):
+    if len(batch.ops) > storyboard_batch.BATCH_MAX_OPS:
+        raise HTTPException(status_code=400, detail=f"At most {storyboard_batch.BATCH_MAX_OPS} ops per batch")
+    try:
+        created = await db.run_sync(storyboard_batch.apply_batch, project_id, batch.ops)
+        await db.commit()
+    except storyboard_batch.BatchError as e:
+        await db.rollback()
+        raise HTTPException(status_code=e.status_code, detail={"index": e.index, "error": e.message})
+    return {
+        "applied": len(batch.ops),
+        "created": created,
+        "revision": await revisions.current_revision(db, project_id),
+    }
+
 # =======================
 # 删除接口 (包含物理文件清理)
 # =======================
 
+async def _project_name_for_episode(db: AsyncSession, episode_id: int):
+    return (await db.execute(
+        select(models.Project.name)
+        .join(models.Episode, models.Episode.project_id == models.Project.id)
+        .where(models.Episode.id == episode_id)
+    )).scalar()
+
 @router.delete("/episode/{episode_id}")
-def delete_episode(episode_id: int, db: Session = Depends(get_db)):
-    db_ep = db.query(models.Episode).filter(models.Episode.id == episode_id).first()
+async def delete_episode(episode_id: int, db: AsyncSession = Depends(get_db)):
+    db_ep = await db.get(models.Episode, episode_id)
     if not db_ep:
         raise HTTPException(status_code=404, detail="Episode not found")
-    db.delete(db_ep)
-    db.commit()
+    project_name = await _project_name_for_episode(db, episode_id)
+
+    # 素材行随镜头删除；文件（blob 引用、视频、集目录）只登记墓碑，后台清扫
+    shot_ids = (await db.execute(
+        select(models.Shot.id).join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .where(models.Scene.episode_id == episode_id)
+    )).scalars().all()
+    await db.run_sync(file_gc.discard_shots, shot_ids)
+    if project_name:
+        await db.run_sync(file_gc.tombstone_path, f"{project_name}/storyboard/episode_{episode_id}")
+
+    await db.delete(db_ep)
+    await db.commit()
     return {"message": "Episode deleted"}
 
 @router.delete("/scene/{scene_id}")
-def delete_scene(scene_id: int, db: Session = Depends(get_db)):
-    db_scene = db.query(models.Scene).filter(models.Scene.id == scene_id).first()
+async def delete_scene(scene_id: int, db: AsyncSession = Depends(get_db)):
+    db_scene = await db.get(models.Scene, scene_id)
     if not db_scene:
         raise HTTPException(status_code=404, detail="Scene not found")
-    
-    # 2. 物理删除逻辑
-    project_name = None
-    episode_id = None
-    try:
-        project_name = db_scene.episode.project.name
-        episode_id = db_scene.episode.id
-    except Exception:
-        pass
+    episode_id = db_scene.episode_id
+    project_name = await _project_name_for_episode(db, episode_id)
+
+    # 素材行随镜头删除；文件（blob 引用、视频）只登记墓碑，后台清扫
+    shot_ids = (await db.execute(select(models.Shot.id).where(models.Shot.scene_id == scene_id))).scalars().all()
+    await db.run_sync(file_gc.discard_shots, shot_ids)
 
-    # 删除对应场次的文件夹：data/{project}/storyboard/episode_{id}/scene_{id}
+    # 场次文件夹（视频及历史素材）：data/{project}/storyboard/episode_{id}/scene_{id}
     if project_name and episode_id:
-        base_data_dir = os.path.join(os.getcwd(), "data")
-        scene_dir = os.path.join(
-            base_data_dir,
-            project_name,
-            "storyboard",
-            f"episode_{episode_id}",
-            f"scene_{scene_id}",
-        )
-        if os.path.exists(scene_dir):
-            try:
-                shutil.rmtree(scene_dir)
-                print(f"[Delete] Removed scene folder: {scene_dir}")
-            except Exception as e:
-                print(f"[Delete] Failed to remove scene folder {scene_dir}: {e}")
-
-    db.delete(db_scene)
-    db.commit()
+        await db.run_sync(file_gc.tombstone_path, f"{project_name}/storyboard/episode_{episode_id}/scene_{scene_id}")
+
+    await db.delete(db_scene)
+    await db.commit()
     return {"message": "Scene deleted"}
 
 @router.delete("/shot/{shot_id}")
-def delete_shot(shot_id: int, db: Session = Depends(get_db)):
-    # 1. 查询镜头 (预加载 assets 以便删除文件)
-    db_shot = db.query(models.Shot).options(joinedload(models.Shot.assets)).filter(models.Shot.id == shot_id).first()
-    
+async def delete_shot(shot_id: int, db: AsyncSession = Depends(get_db)):
+    db_shot = await db.get(models.Shot, shot_id)
     if not db_shot:
         raise HTTPException(status_code=404, detail="Shot not found")
-    
-    # 2. 物理删除逻辑
-    base_data_dir = os.path.join(os.getcwd(), "data")
-
-    # A. 删除 Asset 文件 (图片/文档)
-    if db_shot.assets:
-        for asset in db_shot.assets:
-            if asset.file_path:
-                # 拼接完整路径。注意：file_path 是相对路径 "Project/storyboard/..."
-                file_full_path = os.path.join(base_data_dir, asset.file_path)
-                try:
-                    if os.path.exists(file_full_path):
-                        os.remove(file_full_path)
-                        print(f"[Delete] Removed asset file: {file_full_path}")
-                except Exception as e:
-                    print(f"[Error] Failed to remove asset file {file_full_path}: {e}")
-
-    # B. 删除视频文件 (Video)
-    if db_shot.video_path:
-        video_full_path = os.path.join(base_data_dir, db_shot.video_path)
-        try:
-            if os.path.exists(video_full_path):
-                os.remove(video_full_path)
-                print(f"[Delete] Removed shot video: {video_full_path}")
-        except Exception as e:
-            print(f"[Error] Failed to remove shot video {video_full_path}: {e}")
-
-    # 3. 数据库删除
-    db.delete(db_shot)
-    db.commit()
+
+    # 素材行一并删除；素材文件（blob 按引用计数）和视频只登记墓碑，后台清扫
+    await db.run_sync(file_gc.discard_shots, [shot_id])
+
+    await db.delete(db_shot)
+    await db.commit()
     return {"message": "Shot and associated files deleted"}
 
 # =======================
 # 上传视频接口
 # =======================
 @router.post("/shot/{shot_id}/video", response_model=schemas.ShotRead)
-def upload_shot_video(shot_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_shot_video(shot_id: int, file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
     # 1. 完整关联查询
-    db_shot = db.query(models.Shot).filter(models.Shot.id == shot_id).first()
+    db_shot = await _load_shot(db, shot_id)
     if not db_shot:
         raise HTTPException(status_code=404, detail="Shot not found")
     
     # 关联对象
-    scene = db.query(models.Scene).filter(models.Scene.id == db_shot.scene_id).first()
-    episode = db.query(models.Episode).filter(models.Episode.id == scene.episode_id).first()
-    project = db.query(models.Project).filter(models.Project.id == episode.project_id).first()
+    scene = await db.get(models.Scene, db_shot.scene_id)
+    episode = await db.get(models.Episode, scene.episode_id)
+    project = await db.get(models.Project, episode.project_id)
     
     project_name = project.name if project else "unknown_project"
 
@@ -212,26 +420,21 @@ def upload_shot_video(shot_id: int, file: UploadFile = File(...), db: Session =
     )
     
     # 绝对路径用于保存
-    DATA_ROOT = os.path.join(os.getcwd(), "data")
-    save_dir = os.path.join(DATA_ROOT, project_name, hierarchy_path)
-    os.makedirs(save_dir, exist_ok=True) 
+    save_dir = os.path.join(blob_store.DATA_ROOT, project_name, hierarchy_path)
 
-    # 3. 保存文件
+    # 3. 保存文件（线程池里拷贝，不阻塞事件循环）
+    # 按内容摘要命名：内容变了 URL 才会变，可以长期缓存
     file_ext = os.path.splitext(file.filename)[1] or ".mp4"
-    # 视频可以使用 uuid 或固定名字 (比如 main_video.mp4)，这里用 uuid 防止浏览器缓存问题
-    new_filename = f"{uuid.uuid4()}{file_ext}"
-    file_abs_path = os.path.join(save_dir, new_filename)
-
-    with open(file_abs_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    new_filename, video_size = await run_in_threadpool(file_serving.save_versioned, file.file, save_dir, file_ext)
 
     # 4. 更新数据库 (存储相对路径)
     relative_path_part = os.path.join(project_name, hierarchy_path, new_filename)
     relative_path = relative_path_part.replace("\\", "/") # 修正分隔符
     
+    await db.run_sync(file_gc.tombstone_replaced, db_shot.video_path, relative_path)  # 旧视频和改行同一个事务登记
     db_shot.video_path = relative_path
+    db_shot.video_size = video_size
     
-    db.commit()
-    db.refresh(db_shot)
+    await db.commit()
     
-    return db_shot
\ No newline at end of file
+    return db_shot
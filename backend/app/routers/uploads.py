@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import file_gc, jobs, models, schemas
+from ..database import get_db, get_read_db
+from ..utils import blob_store
+from .assets import DATA_ROOT, determine_file_type, get_shot_hierarchy
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["Uploads (分片上传)"]
+)
+
+# 未完成的分片先落在 data/ 之外，完成后再移动到正式目录
+UPLOAD_TMP_DIR = os.path.join(os.getcwd(), "cache", "uploads")
+
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+TARGET_TYPES = ("shot_video", "shot_asset", "asset_item")
+
+# upload_id -> (sha256 对象, 已哈希的字节数)
+# 进程重启后丢失也没关系：会从 .part 文件重新计算到已确认的位置
+_hashers = {}
+# upload_id -> asyncio.Lock，同一个上传的分片串行处理
+_locks = {}
+
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_TMP_DIR, f"{upload_id}.part")
+
+
+def _lock_for(upload_id: str) -> asyncio.Lock:
+    lock = _locks.get(upload_id)
+    if lock is None:
+        lock = _locks[upload_id] = asyncio.Lock()
+    return lock
+
+
+def _to_status(session: models.UploadSession) -> schemas.UploadStatus:
+    total_chunks = max(1, -(-session.total_size // session.chunk_size))
+    return schemas.UploadStatus(
+        id=session.id,
+        target_type=session.target_type,
+        target_id=session.target_id,
+        filename=session.filename,
+        total_size=session.total_size,
+        chunk_size=session.chunk_size,
+        total_chunks=total_chunks,
+        received_chunks=session.received_chunks or 0,
+        received_bytes=session.received_bytes or 0,
+        status=session.status,
+        sha256=session.sha256,
+    )
+
+
+async def _get_session(db: AsyncSession, upload_id: str) -> models.UploadSession:
+    session = await db.get(models.UploadSession, upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+def _hash_prefix(path: str, length: int):
+    """重启后重建哈希：把 .part 文件前 length 字节重新过一遍"""
+    h = hashlib.sha256()
+    if length <= 0:
+        return h
+    remaining = length
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(WRITE_BUFFER_SIZE, remaining))
+            if not block:
+                raise IOError("Partial upload file is shorter than acknowledged size")
+            h.update(block)
+            remaining -= len(block)
+    return h
+
+
+async def _get_hasher(session: models.UploadSession):
+    entry = _hashers.get(session.id)
+    received = session.received_bytes or 0
+    if entry is not None and entry[1] == received:
+        return entry[0]
+    h = await run_in_threadpool(_hash_prefix, _part_path(session.id), received)
+    _hashers[session.id] = (h, received)
+    return h
+
+
+def _open_part(path: str, offset: int):
+    # 丢弃上次中断时可能写了一半的分片
+    f = open(path, "r+b" if os.path.exists(path) else "wb")
+    f.seek(offset)
+    f.truncate()
+    return f
+
+
+def _write_block(f, h, block: bytes):
+    f.write(block)
+    h.update(block)
+
+
+def _sync_and_close(f):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+async def _check_target(db: AsyncSession, target_type: str, target_id: int):
+    if target_type not in TARGET_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown target_type: {target_type}")
+    if target_type == "asset_item":
+        target = await db.get(models.Character, target_id)
+        if not target:
+            raise HTTPException(status_code=404, detail="Asset item not found")
+    else:
+        target = await db.get(models.Shot, target_id)
+        if not target:
+            raise HTTPException(status_code=404, detail="Shot not found")
+    return target
+
+
+# 1. 初始化上传
+@router.post("/", response_model=schemas.UploadStatus)
+async def init_upload(data: schemas.UploadInit, db: AsyncSession = Depends(get_db)):
+    await _check_target(db, data.target_type, data.target_id)
+    if data.total_size < 0:
+        raise HTTPException(status_code=400, detail="total_size must be >= 0")
+    if not (MIN_CHUNK_SIZE <= data.chunk_size <= MAX_CHUNK_SIZE):
+        raise HTTPException(status_code=400, detail=f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE}")
+
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    session = models.UploadSession(
+        id=uuid.uuid4().hex,
+        target_type=data.target_type,
+        target_id=data.target_id,
+        filename=os.path.basename(data.filename),
+        content_type=data.content_type,
+        total_size=data.total_size,
+        chunk_size=data.chunk_size,
+        received_chunks=0,
+        received_bytes=0,
+        status="uploading",
+    )
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+    return _to_status(session)
+
+
+# 2. 查询进度（断点续传时客户端从 received_chunks 继续）
+@router.get("/{upload_id}", response_model=schemas.UploadStatus)
+async def get_upload(upload_id: str, db: AsyncSession = Depends(get_read_db)):
+    return _to_status(await _get_session(db, upload_id))
+
+
+# 3. 上传第 N 个分片（请求体为原始字节）
+@router.put("/{upload_id}/chunks/{index}", response_model=schemas.UploadStatus)
+async def put_chunk(upload_id: str, index: int, request: Request, db: AsyncSession = Depends(get_db)):
+    async with _lock_for(upload_id):
+        session = await _get_session(db, upload_id)
+        if session.status != "uploading":
+            raise HTTPException(status_code=409, detail="Upload already completed")
+        if index < session.received_chunks:
+            # 重试已确认的分片：幂等返回当前进度
+            return _to_status(session)
+        if index > session.received_chunks:
+            raise HTTPException(status_code=409, detail=f"Expected chunk {session.received_chunks}")
+
+        offset = index * session.chunk_size
+        expected = min(session.chunk_size, session.total_size - offset)
+        if expected <= 0:
+            raise HTTPException(status_code=400, detail="Chunk index out of range")
+
+        # 在副本上累积哈希，分片中途断开时不会污染已确认的状态
+        h = (await _get_hasher(session)).copy()
+        f = await run_in_threadpool(_open_part, _part_path(upload_id), offset)
+        written = 0
+        buffer = bytearray()
+        try:
+            async for piece in request.stream():
+                written += len(piece)
+                if written > expected:
+                    raise HTTPException(status_code=400, detail=f"Chunk larger than expected {expected} bytes")
+                buffer += piece
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await run_in_threadpool(_write_block, f, h, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_in_threadpool(_write_block, f, h, bytes(buffer))
+            await run_in_threadpool(_sync_and_close, f)
+        finally:
+            if not f.closed:
+                f.close()
+
+        if written != expected:
+            raise HTTPException(status_code=400, detail=f"Incomplete chunk: got {written}, expected {expected} bytes")
+
+        _hashers[upload_id] = (h, offset + written)
+        session.received_chunks = index + 1
+        session.received_bytes = offset + written
+        await db.commit()
+        return _to_status(session)
+
+
+def _move_into(src_path: str, save_dir: str, filename: str):
+    os.makedirs(save_dir, exist_ok=True)
+    shutil.move(src_path, os.path.join(save_dir, filename))
+
+
+async def _attach_upload(db: AsyncSession, session: models.UploadSession, digest: str):
+    """把完成的文件移动到正式目录（视频）或 blob 存储（资产），并挂到 Shot / Asset 上"""
+    part_path = _part_path(session.id)
+    if not os.path.exists(part_path):
+        # 0 字节文件不会有任何分片
+        open(part_path, "wb").close()
+    target = await _check_target(db, session.target_type, session.target_id)
+    file_type = determine_file_type(session.content_type, session.filename)
+
+    if session.target_type == "shot_video":
+        project_name, shot_path = await get_shot_hierarchy(db, target)
+        relative_dir = os.path.join(project_name, shot_path, "video")
+        # 视频用内容摘要命名：内容变了 URL 才会变
+        filename = f"{digest[:16]}{os.path.splitext(session.filename)[1] or '.mp4'}"
+        # 跨盘时 move 会退化成拷贝，放到线程池
+        await run_in_threadpool(_move_into, part_path, os.path.join(DATA_ROOT, relative_dir), filename)
+        video_path = os.path.join(relative_dir, filename).replace("\\", "/")
+        await db.run_sync(file_gc.tombstone_replaced, target.video_path, video_path)  # 旧视频随本次提交登记墓碑
+        target.video_path = video_path
+        target.video_size = session.total_size
+        return None, target
+
+    # 图片/文档类资产进内容寻址存储
+    blob = await db.run_sync(blob_store.store_hashed_file, part_path, digest, session.total_size, session.filename)
+    db_asset = models.Asset(
+        character_id=target.id if session.target_type == "asset_item" else None,
+        shot_id=target.id if session.target_type == "shot_asset" else None,
+        file_path=blob.file_path,
+        file_type=file_type,
+        meta_data={},
+        is_favorite=session.target_type == "asset_item",
+        blob_sha256=blob.sha256,
+        original_filename=session.filename,
+        file_size=blob.size,
+    )
+    db.add(db_asset)
+    if file_type == "image":
+        await db.run_sync(jobs.enqueue_metadata_extraction, db_asset)
+    return db_asset, None
+
+
+# 4. 完成上传：校验大小与摘要后再挂到目标行
+@router.post("/{upload_id}/complete", response_model=schemas.UploadCompleteRead)
+async def complete_upload(upload_id: str, data: schemas.UploadComplete, db: AsyncSession = Depends(get_db)):
+    async with _lock_for(upload_id):
+        session = await _get_session(db, upload_id)
+        if session.status != "uploading":
+            raise HTTPException(status_code=409, detail="Upload already completed")
+        if session.received_bytes != session.total_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Upload incomplete: {session.received_bytes}/{session.total_size} bytes",
+            )
+
+        digest = (await _get_hasher(session)).hexdigest()
+        if data.sha256 and data.sha256.lower() != digest:
+            raise HTTPException(status_code=400, detail="SHA-256 mismatch")
+
+        asset, shot = await _attach_upload(db, session, digest)
+        session.status = "completed"
+        session.sha256 = digest
+        await db.commit()
+        if asset is not None:
+            await db.refresh(asset)
+        if shot is not None:
+            await db.refresh(shot, ["assets"])
+
+        _hashers.pop(upload_id, None)
+        result = schemas.UploadCompleteRead(
+            upload=_to_status(session),
+            asset=schemas.AssetRead.model_validate(asset) if asset is not None else None,
+            shot=schemas.ShotRead.model_validate(shot) if shot is not None else None,
+        )
+    _locks.pop(upload_id, None)
+    return result
+
+
+# 5. 放弃上传
+@router.delete("/{upload_id}")
+async def abort_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    async with _lock_for(upload_id):
+        session = await _get_session(db, upload_id)
+        part_path = _part_path(upload_id)
+        if os.path.exists(part_path):
+            await run_in_threadpool(os.remove, part_path)
+        await db.delete(session)
+        await db.commit()
+        _hashers.pop(upload_id, None)
+    _locks.pop(upload_id, None)
+    return {"message": "Upload aborted"}
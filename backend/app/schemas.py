@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, computed_field
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
+from .utils.file_serving import file_url
 
 # === 基础 Asset & Shot ===
 class AssetBase(BaseModel):
@@ -8,12 +9,19 @@ class AssetBase(BaseModel):
     file_type: str
     meta_data: Optional[dict] = None 
     is_favorite: bool = False
+    original_filename: Optional[str] = None
     
 class AssetRead(AssetBase):
     id: int
     created_at: datetime
     class Config: from_attributes = True
 
+    @computed_field
+    @property
+    def file_url(self) -> Optional[str]:
+        """带版本的 /files 地址，可长期缓存"""
+        return file_url(self.file_path)
+
 class AssetItemRead(BaseModel):
     id: int
     name: str
@@ -41,12 +49,19 @@ class ShotBase(BaseModel):
 
 class ShotRead(ShotBase):
     id: int
+    scene_id: Optional[int] = None
     assets: List[AssetRead] = [] 
     selected_asset_id: Optional[int] = None
     video_path: Optional[str] = None
+    sort_key: Optional[float] = None
 
     class Config: from_attributes = True
 
+    @computed_field
+    @property
+    def video_url(self) -> Optional[str]:
+        return file_url(self.video_path)
+
 class ShotCreate(ShotBase): pass
 class ShotUpdate(BaseModel):
     title: Optional[str] = None
@@ -62,6 +77,7 @@ class SceneRead(BaseModel):
     id: int
     title: Optional[str] = None
     sequence_number: Optional[int] = None
+    sort_key: Optional[float] = None
     shots: List[ShotRead] = []
     class Config: from_attributes = True
 
@@ -76,13 +92,69 @@ class EpisodeRead(BaseModel):
     id: int
     title: str
     order: int
+    sort_key: Optional[float] = None
     scenes: List[SceneRead] = []
     class Config: from_attributes = True
 
+# === 分层加载：先返回骨架，再按场/集分页加载镜头 ===
+class SceneSkeleton(BaseModel):
+    id: int
+    title: Optional[str] = None
+    sequence_number: Optional[int] = None
+    sort_key: Optional[float] = None
+    shot_count: int = 0
+
+class EpisodeSkeleton(BaseModel):
+    id: int
+    title: str
+    order: int
+    sort_key: Optional[float] = None
+    scenes: List[SceneSkeleton] = []
+
+class ShotPage(BaseModel):
+    items: List[ShotRead] = []
+    next_cursor: Optional[str] = None  # 为空表示已经到底
+
+class ChangeSet(BaseModel):
+    project_id: int
+    since: int
+    revision: int  # 客户端下次用它作为 since
+    reset: bool = False  # since 比服务端还新（库被重建等），客户端应整树重新拉取
+    upserted: Dict[str, List[Dict[str, Any]]] = {}  # 表名 -> 当前完整行
+    deleted: Dict[str, List[int]] = {}  # 表名 -> 被删除的 id
+
 class EpisodeCreate(BaseModel):
     title: str
     order: int = 0
 
+class EpisodeUpdate(BaseModel):
+    title: Optional[str] = None
+    order: Optional[int] = None
+
+# 排序/移动：放到 before_id 之前或 after_id 之后（都不给就放末尾），只改被移动的一行
+class MoveRequest(BaseModel):
+    parent_id: Optional[int] = None  # 换父级：场 -> 目标集 id，镜头 -> 目标场 id；不给表示原父级内排序
+    before_id: Optional[int] = None
+    after_id: Optional[int] = None
+
+# --- 剧本批量编辑（一个事务内按顺序执行）---
+class BatchOp(BaseModel):
+    op: str  # "create" / "update" / "delete" / "move"
+    entity: str  # "episode" / "scene" / "shot"
+    id: Optional[Union[int, str]] = None  # 已有行的 id，或本批次前面 create 的 ref
+    ref: Optional[str] = None  # create 时客户端自定的临时 id，响应里映射成真实 id
+    parent_id: Optional[Union[int, str]] = None  # create/move：场 -> 集 id，镜头 -> 场 id（也可以是 ref）
+    position: Optional[int] = None  # move：新的 sequence_number（集为 order），同时把行排到父级第 position 位（从 1 开始）
+    data: Dict[str, Any] = {}  # create/update 的字段，校验规则同单条接口
+
+class BatchRequest(BaseModel):
+    ops: List[BatchOp]
+
+class BatchResult(BaseModel):
+    applied: int
+    created: Dict[str, int] = {}  # ref -> 新行 id
+    revision: int  # 提交后的项目修订号
+
 # === 事件系统 (Event) ===
 # --- Pydantic 模型 (建议加到 schemas.py) ---
 class EventNodeUpdate(BaseModel):
@@ -96,6 +168,26 @@ class EventNodeRead(BaseModel):
     description: str
     class Config: from_attributes = True
 
+# --- 批量写节点：一条 INSERT ... ON CONFLICT DO UPDATE + 一条 DELETE ---
+class EventNodeKey(BaseModel):
+    event_id: int
+    target_type: str # "episode", "scene", "shot"
+    target_id: int
+
+class EventNodeBulkItem(EventNodeKey):
+    description: str
+
+class EventNodeBulk(BaseModel):
+    upserts: List[EventNodeBulkItem] = []
+    deletes: List[EventNodeKey] = []
+
+class EventNodeBulkRead(EventNodeRead):
+    event_id: int
+
+class EventNodeBulkResult(BaseModel):
+    upserted: List[EventNodeBulkRead] = []
+    deleted: List[int] = []  # 被删除的节点 id（本来就不存在的不会出现）
+
 class EventRead(BaseModel):
     id: int
     name: str
@@ -123,3 +215,159 @@ class ProjectBase(BaseModel):
     name: str
     description: Optional[str] = None
     class Config: from_attributes = True
+
+class ProjectImportResult(BaseModel):
+    project_id: int
+    name: str
+    counts: Dict[str, int]  # 表名 -> 导入行数
+    files: int  # 落盘的文件数（素材按路径去重）
+    missing_files: int  # 归档里没带文件的素材数（路径已清空）
+
+# === 分片上传 ===
+class UploadInit(BaseModel):
+    target_type: str  # "shot_video" / "shot_asset" / "asset_item"
+    target_id: int
+    filename: str
+    total_size: int
+    content_type: Optional[str] = None
+    chunk_size: int = 8 * 1024 * 1024
+
+class UploadStatus(BaseModel):
+    id: str
+    target_type: str
+    target_id: int
+    filename: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: int  # 即下一个应上传的分片号
+    received_bytes: int
+    status: str
+    sha256: Optional[str] = None
+
+class UploadComplete(BaseModel):
+    sha256: Optional[str] = None  # 客户端可选携带，用于校验
+
+class UploadCompleteRead(BaseModel):
+    upload: UploadStatus
+    asset: Optional[AssetRead] = None
+    shot: Optional[ShotRead] = None
+
+# === 批量导入 ===
+class IngestDirectoryRequest(BaseModel):
+    directory: str  # 服务器本地目录
+    recursive: bool = True
+
+class IngestStatus(BaseModel):
+    id: str
+    shot_id: int
+    status: str  # staging / processing / done / failed
+    total: int
+    stored: int
+    extracted: int
+    inserted: int
+    asset_ids: List[int] = []
+    error: Optional[str] = None
+
+# === 全文检索 ===
+class SearchBreadcrumb(BaseModel):
+    type: str  # episode / scene / shot / asset_item / asset
+    id: int
+    title: Optional[str] = None
+
+class SearchHit(BaseModel):
+    kind: str  # shot / asset_item / asset
+    id: int
+    score: float  # 越大越相关（只有短词时都是 0）
+    snippet: Optional[str] = None  # 命中处用【】标出
+    breadcrumbs: List[SearchBreadcrumb] = []
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_offset: Optional[int] = None
+
+# === 提示词近似去重 ===
+class NearDuplicateMember(BaseModel):
+    asset_id: int
+    shot_id: Optional[int] = None
+    asset_item_id: Optional[int] = None
+    file_path: Optional[str] = None
+    is_favorite: bool = False
+    prompt: Optional[str] = None
+    similarity: float  # 与保留项（或查询素材）的估计 Jaccard 相似度
+
+class NearDuplicateCluster(BaseModel):
+    keep_id: int  # 建议保留的一张：收藏优先，其次最新
+    size: int
+    members: List[NearDuplicateMember]  # 第一项就是保留项
+
+class NearDuplicateClusters(BaseModel):
+    project_id: int
+    pending: int  # 有提示词但签名还没算出的素材数（后台任务补算中，暂不参与比对）
+    total_clusters: int
+    clusters: List[NearDuplicateCluster]
+
+class AssetPruneRequest(BaseModel):
+    asset_ids: List[int]
+
+class AssetPruneResult(BaseModel):
+    deleted: List[int]
+
+# === 相似图片 ===
+class SimilarImage(BaseModel):
+    asset_id: int
+    shot_id: Optional[int] = None
+    asset_item_id: Optional[int] = None
+    file_path: Optional[str] = None
+    original_filename: Optional[str] = None
+    distance: int  # dHash 汉明距离，0 = 视觉上一致
+
+class ImageCheckResult(BaseModel):
+    phash: str  # 16 位十六进制
+    matches: List[SimilarImage]
+
+# === 文件回收 ===
+class GcStatus(BaseModel):
+    pending_tombstones: int
+    oldest_tombstone_at: Optional[datetime] = None
+    unreferenced_blobs: int  # ref_count 已归零、等待清扫的 blob
+
+# === 存储统计 ===
+class StorageTotals(BaseModel):
+    bytes: int
+    files: int
+
+class CategoryStorage(StorageTotals):
+    category: str  # 资产条目的落盘目录名；镜头素材和视频统一记为 storyboard
+
+class SceneStorage(StorageTotals):
+    id: int
+    title: str
+
+class EpisodeStorage(StorageTotals):
+    id: int
+    title: str
+    scenes: List[SceneStorage]
+
+class ProjectStorage(StorageTotals):
+    project_id: int
+    categories: List[CategoryStorage]
+    episodes: List[EpisodeStorage]
+
+class ProjectStorageSummary(StorageTotals):
+    project_id: int
+    name: str
+
+# === 后台任务 ===
+class JobRead(BaseModel):
+    id: int
+    kind: str
+    payload: Optional[dict] = None
+    status: str
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    class Config: from_attributes = True
@@ -0,0 +1,156 @@
+# backend/app/storage_usage.py
+# 按项目 / 分类 / 集 / 场统计占用（字节数 + 文件数），不用走 data/ 目录
+# - storage_usage 表只存叶子（场、资产条目），由触发器在素材 / 镜头写入的同一事务里增减（migrations.m010）
+# - 集、项目、分类在查询时由叶子聚合：移动场次、改资产条目分类都不用改统计
+# - 口径是“引用量”：同一个 blob 被多个素材引用时每个都计一次（删掉这些素材能腾出的空间要看 blob 是否还有别的引用）
+# - 大小来自 assets.file_size / shots.video_size；修复任务读盘重填这两列后整体重算
+import os
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import and_, bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from . import jobs, models
+from .migrations import rebuild_storage_usage
+from .utils import blob_store
+
+STAT_THREADS = 16  # NAS 上 stat 延迟高，多线程并发
+STORYBOARD_CATEGORY = "storyboard"  # 镜头素材和视频
+
+
+def file_size(file_path):
+    """相对 data/ 或绝对路径的文件大小；不存在返回 None"""
+    if not file_path:
+        return None
+    full_path = file_path if os.path.isabs(file_path) else os.path.join(blob_store.DATA_ROOT, file_path)
+    try:
+        return os.path.getsize(full_path)
+    except OSError:
+        return None
+
+
+def _category_folder(category: str) -> str:
+    """与 routers.assets.asset_item_folder 一致：分类 -> 落盘目录"""
+    from .routers.assets import CATEGORY_FOLDER_MAP  # 避免循环导入
+
+    category = (category or "persona_visual").lower()
+    if category == "persona":
+        category = "persona_visual"
+    return CATEGORY_FOLDER_MAP.get(category, category)
+
+
+def _usage(owner_type: str, owner_column):
+    return and_(models.StorageUsage.owner_type == owner_type, models.StorageUsage.owner_id == owner_column)
+
+
+def project_usage(db: Session, project_id: int) -> dict:
+    """同步执行（异步路由经 run_sync 调用）；项目不存在返回 None"""
+    if db.get(models.Project, project_id) is None:
+        return None
+    usage = models.StorageUsage
+    scenes = db.execute(
+        select(
+            models.Episode.id.label("episode_id"), models.Episode.title.label("episode_title"),
+            models.Scene.id, models.Scene.title,
+            func.coalesce(usage.bytes, 0).label("bytes"), func.coalesce(usage.files, 0).label("files"),
+        )
+        .select_from(models.Episode)
+        .outerjoin(models.Scene, models.Scene.episode_id == models.Episode.id)
+        .outerjoin(usage, _usage("scene", models.Scene.id))
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Episode.sort_key, models.Episode.id, models.Scene.sort_key, models.Scene.id)
+    ).all()
+    items = db.execute(
+        select(
+            models.Character.category,
+            func.sum(func.coalesce(usage.bytes, 0)), func.sum(func.coalesce(usage.files, 0)),
+        )
+        .outerjoin(usage, _usage("asset_item", models.Character.id))
+        .where(models.Character.project_id == project_id)
+        .group_by(models.Character.category)
+    ).all()
+
+    episodes = {}
+    for row in scenes:
+        episode = episodes.setdefault(row.episode_id, {
+            "id": row.episode_id, "title": row.episode_title, "bytes": 0, "files": 0, "scenes": [],
+        })
+        if row.id is None:  # 还没有场次的集
+            continue
+        episode["scenes"].append({"id": row.id, "title": row.title, "bytes": row.bytes, "files": row.files})
+        episode["bytes"] += row.bytes
+        episode["files"] += row.files
+
+    categories = {}
+    storyboard = {"bytes": sum(e["bytes"] for e in episodes.values()), "files": sum(e["files"] for e in episodes.values())}
+    if storyboard["files"]:
+        categories[STORYBOARD_CATEGORY] = storyboard
+    for category, size, count in items:
+        folder = categories.setdefault(_category_folder(category), {"bytes": 0, "files": 0})
+        folder["bytes"] += size or 0
+        folder["files"] += count or 0
+
+    return {
+        "project_id": project_id,
+        "bytes": sum(c["bytes"] for c in categories.values()),
+        "files": sum(c["files"] for c in categories.values()),
+        "categories": [
+            {"category": name, **totals}
+            for name, totals in sorted(categories.items(), key=lambda kv: -kv[1]["bytes"])
+        ],
+        "episodes": list(episodes.values()),
+    }
+
+
+def projects_usage(db: Session) -> list:
+    """每个项目的总量，按字节数倒序"""
+    usage = models.StorageUsage
+    scene_totals = (
+        select(models.Episode.project_id.label("project_id"), usage.bytes, usage.files)
+        .join(models.Scene, models.Scene.episode_id == models.Episode.id)
+        .join(usage, _usage("scene", models.Scene.id))
+    )
+    item_totals = (
+        select(models.Character.project_id.label("project_id"), usage.bytes, usage.files)
+        .join(usage, _usage("asset_item", models.Character.id))
+    )
+    leaves = scene_totals.union_all(item_totals).subquery()
+    totals = {
+        project_id: (size or 0, count or 0)
+        for project_id, size, count in db.execute(
+            select(leaves.c.project_id, func.sum(leaves.c.bytes), func.sum(leaves.c.files)).group_by(leaves.c.project_id)
+        )
+    }
+    projects = db.execute(select(models.Project.id, models.Project.name)).all()
+    result = [
+        {"project_id": pid, "name": name, "bytes": totals.get(pid, (0, 0))[0], "files": totals.get(pid, (0, 0))[1]}
+        for pid, name in projects
+    ]
+    return sorted(result, key=lambda row: (-row["bytes"], row["project_id"]))
+
+
+def _refresh_sizes(db: Session, model, path_column, size_column) -> dict:
+    rows = db.execute(select(model.id, path_column, size_column).where(path_column.is_not(None))).all()
+    with ThreadPoolExecutor(STAT_THREADS) as pool:
+        sizes = list(pool.map(file_size, [row[1] for row in rows]))
+    changed = [
+        {"_id": row[0], "_size": size}
+        for row, size in zip(rows, sizes) if size != row[2]
+    ]
+    if changed:
+        table = model.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam("_id")).values({size_column.key: bindparam("_size")}),
+            changed,
+        )
+    return {"checked": len(rows), "updated": len(changed), "missing": sum(size is None for size in sizes)}
+
+
+@jobs.job_handler("rebuild_storage_usage")
+def handle_rebuild_storage_usage(db: Session, payload: dict):
+    """读盘重填 file_size / video_size，再按两列整体重算 storage_usage（和任务一起提交）"""
+    result = {
+        "assets": _refresh_sizes(db, models.Asset, models.Asset.file_path, models.Asset.file_size),
+        "videos": _refresh_sizes(db, models.Shot, models.Shot.video_path, models.Shot.video_size),
+    }
+    rebuild_storage_usage(db.connection())
+    return result
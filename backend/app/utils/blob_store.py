@@ -0,0 +1,190 @@
+import hashlib
+import os
+import shutil
+import uuid
+from collections import defaultdict
+from sqlalchemy import update
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .. import models
+
+# 内容寻址存储：data/_blobs/ab/cd/<sha256><ext>
+# 相同字节只存一份，assets.blob_sha256 指向 blobs 表，blobs.ref_count 记录引用数
+DATA_ROOT = os.path.join(os.getcwd(), "data")
+BLOB_DIR_NAME = "_blobs"
+BLOB_TMP_DIR = os.path.join(DATA_ROOT, BLOB_DIR_NAME, "tmp")
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def blob_relative_path(sha256: str, ext: str) -> str:
+    """按哈希前两级分片，避免单目录下文件过多"""
+    return f"{BLOB_DIR_NAME}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext.lower()}"
+
+
+def is_blob_path(file_path: str) -> bool:
+    return bool(file_path) and file_path.replace("\\", "/").startswith(BLOB_DIR_NAME + "/")
+
+
+def hash_file(path: str):
+    """返回 (sha256, size)"""
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(COPY_BUFFER_SIZE)
+            if not block:
+                break
+            h.update(block)
+            size += len(block)
+    return h.hexdigest(), size
+
+
+def _place(src_path: str, relative_path: str, move: bool):
+    """把文件放到 blob 路径（先写临时文件再原子改名）"""
+    full_path = os.path.join(DATA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    if move:
+        shutil.move(src_path, full_path)
+    else:
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, full_path)
+
+
+def _acquire(db: Session, sha256: str, relative_path: str, size: int, count: int = 1) -> models.Blob:
+    # 原子 upsert：并发上传相同内容时不会撞主键
+    stmt = sqlite_insert(models.Blob).values(
+        sha256=sha256, file_path=relative_path, size=size, ref_count=count
+    ).on_conflict_do_update(
+        index_elements=[models.Blob.sha256],
+        set_={"ref_count": models.Blob.ref_count + count},
+    )
+    db.execute(stmt)
+    return db.get(models.Blob, sha256, populate_existing=True)
+
+
+def store_hashed_file(db: Session, src_path: str, sha256: str, size: int, filename: str, move: bool = True) -> models.Blob:
+    """
+    摘要已知（例如分片上传时边传边算）时直接入库，省掉一次全量读盘
+    先加引用（拿到写锁）再看文件在不在：清扫任务只在写锁里删 ref_count 为 0 的 blob，两边不会交错
+    """
+    blob = _acquire(db, sha256, blob_relative_path(sha256, os.path.splitext(filename)[1]), size)
+    if os.path.exists(os.path.join(DATA_ROOT, blob.file_path)):
+        # 已有相同内容：只加引用，沿用已有路径
+        if move:
+            os.remove(src_path)
+    else:
+        _place(src_path, blob.file_path, move)
+    return blob
+
+
+def store_file(db: Session, src_path: str, filename: str, move: bool = True) -> models.Blob:
+    """把磁盘上的文件纳入 blob 存储并 +1 引用（同步，调用方负责丢进线程池）"""
+    sha256, size = hash_file(src_path)
+    return store_hashed_file(db, src_path, sha256, size, filename, move)
+
+
+def stage_stream(fileobj, directory: str = BLOB_TMP_DIR):
+    """边拷贝边计算哈希，先写到临时文件（默认 blob 临时目录，与 data/ 同盘），返回 (tmp_path, sha256, size)"""
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, uuid.uuid4().hex)
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                block = fileobj.read(COPY_BUFFER_SIZE)
+                if not block:
+                    break
+                out.write(block)
+                h.update(block)
+                size += len(block)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, h.hexdigest(), size
+
+
+def store_stream(db: Session, fileobj, filename: str) -> models.Blob:
+    """写完再按哈希归位"""
+    tmp_path, sha256, size = stage_stream(fileobj)
+    try:
+        return store_hashed_file(db, tmp_path, sha256, size, filename, move=True)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def store_upload(db: AsyncSession, fileobj, filename: str) -> models.Blob:
+    """异步路由用：拷贝与哈希放到线程池，入库在会话里完成（只剩一次同盘 rename）"""
+    tmp_path, sha256, size = await run_in_threadpool(stage_stream, fileobj)
+    try:
+        return await db.run_sync(store_hashed_file, tmp_path, sha256, size, filename, True)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def release(db: Session, sha256: str):
+    """引用 -1；归零后行和文件都先留着，由 file_gc 的清扫任务删除（期间又被上传的内容可以直接复活）"""
+    db.execute(
+        update(models.Blob)
+        .where(models.Blob.sha256 == sha256)
+        .values(ref_count=models.Blob.ref_count - 1)
+    )
+
+
+def migrate_existing_files(db: Session, dry_run: bool = False) -> dict:
+    """
+    一次性迁移：把 data/ 下历史资产文件并入 blob 存储
+    - 同一路径被多个 Asset 引用时只入库一次，引用数按 Asset 个数累加
+    - 内容相同的不同文件会合并成一个 blob，原文件删除
+    """
+    by_path = defaultdict(list)
+    for asset in db.query(models.Asset).filter(models.Asset.blob_sha256.is_(None)).all():
+        if asset.file_path and not is_blob_path(asset.file_path):
+            by_path[asset.file_path].append(asset)
+
+    report = {"files": 0, "assets": 0, "missing": 0, "bytes_before": 0, "deduplicated": 0}
+    seen = set()
+    for file_path, assets in by_path.items():
+        full_path = os.path.join(DATA_ROOT, file_path)
+        if not os.path.isfile(full_path):
+            report["missing"] += 1
+            continue
+        sha256, size = hash_file(full_path)
+        report["files"] += 1
+        report["assets"] += len(assets)
+        report["bytes_before"] += size
+        if sha256 in seen or db.get(models.Blob, sha256) is not None:
+            report["deduplicated"] += 1
+        seen.add(sha256)
+        if dry_run:
+            continue
+
+        blob = store_hashed_file(db, full_path, sha256, size, file_path, move=True)
+        if len(assets) > 1:
+            _acquire(db, sha256, blob.file_path, size, count=len(assets) - 1)
+        for asset in assets:
+            asset.original_filename = asset.original_filename or os.path.basename(file_path)
+            asset.file_path = blob.file_path
+            asset.blob_sha256 = sha256
+        db.commit()
+    return report
+
+
+# --- 一次性迁移入口：python -m backend.app.utils.blob_store [--dry-run] ---
+if __name__ == "__main__":
+    import sys
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(migrate_existing_files(db, dry_run="--dry-run" in sys.argv))
+    finally:
+        db.close()
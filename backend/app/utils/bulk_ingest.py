@@ -0,0 +1,193 @@
+import os
+import shutil
+import threading
+import uuid
+import zipfile
+from sqlalchemy import insert
+
+from .. import jobs, models, revisions
+from ..database import SessionLocal
+from . import blob_store
+from .image_hash import analyze_image
+from .process_pool import get_process_pool
+
+# 批量导入：暂存并算哈希 -> 进程池并行提取 metadata -> 按批短事务入 blob 存储并插入 Asset
+# - 暂存、哈希、解析都在事务外完成，期间不占 SQLite 写锁，其他请求照常写入
+# - 每批一个事务：blob upsert + 插入 Asset + 记修订，只剩同盘 rename 和几条 SQL
+# 进度保存在内存里，前端轮询 /assets/ingest/{job_id}
+
+INGEST_TMP_DIR = os.path.join(os.getcwd(), "cache", "ingest")
+
+# 压缩包/目录里这些文件直接跳过
+IGNORED_NAMES = {".DS_Store", "Thumbs.db", "desktop.ini"}
+INSERT_BATCH = 200  # 每个写事务处理的文件数
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _is_ignored(name: str) -> bool:
+    base = os.path.basename(name)
+    return not base or base.startswith(".") or base in IGNORED_NAMES or "__MACOSX" in name
+
+
+def create_job(shot_id: int, total: int = 0) -> dict:
+    job = {
+        "id": uuid.uuid4().hex,
+        "shot_id": shot_id,
+        "status": "staging",  # staging / processing / done / failed
+        "total": total,
+        "stored": 0,
+        "extracted": 0,
+        "inserted": 0,
+        "asset_ids": [],
+        "error": None,
+    }
+    with _jobs_lock:
+        _jobs[job["id"]] = job
+    return job
+
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def _update(job: dict, **fields):
+    with _jobs_lock:
+        job.update(fields)
+
+
+def job_staging_dir(job: dict) -> str:
+    path = os.path.join(INGEST_TMP_DIR, job["id"])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def list_directory(directory: str, recursive: bool = True):
+    """返回目录下待导入的文件 [(绝对路径, 文件名)]，按路径排序保证顺序稳定"""
+    found = []
+    if recursive:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if not _is_ignored(name):
+                    found.append((os.path.join(dirpath, name), name))
+    else:
+        for name in os.listdir(directory):
+            full = os.path.join(directory, name)
+            if os.path.isfile(full) and not _is_ignored(name):
+                found.append((full, name))
+    return sorted(found)
+
+
+def _stage_file(path: str, move: bool, tmp_paths: list):
+    """文件放进 blob 临时目录（与 data/ 同盘，入库时只需 rename）并算哈希，返回 (临时路径, sha256, 大小)"""
+    if not move:
+        with open(path, "rb") as src:
+            staged = blob_store.stage_stream(src)
+        tmp_paths.append(staged[0])
+        return staged
+    os.makedirs(blob_store.BLOB_TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(blob_store.BLOB_TMP_DIR, uuid.uuid4().hex)
+    shutil.move(path, tmp_path)
+    tmp_paths.append(tmp_path)
+    return (tmp_path, *blob_store.hash_file(tmp_path))
+
+
+def _stage_sources(job: dict, sources, tmp_paths: list):
+    """
+    sources: [(kind, path, filename, content_type)]
+      kind = "file"：服务器本地文件（拷贝，不动源文件）
+      kind = "staged"：请求里暂存的上传文件（移动）
+      kind = "zip"：压缩包，逐个成员流式写出
+    不碰数据库；返回 [(临时路径, sha256, 大小, filename, content_type)]，临时路径同时记进 tmp_paths 供出错时清理
+    """
+    staged = []
+    for kind, path, filename, content_type in sources:
+        if kind == "zip":
+            with zipfile.ZipFile(path) as zf:
+                members = [m for m in zf.infolist() if not m.is_dir() and not _is_ignored(m.filename)]
+                _update(job, total=job["total"] + len(members) - 1)
+                for member in members:
+                    name = os.path.basename(member.filename)
+                    with zf.open(member) as src:
+                        tmp_path, sha256, size = blob_store.stage_stream(src)
+                    tmp_paths.append(tmp_path)
+                    staged.append((tmp_path, sha256, size, name, None))
+                    _update(job, stored=job["stored"] + 1)
+            continue
+        staged.append((*_stage_file(path, kind == "staged", tmp_paths), filename, content_type))
+        _update(job, stored=job["stored"] + 1)
+    return staged
+
+
+def _insert_batch(db, project_id, rows: list) -> list:
+    """一个短事务：blob 加引用并归位，批量插入 Asset，记修订后提交"""
+    values = []
+    for tmp_path, sha256, size, filename, row in rows:
+        blob = blob_store.store_hashed_file(db, tmp_path, sha256, size, filename, move=True)
+        values.append({**row, "file_path": blob.file_path, "blob_sha256": blob.sha256, "file_size": blob.size})
+    asset_ids = list(db.execute(insert(models.Asset).returning(models.Asset.id, sort_by_parameter_order=True), values).scalars())
+    # Core 批量插入不触发 Session 事件，手动记修订
+    revisions.record_changes(db, project_id, "assets", asset_ids)
+    if any(isinstance(value["meta_data"].get("prompt"), str) for value in values):
+        jobs.schedule_prompt_indexing(db, project_id)
+    db.commit()
+    return asset_ids
+
+
+def run_ingest(job: dict, shot_id: int, sources):
+    """后台执行（BackgroundTasks 线程池），自己开 Session；准备工作都在事务外，入库按批提交"""
+    from ..routers.assets import determine_file_type  # 避免循环导入
+
+    _update(job, status="processing")
+    tmp_paths = []
+    db = SessionLocal()
+    try:
+        staged = _stage_sources(job, sources, tmp_paths)
+
+        rows = []
+        image_paths = []
+        for tmp_path, sha256, size, filename, content_type in staged:
+            file_type = determine_file_type(content_type, filename)
+            rows.append((tmp_path, sha256, size, filename, {
+                "shot_id": shot_id,
+                "file_type": file_type,
+                "meta_data": {},
+                "is_favorite": False,
+                "original_filename": filename,
+                "phash": None,
+            }))
+            if file_type == "image":
+                image_paths.append((len(rows) - 1, tmp_path))
+
+        # 进程池并行解析（读临时文件），结果按提交顺序返回
+        if image_paths:
+            results = get_process_pool().map(
+                analyze_image, [p for _, p in image_paths], chunksize=max(1, len(image_paths) // 32)
+            )
+            for (row_index, _), (meta, phash) in zip(image_paths, results):
+                rows[row_index][4]["meta_data"] = meta
+                rows[row_index][4]["phash"] = phash
+                _update(job, extracted=job["extracted"] + 1)
+
+        project_id = revisions.project_id_for(db.connection(), "shots", shot_id)
+        db.rollback()  # 只读查询，结束读事务
+        asset_ids = []
+        for start in range(0, len(rows), INSERT_BATCH):
+            asset_ids += _insert_batch(db, project_id, rows[start:start + INSERT_BATCH])
+            _update(job, inserted=len(asset_ids), asset_ids=list(asset_ids))
+        _update(job, status="done", inserted=len(asset_ids), asset_ids=asset_ids)
+    except Exception as e:
+        db.rollback()
+        print(f"[Ingest][Error] Job {job['id']} failed: {e}")
+        _update(job, status="failed", error=str(e))
+    finally:
+        db.close()
+        # 已入库的临时文件都被 rename 走了，剩下的是出错时没用上的
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        shutil.rmtree(os.path.join(INGEST_TMP_DIR, job["id"]), ignore_errors=True)
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+# 缩略图/预览图预设：宽度上限 + 压缩质量（只缩小不放大）
+DERIVATIVE_PRESETS = {
+    "thumb": {"width": 256, "quality": 70},
+    "small": {"width": 512, "quality": 75},
+    "preview": {"width": 1024, "quality": 80},
+    "large": {"width": 2048, "quality": 85},
+}
+
+DERIVATIVE_FORMATS = {
+    "webp": {"ext": ".webp", "media_type": "image/webp", "pil_format": "WEBP"},
+    "jpeg": {"ext": ".jpg", "media_type": "image/jpeg", "pil_format": "JPEG"},
+}
+
+# 缓存目录放在 data/ 之外，避免被 /files 直接暴露，也不会混进项目素材
+DERIVATIVE_CACHE_DIR = os.environ.get(
+    "AICOMIC_DERIVATIVE_CACHE_DIR", os.path.join(os.getcwd(), "cache", "derivatives")
+)
+DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get("AICOMIC_DERIVATIVE_CACHE_MB", "512")) * 1024 * 1024
+
+
+def derivative_key(relative_path: str, stat: os.stat_result, preset: str, fmt: str) -> str:
+    """缓存键：源文件相对路径 + mtime + 大小 + 预设 + 格式；源文件被覆盖后自然失效"""
+    raw = f"{relative_path}|{stat.st_mtime_ns}|{stat.st_size}|{preset}|{fmt}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def render_derivative(src_path: str, dst_path: str, width: int, quality: int, fmt: str) -> int:
+    """
+    生成缩放后的衍生图（在进程池里执行，必须是模块级函数以便 pickle）
+    先写临时文件再原子替换，避免并发读到半张图。返回生成文件的字节数
+    """
+    spec = DERIVATIVE_FORMATS[fmt]
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+
+    with Image.open(src_path) as img:
+        # JPEG 可以在解码阶段直接按比例缩小，大图能省掉大部分解码时间
+        img.draft("RGB", (width, width * 4))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+
+        if spec["pil_format"] == "JPEG":
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+        tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+        if fmt == "webp":
+            img.save(tmp_path, spec["pil_format"], quality=quality, method=4)
+        else:
+            img.save(tmp_path, spec["pil_format"], quality=quality, optimize=True)
+
+    os.replace(tmp_path, dst_path)
+    return os.path.getsize(dst_path)
+
+
+class DerivativeCache:
+    """
+    磁盘 LRU：key -> 文件大小，按访问顺序淘汰，总量超过上限时删除最久未访问的文件
+    启动时按 mtime 扫描已有文件重建顺序（命中时会 touch 文件，重启后顺序依然有效）
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (path, size)
+        self._total = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def path_for(self, key: str, fmt: str) -> str:
+        return os.path.join(self.root, key[:2], key + DERIVATIVE_FORMATS[fmt]["ext"])
+
+    def _load(self):
+        if self._loaded:
+            return
+        found = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if name.endswith(".tmp"):
+                        continue
+                    full = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, os.path.splitext(name)[0], full, st.st_size))
+        for _, key, full, size in sorted(found):
+            self._entries[key] = (full, size)
+            self._total += size
+        self._loaded = True
+
+    def get(self, key: str):
+        """命中则返回文件路径并刷新 LRU 顺序，否则返回 None"""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not os.path.exists(entry[0]):
+                # 文件被外部清掉了，当作未命中
+                self._entries.pop(key)
+                self._total -= entry[1]
+                return None
+            self._entries.move_to_end(key)
+        try:
+            os.utime(entry[0])
+        except OSError:
+            pass
+        return entry[0]
+
+    def put(self, key: str, path: str, size: int):
+        """登记新生成的文件，并按容量淘汰旧文件"""
+        with self._lock:
+            self._load()
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total -= old[1]
+            self._entries[key] = (path, size)
+            self._total += size
+            self._evict()
+
+    def _evict(self):
+        # 至少保留刚写入的那一个，即便它本身超过上限
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            _, (path, size) = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+derivative_cache = DerivativeCache(DERIVATIVE_CACHE_DIR, DERIVATIVE_CACHE_MAX_BYTES)
@@ -0,0 +1,126 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models
+
+# 事件矩阵：行 = 事件，列 = 按剧本顺序（集 -> 场 -> 镜头）排好的目标
+# - 列、行都用列式数组返回，不带 ORM 对象，体积和序列化成本都只跟有值的格子数相关
+# - 每一层一份 CSR 稀疏矩阵：行 r 的格子是 indices/counts/node_ids[indptr[r]:indptr[r+1]]
+#   counts = 该格子子树内（自身 + 下级）的节点数，node_ids = 直接挂在该格子上的节点 id（只是上卷的为 null）
+# - 上卷：镜头上的节点同时计入所属场和集
+# - 指向已删除/不在本项目里的目标的节点直接忽略
+
+LEVELS = ("episode", "scene", "shot")
+
+
+def _columns(db: Session, project_id: int):
+    episodes = db.execute(
+        select(models.Episode.id, models.Episode.title, models.Episode.order)
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Episode.sort_key, models.Episode.id)
+    ).all()
+    scenes = db.execute(
+        select(models.Scene.id, models.Scene.episode_id, models.Scene.title, models.Scene.sequence_number)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Episode.sort_key, models.Episode.id, models.Scene.sort_key, models.Scene.id)
+    ).all()
+    shots = db.execute(
+        select(models.Shot.id, models.Shot.scene_id, models.Shot.title, models.Shot.sequence_number)
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id)
+        .order_by(
+            models.Episode.sort_key, models.Episode.id,
+            models.Scene.sort_key, models.Scene.id,
+            models.Shot.sort_key, models.Shot.id,
+        )
+    ).all()
+    return episodes, scenes, shots
+
+
+def build_event_matrix(db: Session, project_id: int) -> dict:
+    """同步构建（异步路由经 run_sync 调用）"""
+    episodes, scenes, shots = _columns(db, project_id)
+    episode_index = {row.id: i for i, row in enumerate(episodes)}
+    scene_index = {row.id: i for i, row in enumerate(scenes)}
+    shot_index = {row.id: i for i, row in enumerate(shots)}
+    scene_parent = [episode_index[row.episode_id] for row in scenes]
+    shot_parent = [scene_index[row.scene_id] for row in shots]
+
+    events = db.execute(
+        select(models.Event.id, models.Event.name, models.Event.color, models.Event.description)
+        .where(models.Event.project_id == project_id)
+        .order_by(models.Event.start_time_sort_key, models.Event.id)
+    ).all()
+    event_index = {row.id: i for i, row in enumerate(events)}
+    nodes = db.execute(
+        select(models.EventNode.id, models.EventNode.event_id, models.EventNode.target_type, models.EventNode.target_id)
+        .join(models.Event, models.EventNode.event_id == models.Event.id)
+        .where(models.Event.project_id == project_id)
+    ).all()
+
+    # cells[level][行] = {列: [count, node_id]}
+    cells = {level: [{} for _ in events] for level in LEVELS}
+
+    def mark(level: str, row: int, col: int, node_id=None):
+        cell = cells[level][row].setdefault(col, [0, None])
+        cell[0] += 1
+        if node_id is not None:
+            cell[1] = node_id
+
+    for node_id, event_id, target_type, target_id in nodes:
+        row = event_index[event_id]
+        if target_type == "shot" and target_id in shot_index:
+            col = shot_index[target_id]
+            mark("shot", row, col, node_id)
+            mark("scene", row, shot_parent[col])
+            mark("episode", row, scene_parent[shot_parent[col]])
+        elif target_type == "scene" and target_id in scene_index:
+            col = scene_index[target_id]
+            mark("scene", row, col, node_id)
+            mark("episode", row, scene_parent[col])
+        elif target_type == "episode" and target_id in episode_index:
+            mark("episode", row, episode_index[target_id], node_id)
+
+    matrix = {}
+    for level in LEVELS:
+        indptr, indices, counts, node_ids = [0], [], [], []
+        for row_cells in cells[level]:
+            for col in sorted(row_cells):
+                count, node_id = row_cells[col]
+                indices.append(col)
+                counts.append(count)
+                node_ids.append(node_id)
+            indptr.append(len(indices))
+        matrix[level] = {"indptr": indptr, "indices": indices, "counts": counts, "node_ids": node_ids}
+
+    return {
+        "project_id": project_id,
+        "rows": {
+            "id": [row.id for row in events],
+            "name": [row.name for row in events],
+            "color": [row.color for row in events],
+            "description": [row.description for row in events],
+        },
+        "columns": {
+            "episode": {
+                "id": [row.id for row in episodes],
+                "title": [row.title for row in episodes],
+                "order": [row.order for row in episodes],
+            },
+            "scene": {
+                "id": [row.id for row in scenes],
+                "parent": scene_parent,  # 所属集在 columns.episode 里的下标
+                "title": [row.title for row in scenes],
+                "sequence_number": [row.sequence_number for row in scenes],
+            },
+            "shot": {
+                "id": [row.id for row in shots],
+                "parent": shot_parent,  # 所属场在 columns.scene 里的下标
+                "title": [row.title for row in shots],
+                "sequence_number": [row.sequence_number for row in shots],
+            },
+        },
+        "matrix": matrix,
+    }
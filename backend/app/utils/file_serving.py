@@ -0,0 +1,155 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from . import blob_store
+
+# /files 文件服务
+# - 版本化 URL：blob 路径本身就是内容摘要；其他文件带 ?v=<版本>（由 mtime + 大小算出）
+#   URL 版本与文件当前版本一致 -> Cache-Control: immutable 一年；不带版本或版本过期 -> no-cache，靠 ETag 验证
+# - 强 ETag：blob 用 sha256，其他用版本号；If-None-Match 命中返回 304
+# - Range / If-Range 交给 FileResponse（单段、多段都支持），视频拖动进度条只读需要的那一段
+# - 预压缩：存在 <文件>.br / <文件>.gz 且客户端接受时直接发压缩版（只对整文件请求）
+# - API 里的 file_url / video_url 由 file_url() 生成
+
+DATA_ROOT = blob_store.DATA_ROOT
+URL_PREFIX = "/files/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def resolve(relative_path: str) -> str:
+    """相对 data/ 的路径 -> 绝对路径；防止 ../ 越界，找不到返回 404"""
+    full_path = os.path.realpath(os.path.join(DATA_ROOT, relative_path))
+    if not full_path.startswith(os.path.realpath(DATA_ROOT) + os.sep):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return full_path
+
+
+def version_of(st: os.stat_result) -> str:
+    return hashlib.blake2b(f"{st.st_mtime_ns}-{st.st_size}".encode(), digest_size=6).hexdigest()
+
+
+def _blob_digest(relative_path: str):
+    """blob 路径 _blobs/ab/cd/<sha256><ext> 里的摘要"""
+    if not blob_store.is_blob_path(relative_path):
+        return None
+    return os.path.splitext(os.path.basename(relative_path))[0]
+
+
+def file_url(relative_path):
+    """给 API 响应用的版本化 URL（相对服务根）；文件不存在时不带版本"""
+    if not relative_path:
+        return None
+    relative_path = relative_path.replace("\\", "/")
+    url = URL_PREFIX + quote(relative_path)
+    if blob_store.is_blob_path(relative_path):  # 文件名就是摘要，不用 stat（大列表里每张素材都会走到这里）
+        return url
+    try:
+        st = os.stat(os.path.join(DATA_ROOT, relative_path))
+    except OSError:
+        return url
+    return f"{url}?v={version_of(st)}"
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _accepted_encodings(header: str) -> dict:
+    """Accept-Encoding -> {编码: q}；q 写错的项按不接受处理"""
+    accepted = {}
+    for item in header.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def _precompressed(request: Request, full_path: str):
+    """(编码, 压缩文件路径)；不需要或没有时返回 None。按 q 值取最优，q=0 表示明确拒绝"""
+    if request.headers.get("range"):
+        return None
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    best, best_q = None, 0.0
+    for encoding, suffix in PRECOMPRESSED:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q and os.path.isfile(full_path + suffix):
+            best, best_q = (encoding, full_path + suffix), q
+    return best
+
+
+def serve(request: Request, relative_path: str) -> Response:
+    full_path = resolve(relative_path)
+    st = os.stat(full_path)
+    version = version_of(st)
+    digest = _blob_digest(relative_path.replace("\\", "/"))
+    immutable = digest is not None or request.query_params.get("v") == version
+    headers = {"Cache-Control": IMMUTABLE if immutable else REVALIDATE}
+
+    variant = _precompressed(request, full_path)
+    if any(os.path.isfile(full_path + suffix) for _, suffix in PRECOMPRESSED):
+        headers["Vary"] = "Accept-Encoding"
+    tag = digest or version
+    if variant is not None:
+        tag = f"{tag}-{variant[0]}"
+    headers["ETag"] = f'"{tag}"'
+
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    if variant is not None:
+        headers["Content-Encoding"] = variant[0]
+        return FileResponse(variant[1], media_type=media_type, headers=headers)
+    return FileResponse(full_path, media_type=media_type, headers=headers, stat_result=st)
+
+
+def save_versioned(src, directory: str, ext: str, prefix: str = "") -> tuple:
+    """
+    边写边算摘要，按内容命名（<prefix><sha256 前 16 位><ext>）后原子改名到 directory 下，返回 (文件名, 字节数)
+    内容变了文件名才会变：URL 可以长期缓存，也不用随机名来绕开浏览器缓存
+    字节数边写边累加，调用方记 video_size 不用再 stat
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        filename = f"{prefix}{digest.hexdigest()[:16]}{ext}"
+        os.replace(tmp_path, os.path.join(directory, filename))
+        return filename, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
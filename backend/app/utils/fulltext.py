@@ -0,0 +1,152 @@
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from .. import models
+
+# 全文检索（FTS5 表和同步触发器见 migrations.m007_search_index）
+# - 查询按空白拆词，词与词之间是 AND
+# - >= 3 个字符的词走 trigram 索引（MATCH，bm25 排序，snippet 高亮）
+# - 1~2 个字符的词（"雨"、"凡说"）trigram 索引用不上，退化成 FTS 表上的 LIKE；只有短词时按 id 倒序
+# - 命中先分页，再只给这一页补层级面包屑（集 -> 场 -> 镜头 / 资产条目）
+
+# 对外类型 -> (FTS 表, 检索列)；characters 对外叫资产条目
+SOURCES = {
+    "shot": ("search_shots", ["title", "action_text", "dialogue", "prompt"]),
+    "asset_item": ("search_characters", ["name", "description", "base_prompt"]),
+    "asset": ("search_assets", ["prompt", "negative_prompt"]),
+}
+MIN_INDEXED_TERM = 3  # trigram
+HIGHLIGHT = ("【", "】")
+SNIPPET_TOKENS = 24
+SNIPPET_CHARS = 48
+
+
+def parse_query(q: str):
+    """拆成 (走索引的词, 只能 LIKE 的短词)"""
+    terms = [term.replace('"', "") for term in q.split()]
+    terms = [term for term in terms if term]
+    return (
+        [term for term in terms if len(term) >= MIN_INDEXED_TERM],
+        [term for term in terms if len(term) < MIN_INDEXED_TERM],
+    )
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _source_query(kind: str, indexed, short, params: dict) -> str:
+    fts, columns = SOURCES[kind]
+    where = ["project_id = :project_id"]
+    if indexed:
+        where.append(f"{fts} MATCH :match")
+        score = f"bm25({fts})"
+        snippet = f"snippet({fts}, -1, :hl_open, :hl_close, '…', {SNIPPET_TOKENS})"
+    else:
+        score = "0.0"
+        snippet = "NULL"
+    for i, term in enumerate(short):
+        params[f"like_{i}"] = _like_pattern(term)
+        where.append("(" + " OR ".join(f"{col} LIKE :like_{i} ESCAPE '\\'" for col in columns) + ")")
+    body = " || ' ' || ".join(f"IFNULL({col}, '')" for col in columns)
+    return (
+        f"SELECT '{kind}' AS kind, rowid AS id, {score} AS score, {snippet} AS snippet, {body} AS body "
+        f"FROM {fts} WHERE {' AND '.join(where)}"
+    )
+
+
+def _excerpt(body: str, terms) -> str:
+    """短词命中时没有 snippet()：截取第一个命中词附近的一段"""
+    lowered = body.lower()
+    for term in terms:
+        pos = lowered.find(term.lower())
+        if pos < 0:
+            continue
+        start = max(pos - SNIPPET_CHARS // 2, 0)
+        end = min(pos + len(term) + SNIPPET_CHARS // 2, len(body))
+        return (
+            ("…" if start else "") + body[start:pos]
+            + HIGHLIGHT[0] + body[pos:pos + len(term)] + HIGHLIGHT[1]
+            + body[pos + len(term):end] + ("…" if end < len(body) else "")
+        )
+    return body[:SNIPPET_CHARS]
+
+
+def _breadcrumbs(db: Session, hits):
+    """只对当前页的命中查层级：镜头 -> 场 -> 集，素材 -> 镜头或资产条目"""
+    by_kind = {kind: [hit["id"] for hit in hits if hit["kind"] == kind] for kind in SOURCES}
+
+    assets = {}
+    if by_kind["asset"]:
+        assets = {row.id: row for row in db.execute(
+            select(models.Asset.id, models.Asset.shot_id, models.Asset.character_id,
+                   models.Asset.original_filename, models.Asset.file_type)
+            .where(models.Asset.id.in_(by_kind["asset"]))
+        )}
+    shot_ids = set(by_kind["shot"]) | {row.shot_id for row in assets.values() if row.shot_id}
+    item_ids = set(by_kind["asset_item"]) | {row.character_id for row in assets.values() if row.character_id}
+
+    shot_paths = {}
+    if shot_ids:
+        rows = db.execute(
+            select(
+                models.Shot.id, models.Shot.title, models.Shot.sequence_number,
+                models.Scene.id.label("scene_id"), models.Scene.title.label("scene_title"),
+                models.Episode.id.label("episode_id"), models.Episode.title.label("episode_title"),
+            )
+            .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+            .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+            .where(models.Shot.id.in_(shot_ids))
+        )
+        for row in rows:
+            shot_paths[row.id] = [
+                {"type": "episode", "id": row.episode_id, "title": row.episode_title},
+                {"type": "scene", "id": row.scene_id, "title": row.scene_title},
+                {"type": "shot", "id": row.id, "title": row.title or f"Shot {row.sequence_number}"},
+            ]
+    item_paths = {}
+    if item_ids:
+        rows = db.execute(select(models.Character.id, models.Character.name).where(models.Character.id.in_(item_ids)))
+        item_paths = {row.id: [{"type": "asset_item", "id": row.id, "title": row.name}] for row in rows}
+
+    for hit in hits:
+        if hit["kind"] == "shot":
+            hit["breadcrumbs"] = shot_paths.get(hit["id"], [])
+        elif hit["kind"] == "asset_item":
+            hit["breadcrumbs"] = item_paths.get(hit["id"], [])
+        else:
+            asset = assets.get(hit["id"])
+            if asset is None:
+                hit["breadcrumbs"] = []
+                continue
+            parent = shot_paths.get(asset.shot_id) or item_paths.get(asset.character_id) or []
+            hit["breadcrumbs"] = parent + [
+                {"type": "asset", "id": asset.id, "title": asset.original_filename or asset.file_type}
+            ]
+
+
+def search(db: Session, project_id: int, q: str, kinds, limit: int, offset: int) -> dict:
+    """同步执行（异步路由经 run_sync 调用）；多取一条判断是否还有下一页"""
+    indexed, short = parse_query(q)
+    params = {"project_id": project_id, "limit": limit + 1, "offset": offset}
+    if indexed:
+        # 每个词加引号当短语，用户输入里的 FTS 语法字符（- * : 等）不会被解释
+        params["match"] = " ".join(f'"{term}"' for term in indexed)
+        params["hl_open"], params["hl_close"] = HIGHLIGHT
+    union = " UNION ALL ".join(_source_query(kind, indexed, short, params) for kind in kinds)
+    rows = db.execute(
+        text(f"SELECT kind, id, score, snippet, body FROM ({union}) ORDER BY score, id DESC, kind LIMIT :limit OFFSET :offset"),
+        params,
+    ).all()
+
+    hits = [
+        {
+            "kind": row.kind,
+            "id": row.id,
+            "score": -row.score or 0.0,  # bm25 越小越相关，对外翻成越大越相关
+            "snippet": row.snippet if row.snippet is not None else _excerpt(row.body.strip(), short),
+        }
+        for row in rows[:limit]
+    ]
+    _breadcrumbs(db, hits)
+    return {"items": hits, "next_offset": offset + limit if len(rows) > limit else None}
@@ -0,0 +1,245 @@
+import threading
+from itertools import combinations
+from PIL import Image, ImageOps
+from sqlalchemy import select, union
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import ReadSessionLocal
+from .metadata_parser import extract_metadata
+
+# 图片感知哈希（dHash）+ 按项目的汉明距离索引
+# - dHash：灰度缩到 9x8，每行相邻像素比大小得 64 位；重新编码、改尺寸、轻微调色后基本不变
+#   存成有符号 64 位整数（SQLite INTEGER），assets.phash 列
+# - 解码是大头：JPEG 用 draft 模式直接按 1/8 尺寸解码；批量回填走进程池
+# - 索引：多段哈希（multi-index hashing），64 位切成 CHUNKS 段，每段一个 段值 -> {asset_id} 的表
+#   距离 <= d 的两个哈希至少有一段距离 <= d // CHUNKS（抽屉原理），只需枚举每段的小邻域再精确核对，结果不漏
+# - 每个项目一份索引，常驻内存；按 change_log 里 assets 表的变更增量追上项目修订号，落后太多就整体重建
+
+HASH_SIZE = 8
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_DISTANCE = 16
+DEFAULT_DISTANCE = 6
+REBUILD_AFTER = 5000  # 落后超过这么多条 assets 变更就直接重建
+
+
+def _signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+
+def dhash_image(img: Image.Image) -> int:
+    if img.format == "JPEG":
+        img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+    img = ImageOps.exif_transpose(img).convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = list(img.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return _signed(value)
+
+
+def dhash_file(file_path: str):
+    """读不了 / 不是图片返回 None"""
+    try:
+        with Image.open(file_path) as img:
+            return dhash_image(img)
+    except Exception:
+        return None
+
+
+def analyze_image(file_path: str):
+    """进程池里一次跑完：(metadata, phash)"""
+    return extract_metadata(file_path), dhash_file(file_path)
+
+
+def distance(a: int, b: int) -> int:
+    return (_unsigned(a) ^ _unsigned(b)).bit_count()
+
+
+def format_hash(value: int) -> str:
+    return f"{_unsigned(value):016x}"
+
+
+def parse_hash(text: str) -> int:
+    """16 位十六进制；格式不对抛 ValueError"""
+    value = int(text, 16)
+    if len(text) != 16 or value < 0:
+        raise ValueError("phash must be 16 hex digits")
+    return _signed(value)
+
+
+def _neighbors(chunk: int, radius: int):
+    """段值本身和翻转不超过 radius 位后的所有值"""
+    yield chunk
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            yield flipped
+
+
+class HammingIndex:
+    def __init__(self, revision: int):
+        self.revision = revision
+        self.hashes = {}  # asset_id -> 无符号哈希
+        self.tables = [{} for _ in range(CHUNKS)]  # 段值 -> {asset_id}
+
+    def _chunks(self, value: int):
+        return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+    def add(self, asset_id: int, phash: int):
+        self.remove(asset_id)
+        value = _unsigned(phash)
+        self.hashes[asset_id] = value
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            table.setdefault(chunk, set()).add(asset_id)
+
+    def remove(self, asset_id: int):
+        value = self.hashes.pop(asset_id, None)
+        if value is None:
+            return
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            ids = table.get(chunk)
+            if ids is not None:
+                ids.discard(asset_id)
+                if not ids:
+                    del table[chunk]
+
+    def query(self, phash: int, max_distance: int):
+        """返回 [(asset_id, 距离)]，按距离、id 排序"""
+        value = _unsigned(phash)
+        radius = max_distance // CHUNKS
+        candidates = set()
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            for probe in _neighbors(chunk, radius):
+                ids = table.get(probe)
+                if ids:
+                    candidates |= ids
+        hits = []
+        for asset_id in candidates:
+            d = (self.hashes[asset_id] ^ value).bit_count()
+            if d <= max_distance:
+                hits.append((asset_id, d))
+        return sorted(hits, key=lambda hit: (hit[1], hit[0]))
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+_indexes = {}  # project_id -> HammingIndex
+_lock = threading.Lock()  # 线程锁：只能在工作线程里拿（见 search），不能在事件循环线程上经 run_sync 持有
+
+
+def _project_assets(project_id: int):
+    return union(
+        select(models.Asset.id)
+        .join(models.Shot, models.Asset.shot_id == models.Shot.id)
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id),
+        select(models.Asset.id)
+        .join(models.Character, models.Asset.character_id == models.Character.id)
+        .where(models.Character.project_id == project_id),
+    )
+
+
+def _build(db: Session, project_id: int, revision: int) -> HammingIndex:
+    index = HammingIndex(revision)
+    rows = db.execute(
+        select(models.Asset.id, models.Asset.phash)
+        .where(models.Asset.phash.is_not(None), models.Asset.id.in_(_project_assets(project_id)))
+    )
+    for asset_id, phash in rows:
+        index.add(asset_id, phash)
+    return index
+
+
+def _catch_up(db: Session, index: HammingIndex, project_id: int, revision: int) -> bool:
+    """按 change_log 增量更新；变更太多返回 False 让调用方重建"""
+    changed = {}
+    rows = db.execute(
+        select(models.ChangeLog.row_id, models.ChangeLog.op)
+        .where(
+            models.ChangeLog.project_id == project_id,
+            models.ChangeLog.revision > index.revision,
+            models.ChangeLog.revision <= revision,
+            models.ChangeLog.table_name == "assets",
+        )
+        .order_by(models.ChangeLog.id)
+        .limit(REBUILD_AFTER + 1)
+    ).all()
+    if len(rows) > REBUILD_AFTER:
+        return False
+    for row_id, op in rows:
+        changed[row_id] = op
+    upserts = [row_id for row_id, op in changed.items() if op != "delete"]
+    current = dict(db.execute(
+        select(models.Asset.id, models.Asset.phash).where(models.Asset.id.in_(upserts))
+    ).all()) if upserts else {}
+    for row_id in changed:
+        phash = current.get(row_id)
+        if phash is None:
+            index.remove(row_id)  # 删除了 / 还没算出哈希
+        else:
+            index.add(row_id, phash)
+    index.revision = revision
+    return True
+
+
+def project_index(db: Session, project_id: int):
+    """取项目的索引并追到当前修订号；项目不存在返回 None（同步，只在工作线程里调用）"""
+    revision = db.execute(select(models.Project.revision).where(models.Project.id == project_id)).scalar()
+    if revision is None:
+        return None
+    with _lock:
+        index = _indexes.get(project_id)
+        # 读连接的快照可能比索引旧一点，这时直接用（多出来的只是更新的数据）
+        if index is None or (index.revision < revision and not _catch_up(db, index, project_id, revision)):
+            index = _indexes[project_id] = _build(db, project_id, revision)
+        return index
+
+
+def find_similar(db: Session, project_id: int, phash: int, max_distance: int, limit: int, exclude_id: int = None) -> list:
+    index = project_index(db, project_id)
+    if index is None:
+        return []
+    hits = [hit for hit in index.query(phash, max_distance) if hit[0] != exclude_id][:limit]
+    if not hits:
+        return []
+    rows = {row.id: row for row in db.execute(
+        select(models.Asset.id, models.Asset.shot_id, models.Asset.character_id,
+               models.Asset.file_path, models.Asset.original_filename)
+        .where(models.Asset.id.in_([asset_id for asset_id, _ in hits]))
+    )}
+    return [
+        {
+            "asset_id": asset_id,
+            "shot_id": rows[asset_id].shot_id,
+            "asset_item_id": rows[asset_id].character_id,
+            "file_path": rows[asset_id].file_path,
+            "original_filename": rows[asset_id].original_filename,
+            "distance": d,
+        }
+        for asset_id, d in hits if asset_id in rows
+    ]
+
+
+def search(project_id: int, phash: int, max_distance: int, limit: int, exclude_id: int = None) -> list:
+    """
+    异步路由经 run_in_threadpool 调用：自己开同步只读会话
+    建索引 / 追修订号时要拿线程锁，放在事件循环线程上（run_sync）会把整个服务卡死
+    """
+    db = ReadSessionLocal()
+    try:
+        return find_similar(db, project_id, phash, max_distance, limit, exclude_id)
+    finally:
+        db.close()
@@ -1,91 +1,325 @@
 from PIL import Image
 import re
 import os
+import struct
+import zlib
 
-def extract_metadata(file_path: str) -> dict:
+# ==========================================
+# 快速路径：只读文件头和文本/EXIF 块，不解码像素
+# PNG: IHDR + tEXt/iTXt/zTXt，跳过 IDAT
+# JPEG: SOFn + APP1(EXIF UserComment) + COM，遇到 SOS 停止
+# WebP: VP8/VP8L/VP8X + EXIF 块
+# 解析不了的格式或异常文件再回退到 Pillow
+# ==========================================
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# SOF 标记（除去 DHT/JPG/DAC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+EXIF_TAG_IFD_POINTER = 0x8769
+EXIF_TAG_USER_COMMENT = 0x9286
+EXIF_TAG_IMAGE_DESCRIPTION = 0x010E
+
+
+def _decode_png_text_chunk(ctype: bytes, data: bytes):
+    keyword, _, rest = data.partition(b"\x00")
+    key = keyword.decode("latin-1")
+    if ctype == b"tEXt":
+        return key, rest.decode("latin-1")
+    if ctype == b"zTXt":
+        # rest[0] 为压缩方法（固定 0 = zlib）
+        return key, zlib.decompress(rest[1:]).decode("latin-1")
+    # iTXt: 压缩标记(1) 压缩方法(1) 语言\0 翻译关键字\0 文本(utf-8)
+    compressed = rest[0] == 1
+    _, _, rest = rest[2:].partition(b"\x00")
+    _, _, text = rest.partition(b"\x00")
+    if compressed:
+        text = zlib.decompress(text)
+    return key, text.decode("utf-8", errors="replace")
+
+
+def _read_png_header(f):
+    if f.read(8) != PNG_SIGNATURE:
+        return None
+    width = height = None
+    info = {}
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        length, ctype = struct.unpack(">I4s", header)
+        if ctype == b"IHDR":
+            width, height = struct.unpack(">II", f.read(length)[:8])
+        elif ctype in (b"tEXt", b"iTXt", b"zTXt"):
+            key, value = _decode_png_text_chunk(ctype, f.read(length))
+            info.setdefault(key, value)
+        elif ctype == b"IEND":
+            break
+        elif ctype == b"IDAT" and "parameters" in info:
+            # WebUI 的文本块都在像素数据之前，拿到了就不用继续扫
+            break
+        else:
+            f.seek(length, os.SEEK_CUR)
+        f.seek(4, os.SEEK_CUR)  # CRC
+    if width is None:
+        return None
+    return width, height, info
+
+
+def _decode_user_comment(value: bytes):
+    """EXIF UserComment：前 8 字节为编码声明"""
+    prefix, body = value[:8], value[8:]
+    if prefix == b"UNICODE\x00":
+        # piexif/WebUI 写的是 UTF-16BE；参数文本以 ASCII 为主，按零字节落在奇/偶位来兼容 LE 写法
+        encoding = "utf-16-le" if body[1::2].count(0) > body[0::2].count(0) else "utf-16-be"
+        return body.decode(encoding, errors="replace").rstrip("\x00")
+    if prefix in (b"ASCII\x00\x00\x00", b"\x00" * 8):
+        return body.decode("utf-8", errors="replace").rstrip("\x00")
+    return value.decode("utf-8", errors="replace").rstrip("\x00")
+
+
+def _read_ifd(tiff: bytes, offset: int, endian: str):
+    """返回 {tag: (type, count, value_or_offset_bytes)}"""
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    (count,) = struct.unpack(endian + "H", tiff[offset:offset + 2])
+    for i in range(count):
+        start = offset + 2 + i * 12
+        if start + 12 > len(tiff):
+            break
+        tag, typ, n = struct.unpack(endian + "HHI", tiff[start:start + 8])
+        entries[tag] = (typ, n, tiff[start + 8:start + 12])
+    return entries
+
+
+def _ifd_bytes(tiff: bytes, entry, endian: str) -> bytes:
+    typ, n, raw = entry
+    if n <= 4:
+        return raw[:n]
+    (offset,) = struct.unpack(endian + "I", raw)
+    return tiff[offset:offset + n]
+
+
+def _parse_exif_parameters(tiff: bytes):
+    """从 EXIF 里取生成参数（UserComment，其次 ImageDescription）"""
+    if tiff.startswith(b"Exif\x00\x00"):
+        tiff = tiff[6:]
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return None
+    (ifd0_offset,) = struct.unpack(endian + "I", tiff[4:8])
+    ifd0 = _read_ifd(tiff, ifd0_offset, endian)
+
+    if EXIF_TAG_IFD_POINTER in ifd0:
+        (exif_offset,) = struct.unpack(endian + "I", ifd0[EXIF_TAG_IFD_POINTER][2])
+        exif_ifd = _read_ifd(tiff, exif_offset, endian)
+        if EXIF_TAG_USER_COMMENT in exif_ifd:
+            text = _decode_user_comment(_ifd_bytes(tiff, exif_ifd[EXIF_TAG_USER_COMMENT], endian))
+            if text:
+                return text
+    if EXIF_TAG_IMAGE_DESCRIPTION in ifd0:
+        text = _ifd_bytes(tiff, ifd0[EXIF_TAG_IMAGE_DESCRIPTION], endian).decode("utf-8", errors="replace")
+        return text.rstrip("\x00") or None
+    return None
+
+
+def _read_jpeg_header(f):
+    if f.read(2) != b"\xff\xd8":
+        return None
+    width = height = None
+    info = {}
+    while True:
+        byte = f.read(1)
+        if not byte:
+            break
+        if byte != b"\xff":
+            continue
+        marker = f.read(1)
+        while marker == b"\xff":  # 填充字节
+            marker = f.read(1)
+        if not marker:
+            break
+        code = marker[0]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue  # 无长度字段的标记
+        if code in (0xD9, 0xDA):
+            break  # EOI / SOS：后面就是熵编码数据了
+        (length,) = struct.unpack(">H", f.read(2))
+        if code in JPEG_SOF_MARKERS:
+            data = f.read(length - 2)
+            height, width = struct.unpack(">HH", data[1:5])
+        elif code == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(b"Exif\x00\x00") and "parameters" not in info:
+                text = _parse_exif_parameters(data)
+                if text:
+                    info["parameters"] = text
+        elif code == 0xFE:
+            text = f.read(length - 2).decode("utf-8", errors="replace").rstrip("\x00")
+            info.setdefault("comment", text)
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+    if width is None:
+        return None
+    return width, height, info
+
+
+def _read_webp_header(f):
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return None
+    width = height = None
+    info = {}
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        ctype, length = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        padded = length + (length & 1)
+        if ctype == b"VP8X":
+            data = f.read(padded)
+            width = int.from_bytes(data[4:7], "little") + 1
+            height = int.from_bytes(data[7:10], "little") + 1
+        elif ctype == b"VP8 " and width is None:
+            data = f.read(padded)
+            w, h = struct.unpack("<HH", data[6:10])
+            width, height = w & 0x3FFF, h & 0x3FFF
+        elif ctype == b"VP8L" and width is None:
+            data = f.read(padded)
+            bits = int.from_bytes(data[1:5], "little")
+            width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        elif ctype == b"EXIF":
+            text = _parse_exif_parameters(f.read(padded)[:length])
+            if text:
+                info["parameters"] = text
+        else:
+            f.seek(padded, os.SEEK_CUR)
+    if width is None:
+        return None
+    return width, height, info
+
+
+def read_image_header(file_path: str):
     """
-    解析图片文件，尝试提取 AI 生成信息 (针对 Stable Diffusion WebUI 格式)
+    只读文件头拿 (width, height, 文本信息)，不解码像素
+    不支持的格式或解析失败返回 None，由调用方回退 Pillow
     """
-    if not os.path.exists(file_path):
-        return {}
+    try:
+        with open(file_path, "rb") as f:
+            magic = f.read(12)
+            f.seek(0)
+            if magic.startswith(PNG_SIGNATURE):
+                return _read_png_header(f)
+            if magic.startswith(b"\xff\xd8"):
+                return _read_jpeg_header(f)
+            if magic[:4] == b"RIFF" and magic[8:12] == b"WEBP":
+                return _read_webp_header(f)
+    except (OSError, struct.error, zlib.error, ValueError, IndexError) as e:
+        print(f"[Metadata][Warning] Fast header parse failed for {file_path}: {e}")
+    return None
 
+
+def _read_with_pillow(file_path: str):
+    """慢速回退：完整解码，保证 PNG 尾部的文本块也能读到"""
     try:
         img = Image.open(file_path)
         img.load() # 加载图片数据
     except Exception as e:
         print(f"Error opening image: {e}")
+        return None
+    return img.width, img.height, img.info
+
+
+def extract_metadata(file_path: str) -> dict:
+    """
+    解析图片文件，尝试提取 AI 生成信息 (针对 Stable Diffusion WebUI 格式)
+    """
+    if not os.path.exists(file_path):
+        return {}
+
+    header = read_image_header(file_path) or _read_with_pillow(file_path)
+    if header is None:
         return {}
+    width, height, info = header
 
-    # 获取 PNG info 字典
-    info = img.info
-    
     # 初始化返回数据
     metadata = {
-        "width": img.width,
-        "height": img.height,
+        "width": width,
+        "height": height,
         "raw_parameters": "" # 保留原始文本作为备份
     }
 
     # Stable Diffusion WebUI 通常把信息存在 'parameters' 字段中
-    if 'parameters' in info:
-        raw_text = info['parameters']
-        metadata['raw_parameters'] = raw_text
-        
-        # === 1. 分离 Prompt 和 Negative Prompt ===
-        # WebUI 的格式通常是：Positive Prompt \nNegative prompt: ... \nSteps: ...
-        parts = raw_text.split("Negative prompt:")
-        
-        if len(parts) > 1:
-            metadata['prompt'] = parts[0].strip()
-            # 剩下的部分包含 Negative prompt 和 参数块
-            remaining = parts[1]
-            
-            # 参数块通常以 "Steps:" 开头，我们需要找到它切分
-            if "Steps:" in remaining:
-                neg_part, params_part = remaining.split("Steps:", 1)
-                metadata['negative_prompt'] = neg_part.strip()
-                params_text = "Steps:" + params_part # 把 Steps 补回去方便解析
-            else:
-                metadata['negative_prompt'] = remaining.strip()
-                params_text = ""
+    if isinstance(info.get('parameters'), str):
+        parse_parameters(info['parameters'], metadata)
+
+    return metadata
+
+
+def parse_parameters(raw_text: str, metadata: dict) -> dict:
+    """解析 WebUI 的 parameters 文本，结果写入 metadata"""
+    metadata['raw_parameters'] = raw_text
+
+    # === 1. 分离 Prompt 和 Negative Prompt ===
+    # WebUI 的格式通常是：Positive Prompt \nNegative prompt: ... \nSteps: ...
+    parts = raw_text.split("Negative prompt:")
+
+    if len(parts) > 1:
+        metadata['prompt'] = parts[0].strip()
+        # 剩下的部分包含 Negative prompt 和 参数块
+        remaining = parts[1]
+
+        # 参数块通常以 "Steps:" 开头，我们需要找到它切分
+        if "Steps:" in remaining:
+            neg_part, params_part = remaining.split("Steps:", 1)
+            metadata['negative_prompt'] = neg_part.strip()
+            params_text = "Steps:" + params_part # 把 Steps 补回去方便解析
         else:
-            # 只有 Positive Prompt 或格式不标准
-            metadata['prompt'] = parts[0].strip()
+            metadata['negative_prompt'] = remaining.strip()
             params_text = ""
-            
-            # 尝试在没有 Negative prompt 的情况下找参数块
-            if "Steps:" in parts[0]:
-                 prompt_part, params_part = parts[0].split("Steps:", 1)
-                 metadata['prompt'] = prompt_part.strip()
-                 params_text = "Steps:" + params_part
-
-        # === 2. 解析参数块 (使用正则提取键值对) ===
-        # 典型格式: Steps: 20, Sampler: Euler a, CFG scale: 7, Seed: 12345, Size: 512x512, ...
-        if params_text:
-            # 提取 Seed
-            seed_match = re.search(r"Seed: (\d+)", params_text)
-            if seed_match:
-                metadata['seed'] = int(seed_match.group(1))
-            
-            # 提取 Model Hash
-            model_hash_match = re.search(r"Model hash: ([a-f0-9]+)", params_text)
-            if model_hash_match:
-                metadata['model_hash'] = model_hash_match.group(1)
-
-            # 提取 Sampler
-            sampler_match = re.search(r"Sampler: ([^,]+)", params_text)
-            if sampler_match:
-                metadata['sampler'] = sampler_match.group(1).strip()
-            
-            # 提取 CFG
-            cfg_match = re.search(r"CFG scale: ([\d\.]+)", params_text)
-            if cfg_match:
-                metadata['cfg_scale'] = float(cfg_match.group(1))
+    else:
+        # 只有 Positive Prompt 或格式不标准
+        metadata['prompt'] = parts[0].strip()
+        params_text = ""
+
+        # 尝试在没有 Negative prompt 的情况下找参数块
+        if "Steps:" in parts[0]:
+             prompt_part, params_part = parts[0].split("Steps:", 1)
+             metadata['prompt'] = prompt_part.strip()
+             params_text = "Steps:" + params_part
+
+    # === 2. 解析参数块 (使用正则提取键值对) ===
+    # 典型格式: Steps: 20, Sampler: Euler a, CFG scale: 7, Seed: 12345, Size: 512x512, ...
+    if params_text:
+        # 提取 Seed
+        seed_match = re.search(r"Seed: (\d+)", params_text)
+        if seed_match:
+            metadata['seed'] = int(seed_match.group(1))
+
+        # 提取 Model Hash
+        model_hash_match = re.search(r"Model hash: ([a-f0-9]+)", params_text)
+        if model_hash_match:
+            metadata['model_hash'] = model_hash_match.group(1)
+
+        # 提取 Sampler
+        sampler_match = re.search(r"Sampler: ([^,]+)", params_text)
+        if sampler_match:
+            metadata['sampler'] = sampler_match.group(1).strip()
+
+        # 提取 CFG
+        cfg_match = re.search(r"CFG scale: ([\d\.]+)", params_text)
+        if cfg_match:
+            metadata['cfg_scale'] = float(cfg_match.group(1))
 
     return metadata
 
 # --- 测试代码 ---
 if __name__ == "__main__":
     # 你可以在这里放一张你实际生成的图路径来测试
-    test_path = "test_image.png" 
+    test_path = "test_image.png"
     print(extract_metadata(test_path))
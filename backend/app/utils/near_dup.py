@@ -0,0 +1,302 @@
+import hashlib
+import random
+import re
+from array import array
+from collections import defaultdict
+
+from sqlalchemy import func, select, tuple_, union
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .. import models, revisions
+from ..database import ReadSessionLocal
+from .process_pool import get_process_pool
+
+# 提示词近似去重：MinHash 估计两条提示词 shingle 集合的 Jaccard 相似度，LSH 分桶找候选
+# - 签名 NUM_PERM 个最小哈希，切成 BANDS 段，每段 ROWS 个值哈希成一个桶号
+#   两条相似度为 s 的提示词至少落进一个同桶的概率 1 - (1 - s^ROWS)^BANDS，16x8 时拐点约 0.7
+# - 找候选只查 (project_id, band, bucket) 索引里桶大小 > 1 的组，不做两两比较；候选再用签名估计相似度确认
+# - 签名由后台任务 index_prompts 补算（见 jobs.py，素材写入提示词后登记）；查询接口只读，不在请求里算
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 4  # 字符 4-gram，中英文提示词都适用
+DEFAULT_THRESHOLD = 0.7
+POOL_MIN_BATCH = 256  # 待算签名少于这个数就在当前线程算，省掉进程间传输
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(0x5EED)  # 固定种子：签名要跨进程、跨重启可比
+_PERMS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+_WEIGHT = re.compile(r":\s*-?\d+(\.\d+)?")  # (masterpiece:1.2) 里的权重
+_BRACKETS = re.compile(r"[()\[\]{}<>]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """去掉权重/括号、统一大小写和空白；按逗号拆成标签后去重排序，只调换标签顺序算同一条"""
+    text = _BRACKETS.sub(" ", _WEIGHT.sub("", prompt.lower()))
+    tags = {_SPACES.sub(" ", tag).strip() for tag in re.split(r"[,，]", text)}
+    return ",".join(sorted(tag for tag in tags if tag))
+
+
+def _shingles(text: str) -> set:
+    if len(text) <= SHINGLE:
+        return {text}
+    return {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+
+
+def signature(prompt: str):
+    """返回 array('I')；提示词归一化后为空返回 None"""
+    text = normalize_prompt(prompt)
+    if not text:
+        return None
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+        for s in _shingles(text)
+    ]
+    return array("I", (min((a * h + b) % _MERSENNE for h in hashes) & 0xFFFFFFFF for a, b in _PERMS))
+
+
+def _signatures(prompts: list) -> list:
+    """进程池里跑的批量版本"""
+    return [signature(p) for p in prompts]
+
+
+def band_buckets(sig) -> list:
+    """每个 band 的桶号（有符号 64 位，直接存进 SQLite INTEGER）"""
+    return [
+        int.from_bytes(
+            hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).digest(), "little", signed=True
+        )
+        for band in range(BANDS)
+    ]
+
+
+def similarity(sig_a, sig_b) -> float:
+    """签名里相同位置相等的比例 ≈ Jaccard 相似度"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _load_signature(blob: bytes):
+    sig = array("I")
+    sig.frombytes(blob)
+    return sig
+
+
+def _project_assets(project_id: int):
+    """项目里的素材 id：挂在镜头下的 + 挂在资产条目下的"""
+    return union(
+        select(models.Asset.id)
+        .join(models.Shot, models.Asset.shot_id == models.Shot.id)
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id),
+        select(models.Asset.id)
+        .join(models.Character, models.Asset.character_id == models.Character.id)
+        .where(models.Character.project_id == project_id),
+    )
+
+
+def _missing(project_id: int):
+    """项目里有提示词但还没有签名的素材"""
+    return (
+        models.Asset.id.in_(_project_assets(project_id)),
+        func.json_type(models.Asset.meta_data, "$.prompt") == "text",
+        ~select(models.AssetMinHash.asset_id).where(models.AssetMinHash.asset_id == models.Asset.id).exists(),
+    )
+
+
+def pending_count(db: Session, project_id: int) -> int:
+    return db.execute(select(func.count(models.Asset.id)).where(*_missing(project_id))).scalar()
+
+
+def ensure_signatures(db: Session, project_id: int) -> int:
+    """
+    给项目里还没有签名的带提示词素材补算签名和桶，返回补算条数（不提交）
+    在后台任务线程里执行；数量多时走进程池
+    """
+    prompt = func.json_extract(models.Asset.meta_data, "$.prompt")
+    missing = db.execute(select(models.Asset.id, prompt).where(*_missing(project_id))).all()
+    if not missing:
+        return 0
+    prompts = [row[1] for row in missing]
+    if len(prompts) >= POOL_MIN_BATCH:
+        chunk = 64
+        sigs = [
+            sig for part in get_process_pool().map(_signatures, [prompts[i:i + chunk] for i in range(0, len(prompts), chunk)])
+            for sig in part
+        ]
+    else:
+        sigs = _signatures(prompts)
+
+    # 归一化后为空的提示词也记一行空签名，避免每次都重算；两个任务并发补算同一条时后写的跳过
+    db.execute(sqlite_insert(models.AssetMinHash).on_conflict_do_nothing(), [
+        {"asset_id": row[0], "project_id": project_id, "signature": sig.tobytes() if sig is not None else b""}
+        for row, sig in zip(missing, sigs)
+    ])
+    bucket_rows = [
+        {"asset_id": row[0], "band": band, "bucket": bucket, "project_id": project_id}
+        for row, sig in zip(missing, sigs) if sig is not None
+        for band, bucket in enumerate(band_buckets(sig))
+    ]
+    if bucket_rows:
+        db.execute(sqlite_insert(models.AssetLshBucket).on_conflict_do_nothing(), bucket_rows)
+    return len(missing)
+
+
+class _DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _signatures_for(db: Session, asset_ids) -> dict:
+    rows = db.execute(
+        select(models.AssetMinHash.asset_id, models.AssetMinHash.signature)
+        .where(models.AssetMinHash.asset_id.in_(asset_ids))
+    )
+    return {asset_id: _load_signature(blob) for asset_id, blob in rows if blob}
+
+
+def _asset_summaries(db: Session, asset_ids) -> dict:
+    rows = db.execute(
+        select(
+            models.Asset.id, models.Asset.shot_id, models.Asset.character_id, models.Asset.is_favorite,
+            models.Asset.file_path, func.json_extract(models.Asset.meta_data, "$.prompt").label("prompt"),
+        ).where(models.Asset.id.in_(asset_ids))
+    )
+    return {row.id: row for row in rows}
+
+
+def _member(row, score: float) -> dict:
+    return {
+        "asset_id": row.id,
+        "shot_id": row.shot_id,
+        "asset_item_id": row.character_id,
+        "file_path": row.file_path,
+        "is_favorite": bool(row.is_favorite),
+        "prompt": row.prompt,
+        "similarity": round(score, 3),
+    }
+
+
+def _cluster_payload(db: Session, groups, sigs: dict) -> list:
+    """每组选一个保留项（收藏优先，其次最新），其余按与它的相似度列出"""
+    summaries = _asset_summaries(db, [asset_id for group in groups for asset_id in group])
+    clusters = []
+    for group in groups:
+        members = [summaries[asset_id] for asset_id in group if asset_id in summaries]
+        if len(members) < 2:
+            continue
+        keep = max(members, key=lambda row: (bool(row.is_favorite), row.id))
+        others = sorted(
+            ((row, similarity(sigs[keep.id], sigs[row.id])) for row in members if row.id != keep.id),
+            key=lambda pair: (-pair[1], pair[0].id),
+        )
+        clusters.append({
+            "keep_id": keep.id,
+            "size": len(members),
+            "members": [_member(keep, 1.0)] + [_member(row, score) for row, score in others],
+        })
+    return clusters
+
+
+def find_clusters(db: Session, project_id: int, threshold: float = DEFAULT_THRESHOLD, limit: int = 50) -> dict:
+    """
+    只读：同桶的素材是候选，和桶内第一条的估计相似度 >= threshold 才并进同一组；按组大小倒序
+    还没算出签名的素材不参与，数量放在 pending 里
+    """
+    members = func.group_concat(models.AssetLshBucket.asset_id)
+    buckets = db.execute(
+        select(members)
+        .where(models.AssetLshBucket.project_id == project_id)
+        .group_by(models.AssetLshBucket.band, models.AssetLshBucket.bucket)
+        .having(func.count() > 1)
+    ).scalars().all()
+    candidate_groups = [sorted(int(x) for x in row.split(",")) for row in buckets]
+    sigs = _signatures_for(db, {asset_id for group in candidate_groups for asset_id in group})
+
+    dsu = _DisjointSet()
+    for group in candidate_groups:
+        pivot = group[0]
+        for other in group[1:]:
+            if dsu.find(pivot) != dsu.find(other) and similarity(sigs[pivot], sigs[other]) >= threshold:
+                dsu.union(pivot, other)
+    grouped = defaultdict(list)
+    for asset_id in dsu.parent:
+        grouped[dsu.find(asset_id)].append(asset_id)
+    groups = sorted((g for g in grouped.values() if len(g) > 1), key=lambda g: (-len(g), g[0]))
+
+    return {
+        "project_id": project_id,
+        "pending": pending_count(db, project_id),
+        "total_clusters": len(groups),
+        "clusters": _cluster_payload(db, groups[:limit], sigs),
+    }
+
+
+def asset_project_id(db: Session, asset_id: int):
+    row = db.execute(select(models.Asset.shot_id, models.Asset.character_id).where(models.Asset.id == asset_id)).first()
+    if row is None:
+        return None
+    conn = db.connection()
+    if row.shot_id is not None:
+        return revisions.project_id_for(conn, "shots", row.shot_id)
+    return revisions.project_id_for(conn, "characters", row.character_id)
+
+
+def find_near_duplicates(db: Session, asset_id: int, project_id: int, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """单个素材的近似重复：只看与它至少一个 band 同桶的素材，按相似度倒序（没有提示词或签名还没算出时为空）"""
+    sigs = _signatures_for(db, [asset_id])
+    if asset_id not in sigs:
+        return []
+    own = sigs[asset_id]
+    bucket = models.AssetLshBucket
+    candidates = db.execute(
+        select(bucket.asset_id).distinct().where(
+            bucket.project_id == project_id,
+            tuple_(bucket.band, bucket.bucket).in_(list(enumerate(band_buckets(own)))),
+            bucket.asset_id != asset_id,
+        )
+    ).scalars().all()
+    scored = [(other, similarity(own, sig)) for other, sig in _signatures_for(db, candidates).items()]
+    scored = sorted((pair for pair in scored if pair[1] >= threshold), key=lambda pair: (-pair[1], pair[0]))
+    summaries = _asset_summaries(db, [other for other, _ in scored])
+    return [_member(summaries[other], score) for other, score in scored if other in summaries]
+
+
+def _read_only(fn, *args):
+    """异步路由经 run_in_threadpool 调用：签名比对是纯 Python 计算，放在工作线程里，自己开只读会话"""
+    db = ReadSessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+def clusters(project_id: int, threshold: float = DEFAULT_THRESHOLD, limit: int = 50) -> dict:
+    return _read_only(find_clusters, project_id, threshold, limit)
+
+
+def near_duplicates(asset_id: int, project_id: int, threshold: float = DEFAULT_THRESHOLD) -> list:
+    return _read_only(find_near_duplicates, asset_id, project_id, threshold)
+
+
+def project_asset_ids(db: Session, project_id: int, asset_ids) -> set:
+    """asset_ids 里属于该项目的那些"""
+    return set(db.execute(
+        select(models.Asset.id).where(models.Asset.id.in_(asset_ids), models.Asset.id.in_(_project_assets(project_id)))
+    ).scalars())
@@ -0,0 +1,34 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 全局共享的进程池：Pillow 解码/缩放这类 CPU 密集任务都丢到这里，避免阻塞事件循环
+# 进程数可通过环境变量 AICOMIC_PROCESS_WORKERS 配置，默认取 CPU 核数（上限 8）
+_pool = None
+_lock = threading.Lock()
+
+
+def _default_workers() -> int:
+    env = os.environ.get("AICOMIC_PROCESS_WORKERS")
+    if env and env.isdigit() and int(env) > 0:
+        return int(env)
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """懒加载进程池（首次使用时才 fork 子进程）"""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=_default_workers())
+    return _pool
+
+
+def shutdown_process_pool():
+    """服务关闭时回收子进程"""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,530 @@
+import io
+import json
+import os
+import queue
+import tarfile
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, case, func, insert, or_, select, union, update
+from sqlalchemy.orm import Session
+
+from .. import jobs, models, revisions
+from ..database import SessionLocal, read_engine
+from . import blob_store
+
+# 项目打包导出 / 导入（机器之间搬项目）
+# 归档是普通 tar（PAX 头，中文路径不丢），成员依次是：
+#   project.json                      格式版本 + 项目行
+#   manifest/<序号>-<表名>.jsonl        每个成员最多 CHUNK_ROWS 行，父表在前（见 TABLES）
+#   files/assets/<file_path>          素材文件，按路径去重（blob 共用的文件只打一次）
+#   files/videos/<shot_id><ext>       镜头视频
+# 导出：手写 tar 头 + 按块读文件，边查边吐给响应，不落临时文件；内存只跟一个分块的行数有关
+#   全程在同一个读事务里，WAL 快照保证清单和文件列表一致
+# 导入：请求体经有界队列喂给工作线程，网络接收和解包/写盘并行；
+#   接收阶段不开事务：清单成员落到暂存目录，文件边写边算哈希暂存在 data/ 同盘，上传再慢也不占写锁
+#   收完后一个短事务：插入所有行，id 统一平移到目标表当前最大 id 之后（不用逐行映射表），
+#   外键检查推迟到提交时，父子顺序、互相引用（镜头 <-> 素材）都不用额外回填；文件只剩同盘 rename
+
+FORMAT = "aicomic-project"
+FORMAT_VERSION = 1
+CHUNK_ROWS = 1000
+BLOCK = tarfile.BLOCKSIZE
+READ_SIZE = blob_store.COPY_BUFFER_SIZE
+QUEUE_CHUNKS = 16  # 导入时缓冲的请求体块数（背压）
+
+# 父表在前；导入按这个顺序平移 id
+TABLES = ("characters", "episodes", "scenes", "shots", "assets", "events", "event_nodes")
+MODELS = {
+    "characters": models.Character,
+    "episodes": models.Episode,
+    "scenes": models.Scene,
+    "shots": models.Shot,
+    "assets": models.Asset,
+    "events": models.Event,
+    "event_nodes": models.EventNode,
+}
+# 引用列 -> 被引用表（id 平移量跟着被引用表走）
+REFERENCES = {
+    "characters": {"avatar_asset_id": "assets"},
+    "scenes": {"episode_id": "episodes"},
+    "shots": {"scene_id": "scenes", "selected_asset_id": "assets"},
+    "assets": {"character_id": "characters", "shot_id": "shots"},
+    "event_nodes": {"event_id": "events"},
+}
+TARGET_TABLES = {"episode": "episodes", "scene": "scenes", "shot": "shots"}
+
+
+# =======================
+# 导出
+# =======================
+
+def _project_assets(project_id: int):
+    """项目里的素材 id：挂在镜头下的 + 挂在资产条目下的"""
+    return union(
+        select(models.Asset.id)
+        .join(models.Shot, models.Asset.shot_id == models.Shot.id)
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id),
+        select(models.Asset.id)
+        .join(models.Character, models.Asset.character_id == models.Character.id)
+        .where(models.Character.project_id == project_id),
+    )
+
+
+def _own_asset(column, project_id: int):
+    """引用了别的项目 / 不存在的素材时导出成 null，导入后不会挂到错的行上"""
+    return case((column.in_(_project_assets(project_id)), column), else_=None).label(column.key)
+
+
+def _table_query(table_name: str, project_id: int):
+    model = MODELS[table_name]
+    columns = list(model.__table__.c)
+    if table_name == "characters":
+        columns[columns.index(model.avatar_asset_id)] = _own_asset(model.avatar_asset_id, project_id)
+        return select(*columns).where(model.project_id == project_id).order_by(model.id)
+    if table_name == "episodes":
+        return select(*columns).where(model.project_id == project_id).order_by(model.id)
+    if table_name == "scenes":
+        return (
+            select(*columns)
+            .join(models.Episode, model.episode_id == models.Episode.id)
+            .where(models.Episode.project_id == project_id)
+            .order_by(model.id)
+        )
+    if table_name == "shots":
+        columns[columns.index(model.selected_asset_id)] = _own_asset(model.selected_asset_id, project_id)
+        return (
+            select(*columns)
+            .join(models.Scene, model.scene_id == models.Scene.id)
+            .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+            .where(models.Episode.project_id == project_id)
+            .order_by(model.id)
+        )
+    if table_name == "assets":
+        return select(*columns).where(model.id.in_(_project_assets(project_id))).order_by(model.id)
+    if table_name == "events":
+        return select(*columns).where(model.project_id == project_id).order_by(model.id)
+    # event_nodes：只带目标还在本项目里的节点，否则平移后的 id 可能撞上无关的行
+    node = models.EventNode
+    targets = {
+        "episode": select(models.Episode.id).where(models.Episode.project_id == project_id),
+        "scene": select(models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id),
+        "shot": select(models.Shot.id)
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id),
+    }
+    in_project = [
+        and_(node.target_type == target_type, node.target_id.in_(ids)) for target_type, ids in targets.items()
+    ]
+    return (
+        select(*columns)
+        .join(models.Event, node.event_id == models.Event.id)
+        .where(models.Event.project_id == project_id, or_(*in_project))
+        .order_by(node.id)
+    )
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _dumps(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def _header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % BLOCK)
+
+
+def _bytes_member(name: str, data: bytes, mtime: float):
+    yield _header(name, len(data), mtime) + data + _padding(len(data))
+
+
+def _file_member(name: str, full_path: str):
+    """按块读文件；导出途中文件变短补零、变长截断，保证和头里的大小一致"""
+    try:
+        f = open(full_path, "rb")
+    except OSError:
+        return
+    with f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        yield _header(name, size, st.st_mtime)
+        remaining = size
+        while remaining:
+            block = f.read(min(READ_SIZE, remaining))
+            if not block:
+                block = b"\0" * min(READ_SIZE, remaining)
+            remaining -= len(block)
+            yield block
+        yield _padding(size)
+
+
+def _file_rows(conn, project_id: int):
+    """(成员名, 绝对路径)；素材文件按路径去重，交给 SQL 做，不在内存里攒集合"""
+    asset_paths = conn.execute(
+        select(models.Asset.file_path).distinct()
+        .where(models.Asset.id.in_(_project_assets(project_id)), models.Asset.file_path.is_not(None))
+        .order_by(models.Asset.file_path)
+    )
+    for (file_path,) in asset_paths:
+        relative_path = file_path.replace("\\", "/")
+        yield f"files/assets/{relative_path}", os.path.join(blob_store.DATA_ROOT, relative_path)
+    videos = conn.execute(
+        select(models.Shot.id, models.Shot.video_path)
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id, models.Shot.video_path.is_not(None))
+        .order_by(models.Shot.id)
+    )
+    for shot_id, video_path in videos:
+        ext = os.path.splitext(video_path)[1] or ".mp4"
+        yield f"files/videos/{shot_id}{ext}", os.path.join(blob_store.DATA_ROOT, video_path)
+
+
+def export_project(project_id: int):
+    """
+    同步生成器，逐块产出 tar 字节（StreamingResponse 会放进线程池迭代）
+    自己开连接并显式 BEGIN：整个导出读同一个快照，期间的写入不会让清单和文件对不上
+    走只读池：导出可能持续很久，不能占住唯一的写连接
+    """
+    with read_engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN")
+        project = conn.execute(
+            select(models.Project.name, models.Project.description, models.Project.created_at)
+            .where(models.Project.id == project_id)
+        ).first()
+        if project is None:
+            return
+        now = time.time()
+        yield from _bytes_member("project.json", _dumps({
+            "format": FORMAT,
+            "version": FORMAT_VERSION,
+            "exported_at": datetime.now().isoformat(),
+            "project": dict(project._mapping),
+        }), now)
+
+        seq = 0
+        for table_name in TABLES:
+            result = conn.execute(_table_query(table_name, project_id))
+            for rows in result.partitions(CHUNK_ROWS):
+                seq += 1
+                data = b"\n".join(_dumps(dict(row._mapping)) for row in rows) + b"\n"
+                yield from _bytes_member(f"manifest/{seq:05d}-{table_name}.jsonl", data, now)
+
+        for name, full_path in _file_rows(conn, project_id):
+            yield from _file_member(name, full_path)
+        yield b"\0" * (BLOCK * 2)
+        conn.rollback()
+
+
+# =======================
+# 导入
+# =======================
+
+class BodyReader(io.RawIOBase):
+    """
+    异步路由往里 feed 请求体块，工作线程里的 tarfile 从这里 read
+    队列有界：解包跟不上时 feed 阻塞，内存不会随请求体增长
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+        self.buffer = b""
+        self.finished = False
+        self.aborted = False
+
+    def readable(self):
+        return True
+
+    def feed(self, chunk):
+        """chunk=None 表示请求体结束；工作线程已放弃时直接丢弃，避免永远阻塞"""
+        while not self.aborted:
+            try:
+                self.queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def abort(self):
+        self.aborted = True
+
+    def read(self, size=-1):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            chunk = self.queue.get()
+            if chunk is None:
+                self.finished = True
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def _unique_name(db: Session, name: str) -> str:
+    existing = set(db.execute(
+        select(models.Project.name).where(models.Project.name.like(f"{name}%"))
+    ).scalars())
+    if name not in existing:
+        return name
+    n = 2
+    while f"{name} ({n})" in existing:
+        n += 1
+    return f"{name} ({n})"
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class _Importer:
+    """
+    stage_*：接收阶段，只写暂存目录，不碰数据库
+    commit()：一个短事务里建项目、插入行、把暂存文件归位
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.header = None
+        self.project = None
+        self.offsets = {}
+        self.counts = {table_name: 0 for table_name in TABLES}
+        self.files = 0
+        self.staging_dir = os.path.join(blob_store.BLOB_TMP_DIR, f"import-{uuid.uuid4().hex}")
+        self.manifests = []  # [(表名, 暂存路径)]，按归档顺序
+        self.asset_paths = set()  # 清单里素材行引用的路径；没被引用的文件不暂存
+        self.asset_files = {}  # 素材路径 -> (暂存路径, sha256, 大小)
+        self.videos = []  # [(旧镜头 id, 扩展名, 暂存路径, sha256, 大小)]
+        self.created_files = []  # 本次新写到 data/ 的文件，失败时清理
+
+    def start(self, header: dict):
+        if header.get("format") != FORMAT or header.get("version") != FORMAT_VERSION:
+            raise ValueError("Unsupported archive format")
+        self.header = header
+
+    def stage_manifest(self, table_name: str, fileobj):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        path = os.path.join(self.staging_dir, uuid.uuid4().hex)
+        with open(path, "wb") as out:
+            for line in fileobj:
+                out.write(line)
+                if table_name == "assets" and line.strip():
+                    file_path = json.loads(line).get("file_path")
+                    if file_path:
+                        self.asset_paths.add(file_path.replace("\\", "/"))
+        self.manifests.append((table_name, path))
+
+    def stage_asset_file(self, relative_path: str, fileobj):
+        if relative_path not in self.asset_paths or relative_path in self.asset_files:
+            return
+        self.asset_files[relative_path] = blob_store.stage_stream(fileobj, self.staging_dir)
+
+    def stage_video(self, old_shot_id: int, ext: str, fileobj):
+        self.videos.append((old_shot_id, ext, *blob_store.stage_stream(fileobj, self.staging_dir)))
+
+    def _begin(self, name: str = None):
+        source = self.header.get("project") or {}
+        self.project = models.Project(
+            name=_unique_name(self.db, name or source.get("name") or "imported"),
+            description=source.get("description"),
+        )
+        self.db.add(self.project)
+        self.db.flush()  # 第一条写入拿到写锁，之后读到的最大 id 不会被别的写事务抢走
+        conn = self.db.connection()
+        conn.exec_driver_sql("PRAGMA defer_foreign_keys = ON")
+        for table_name in TABLES:
+            table = MODELS[table_name].__table__
+            self.offsets[table_name] = conn.execute(select(func.max(table.c.id))).scalar() or 0
+
+    def _remap(self, table_name: str, row: dict, table) -> dict:
+        row = {key: value for key, value in row.items() if key in table.c}
+        row["id"] += self.offsets[table_name]
+        if "project_id" in table.c:
+            row["project_id"] = self.project.id
+        for column, target in REFERENCES.get(table_name, {}).items():
+            if row.get(column) is not None:
+                row[column] += self.offsets[target]
+        if table_name == "event_nodes":
+            target = TARGET_TABLES.get(row.get("target_type"))
+            if target is None or row.get("target_id") is None:
+                return None
+            row["target_id"] += self.offsets[target]
+        if table_name == "shots":
+            row["video_path"] = row["video_size"] = None  # 视频随 files/videos/ 落到新项目目录后再写
+        if table_name == "assets":
+            row["blob_sha256"] = None  # 文件入库后再挂 blob；没带文件的行最后清空路径
+            if row.get("file_path"):
+                row["file_path"] = row["file_path"].replace("\\", "/")  # 和 files/assets/ 成员名对得上
+        for column in table.c:
+            if isinstance(column.type, DateTime) and column.key in row:
+                row[column.key] = _parse_datetime(row[column.key])
+        return row
+
+    def _load_rows(self, table_name: str, path: str):
+        table = MODELS[table_name].__table__
+        rows = []
+        with open(path, "rb") as fileobj:
+            for line in fileobj:
+                if line.strip():
+                    row = self._remap(table_name, json.loads(line), table)
+                    if row is not None:
+                        rows.append(row)
+        if not rows:
+            return
+        self.db.execute(insert(table), rows)
+        revisions.record_changes(self.db, self.project.id, table_name, [row["id"] for row in rows])
+        self.counts[table_name] += len(rows)
+
+    def _load_asset_file(self, relative_path: str, tmp_path: str, sha256: str, size: int):
+        asset = models.Asset.__table__
+        mine = and_(asset.c.id > self.offsets["assets"], asset.c.file_path == relative_path)
+        count = self.db.execute(select(func.count()).where(mine)).scalar()
+        if not count:
+            return
+        existed = self.db.get(models.Blob, sha256) is not None
+        blob = blob_store.store_hashed_file(self.db, tmp_path, sha256, size, relative_path, move=True)
+        if not existed:
+            self.created_files.append(os.path.join(blob_store.DATA_ROOT, blob.file_path))
+        if count > 1:
+            blob_store._acquire(self.db, sha256, blob.file_path, size, count=count - 1)
+        self.db.execute(update(asset).where(mine).values(file_path=blob.file_path, blob_sha256=sha256, file_size=size))
+        self.files += 1
+
+    def _load_video(self, old_shot_id: int, ext: str, tmp_path: str, sha256: str, size: int):
+        shot_id = old_shot_id + self.offsets["shots"]
+        row = self.db.execute(
+            select(models.Shot.scene_id, models.Scene.episode_id)
+            .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+            .where(models.Shot.id == shot_id, models.Shot.id > self.offsets["shots"])
+        ).first()
+        if row is None:
+            return
+        # 与 upload_shot_video 相同的目录结构：{项目}/storyboard/episode_{id}/scene_{id}/shot_{id}/video/
+        # 文件名与 file_serving.save_versioned 一致：<sha256 前 16 位><ext>
+        relative_path = "/".join((
+            self.project.name, "storyboard",
+            f"episode_{row.episode_id}", f"scene_{row.scene_id}", f"shot_{shot_id}", "video", f"{sha256[:16]}{ext}",
+        ))
+        full_path = os.path.join(blob_store.DATA_ROOT, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.replace(tmp_path, full_path)
+        self.created_files.append(full_path)
+        self.db.execute(
+            update(models.Shot.__table__).where(models.Shot.__table__.c.id == shot_id)
+            .values(video_path=relative_path, video_size=size)
+        )
+        self.files += 1
+
+    def commit(self, name: str = None) -> dict:
+        """一个短事务：建项目 -> 按清单顺序插入行 -> 暂存文件归位 -> 提交"""
+        self._begin(name)
+        for table_name, path in self.manifests:
+            self._load_rows(table_name, path)
+        for relative_path, staged in self.asset_files.items():
+            self._load_asset_file(relative_path, *staged)
+        for video in self.videos:
+            self._load_video(*video)
+        # 归档里没带文件（源机器上就缺失）的素材：清掉路径，免得指向本机上不相干的文件
+        asset = models.Asset.__table__
+        missing = self.db.execute(
+            update(asset)
+            .where(asset.c.id > self.offsets["assets"], asset.c.blob_sha256.is_(None), asset.c.file_path.is_not(None))
+            .values(file_path=None)
+        ).rowcount
+        if self.counts["assets"]:
+            jobs.schedule_prompt_indexing(self.db, self.project.id)  # 提示词签名交给后台补算
+        self.db.commit()
+        return {
+            "project_id": self.project.id,
+            "name": self.project.name,
+            "counts": self.counts,
+            "files": self.files,
+            "missing_files": missing,
+        }
+
+    def cleanup(self):
+        for full_path in self.created_files:
+            try:
+                if os.path.exists(full_path):
+                    os.remove(full_path)
+            except OSError as e:
+                print(f"[Archive][Error] Failed to remove {full_path}: {e}")
+
+    def discard_staging(self):
+        """暂存目录里剩下的是没用上或失败时没归位的文件"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+def _member_table(name: str):
+    """manifest/00001-shots.jsonl -> shots"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    table_name = stem.split("-", 1)[-1]
+    return table_name if table_name in MODELS else None
+
+
+def import_archive(reader, name: str = None) -> dict:
+    """
+    工作线程里执行：顺序读 tar 流（也接受 .tar.gz）并暂存，读完后在一个短事务里整体写入，任何一步失败整体回滚
+    格式不对抛 ValueError
+    """
+    db = SessionLocal()
+    importer = _Importer(db)
+    try:
+        with tarfile.open(fileobj=reader, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                fileobj = tar.extractfile(member)
+                if importer.header is None:
+                    if member.name != "project.json":
+                        raise ValueError("project.json must be the first archive member")
+                    importer.start(json.load(fileobj))
+                elif member.name.startswith("manifest/"):
+                    table_name = _member_table(member.name)
+                    if table_name is None:
+                        continue
+                    importer.stage_manifest(table_name, fileobj)
+                elif member.name.startswith("files/assets/"):
+                    importer.stage_asset_file(member.name[len("files/assets/"):], fileobj)
+                elif member.name.startswith("files/videos/"):
+                    stem, ext = os.path.splitext(os.path.basename(member.name))
+                    if stem.isdigit():
+                        importer.stage_video(int(stem), ext or ".mp4", fileobj)
+        if importer.header is None:
+            raise ValueError("Empty archive")
+        return importer.commit(name)
+    except tarfile.TarError as e:
+        db.rollback()
+        importer.cleanup()
+        raise ValueError(f"Invalid archive: {e}")
+    except BaseException:
+        db.rollback()
+        importer.cleanup()
+        raise
+    finally:
+        reader.abort()
+        importer.discard_staging()
+        db.close()
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from fastapi import Response
+
+# 项目级响应缓存：缓存序列化好的 JSON 字节，命中时跳过 ORM 查询与 Pydantic 序列化
+# - 按 (project_id, 分组) 维护代数：提交后受影响分组代数 +1，旧条目自然失效
+# - 读取时先记下代数再查库，写回时代数已变就不会被命中，避免并发写入时缓存旧数据
+
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("AICOMIC_RESPONSE_CACHE_MB", "64")) * 1024 * 1024
+
+# 分组 -> 依赖的表（表名与 revisions.TRACKED_MODELS 一致）
+CACHE_GROUPS = {
+    "script": {"episodes", "scenes", "shots", "assets"},
+    "events": {"events", "event_nodes"},
+    "asset_items": {"characters", "assets"},
+    "matrix": {"episodes", "scenes", "shots", "events", "event_nodes"},  # 事件矩阵的列依赖剧本顺序
+}
+
+
+class ResponseCache:
+    """内存 LRU：(project_id, 分组, 接口, 变体, 代数) -> bytes，按总字节数淘汰"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._generations = {}  # (project_id, group) -> int
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, project_id: int, group: str) -> int:
+        with self._lock:
+            return self._generations.get((project_id, group), 0)
+
+    def get(self, project_id: int, group: str, name: str, variant=None):
+        """命中返回 (bytes, None)；未命中返回 (None, 代数)，写回时把代数带给 put"""
+        with self._lock:
+            generation = self._generations.get((project_id, group), 0)
+            key = (project_id, group, name, variant, generation)
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None, generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body, None
+
+    def put(self, project_id: int, group: str, name: str, variant, generation: int, body: bytes):
+        with self._lock:
+            if self._generations.get((project_id, group), 0) != generation:
+                return  # 查询期间有写入提交，结果可能已过期
+            if len(body) > self.max_bytes:
+                return
+            key = (project_id, group, name, variant, generation)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total -= len(old)
+            self._entries[key] = body
+            self._total += len(body)
+            while self._total > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total -= len(evicted)
+                self.evictions += 1
+
+    def invalidate_tables(self, project_id: int, tables):
+        """提交后调用：依赖这些表的分组代数 +1，并回收旧条目"""
+        groups = {group for group, deps in CACHE_GROUPS.items() if deps & set(tables)}
+        if not groups:
+            return
+        with self._lock:
+            for group in groups:
+                self._generations[(project_id, group)] = self._generations.get((project_id, group), 0) + 1
+            stale = [key for key in self._entries if key[0] == project_id and key[1] in groups]
+            for key in stale:
+                self._total -= len(self._entries.pop(key))
+            self.invalidations += len(groups)
+
+    def clear(self):
+        # 代数不清零，正在查询中的请求写回时照样会被拒绝
+        with self._lock:
+            for key in {entry[:2] for entry in self._entries}:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.clear()
+            self._total = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+
+
+async def cached_json(project_id: int, group: str, name: str, build, response: Response = None, variant=None) -> Response:
+    """
+    build() 是协程，返回序列化好的 JSON 字节；未命中时才调用
+    直接返回 Response 时 FastAPI 不会合并注入的 response 头，这里把 ETag 等缓存头带上
+    """
+    body, generation = response_cache.get(project_id, group, name, variant)
+    if body is None:
+        body = await build()
+        response_cache.put(project_id, group, name, variant, generation, body)
+    headers = {}
+    if response is not None:
+        headers = {key: response.headers[key] for key in ("etag", "cache-control") if key in response.headers}
+    return Response(content=body, media_type="application/json", headers=headers)
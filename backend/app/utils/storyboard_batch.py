@@ -0,0 +1,260 @@
+from pydantic import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .. import file_gc, models, ordering, schemas
+
+# 剧本批量编辑：一批 create/update/delete/move 在同一个事务里按顺序执行
+# - 引用到的已有行每种实体一条 IN 查询预加载，并校验都属于当前项目
+# - 新建行之间用 ref 互相引用（先建场再往里建镜头），新建/修改/移动攒到一次 flush：
+#   INSERT 按表批量（insertmanyvalues），UPDATE 按列分组 executemany
+# - 删除放在最后（先 flush 让移走的镜头不被级联删掉），再 flush 一次
+# - 修订号/变更日志由 revisions 的 Session 事件记录（每次 flush +1，整批最多 +2）
+# - 排序键：新建行由 ordering 在 flush 前追加到末尾；只换父级时放到末尾；
+#   move 给 position 时按操作顺序把行插到父级第 position 位，最后把这些父级的兄弟行整体重新编号（键可能早已不是 position * STEP）
+# - 视频/场次目录等磁盘文件在提交成功后才删（返回给调用方处理）
+
+BATCH_MAX_OPS = 5000
+
+OPS = {"create", "update", "delete", "move"}
+ENTITIES = {
+    "episode": models.Episode,
+    "scene": models.Scene,
+    "shot": models.Shot,
+}
+# 实体 -> 父实体（episode 的父级就是 URL 里的项目）
+PARENTS = {"scene": "episode", "shot": "scene"}
+CREATE_SCHEMAS = {"episode": schemas.EpisodeCreate, "scene": schemas.SceneCreate, "shot": schemas.ShotCreate}
+UPDATE_SCHEMAS = {"episode": schemas.EpisodeUpdate, "scene": schemas.SceneUpdate, "shot": schemas.ShotUpdate}
+# move 的 position 写到哪一列
+POSITION_COLUMNS = {"episode": "order", "scene": "sequence_number", "shot": "sequence_number"}
+
+
+class BatchError(Exception):
+    """第 index 个操作失败；整批回滚"""
+    def __init__(self, index: int, status_code: int, message):
+        super().__init__(f"ops[{index}]: {message}")
+        self.index = index
+        self.status_code = status_code
+        self.message = message
+
+
+def _scoped_query(entity: str, project_id: int, ids):
+    """按 id 取行，同时限定在项目内"""
+    if entity == "episode":
+        return select(models.Episode).where(models.Episode.id.in_(ids), models.Episode.project_id == project_id)
+    if entity == "scene":
+        return select(models.Scene).join(models.Episode, models.Scene.episode_id == models.Episode.id)\
+                                   .where(models.Scene.id.in_(ids), models.Episode.project_id == project_id)
+    return select(models.Shot).join(models.Scene, models.Shot.scene_id == models.Scene.id)\
+                              .join(models.Episode, models.Scene.episode_id == models.Episode.id)\
+                              .where(models.Shot.id.in_(ids), models.Episode.project_id == project_id)
+
+
+def _preload(db: Session, project_id: int, ops) -> dict:
+    wanted = {entity: set() for entity in ENTITIES}
+    for op in ops:
+        if op.entity not in ENTITIES:
+            continue  # 校验阶段再报错
+        if isinstance(op.id, int):
+            wanted[op.entity].add(op.id)
+        if isinstance(op.parent_id, int) and op.entity in PARENTS:
+            wanted[PARENTS[op.entity]].add(op.parent_id)
+    rows = {}
+    for entity, ids in wanted.items():
+        found = db.execute(_scoped_query(entity, project_id, ids)).scalars().all() if ids else []
+        rows[entity] = {row.id: row for row in found}
+    return rows
+
+
+def _validate(schema, data: dict, index: int) -> dict:
+    try:
+        return schema(**data).dict(exclude_unset=True)
+    except ValidationError as e:
+        raise BatchError(index, 422, e.errors(include_url=False, include_context=False))
+
+
+def _shot_ids_under(db: Session, entity: str, row_id: int) -> list:
+    if entity == "shot":
+        return [row_id]
+    stmt = select(models.Shot.id).join(models.Scene, models.Shot.scene_id == models.Scene.id)
+    if entity == "scene":
+        stmt = stmt.where(models.Scene.id == row_id)
+    else:
+        stmt = stmt.where(models.Scene.episode_id == row_id)
+    return list(db.execute(stmt).scalars())
+
+
+def _scene_dir(project_name: str, episode_id: int, scene_id: int) -> str:
+    return f"{project_name}/storyboard/episode_{episode_id}/scene_{scene_id}"
+
+
+def _parent_of(obj, entity: str):
+    """行当前的父级：已有外键返回 id，挂在同批新建的父级下时返回父级对象"""
+    _, parent_col, parent_rel, *_ = ordering.ORDERED[entity]
+    parent_id = getattr(obj, parent_col)
+    return parent_id if parent_id is not None else getattr(obj, parent_rel)
+
+
+def _apply_positions(db: Session, positioned: list):
+    """
+    flush 之后执行：按操作顺序把行从兄弟列表里取出、插到第 position 位（从 1 开始，超出范围放两端），
+    再把涉及的父级整体重新编号；之后又被移到别的父级的操作跳过
+    """
+    orders = {}  # (entity, 父级 id) -> 兄弟行 id 列表
+    for entity, obj, position, target in positioned:
+        _, parent_col, *_ = ordering.ORDERED[entity]
+        parent_id = target if isinstance(target, int) else target.id
+        if getattr(obj, parent_col) != parent_id:
+            continue
+        key = (entity, parent_id)
+        if key not in orders:
+            orders[key] = ordering.sibling_ids(db, entity, parent_id)
+        ids = orders[key]
+        if obj.id in ids:
+            ids.remove(obj.id)
+        ids.insert(min(max(position, 1), len(ids) + 1) - 1, obj.id)
+    for (entity, parent_id), ids in orders.items():
+        ordering.renumber(db, entity, parent_id, ids)
+
+
+def apply_batch(db: Session, project_id: int, ops) -> dict:
+    """
+    同步执行（异步路由经 run_sync 调用），不提交
+    返回 ref -> 新行 id；删除涉及的文件在同一事务里登记墓碑（回滚时一并撤销）；出错抛 BatchError，调用方回滚
+    """
+    project = db.get(models.Project, project_id)
+    if project is None:
+        raise BatchError(0, 404, "Project not found")
+
+    rows = _preload(db, project_id, ops)
+    created = {}  # ref -> 新行
+    deleted = set()  # (entity, 对象 id())
+    delete_targets = []  # (entity, 行)，最后统一清理素材再删除
+    next_scene_seq = {}  # episode 对象 id() -> 下一个自动 sequence_number
+    tail_keys = {}  # (entity, 父级对象 id()) -> 本批次移到末尾的上一个排序键
+    positioned = []  # (entity, 行, position, 目标父级：对象或 id)，按操作顺序
+
+    def tail_key(entity: str, parent) -> float:
+        key = (entity, id(parent))
+        if key in tail_keys:
+            tail_keys[key] += ordering.SORT_KEY_STEP
+        elif parent.id is not None:
+            tail_keys[key] = ordering.append_key(db, entity, parent.id)
+        else:
+            tail_keys[key] = ordering.SORT_KEY_STEP
+        return tail_keys[key]
+
+    def resolve(entity: str, key, index: int, what: str):
+        if isinstance(key, str):
+            obj = created.get(key)
+            if obj is None or not isinstance(obj, ENTITIES[entity]):
+                raise BatchError(index, 400, f"unknown {entity} ref '{key}' for {what}")
+        else:
+            obj = rows[entity].get(key)
+            if obj is None:
+                raise BatchError(index, 404, f"{entity} {key} not found in project {project_id}")
+        if (entity, id(obj)) in deleted:
+            raise BatchError(index, 400, f"{entity} {key} was deleted earlier in this batch")
+        return obj
+
+    def attach(obj, entity: str, parent):
+        # 已有父级直接写外键；同批新建的父级还没有 id，挂关系让 flush 排好插入顺序
+        if entity == "scene":
+            if parent.id is None:
+                obj.episode = parent
+            else:
+                obj.episode_id = parent.id
+        elif parent.id is None:
+            obj.scene = parent
+        else:
+            obj.scene_id = parent.id
+
+    for index, op in enumerate(ops):
+        if op.op not in OPS:
+            raise BatchError(index, 400, f"op must be one of {sorted(OPS)}")
+        if op.entity not in ENTITIES:
+            raise BatchError(index, 400, f"entity must be one of {sorted(ENTITIES)}")
+        entity = op.entity
+
+        if op.op == "create":
+            fields = _validate(CREATE_SCHEMAS[entity], op.data, index)
+            if op.ref is not None and op.ref in created:
+                raise BatchError(index, 400, f"duplicate ref '{op.ref}'")
+            if entity == "episode":
+                obj = models.Episode(project_id=project_id, **fields)
+            else:
+                if op.parent_id is None:
+                    raise BatchError(index, 400, f"parent_id is required to create a {entity}")
+                parent = resolve(PARENTS[entity], op.parent_id, index, "parent_id")
+                if entity == "scene" and fields.get("sequence_number") is None:
+                    # 与单条创建一致：追加到该集末尾
+                    key = id(parent)
+                    if key not in next_scene_seq:
+                        last = 0
+                        if parent.id is not None:
+                            last = db.execute(
+                                select(func.max(models.Scene.sequence_number)).where(models.Scene.episode_id == parent.id)
+                            ).scalar() or 0
+                        next_scene_seq[key] = last + 1
+                    fields["sequence_number"] = next_scene_seq[key]
+                    next_scene_seq[key] += 1
+                    fields["title"] = fields.get("title") or f"Scene {fields['sequence_number']}"
+                obj = ENTITIES[entity](**fields)
+                attach(obj, entity, parent)
+            db.add(obj)
+            if op.ref is not None:
+                created[op.ref] = obj
+            continue
+
+        if op.id is None:
+            raise BatchError(index, 400, f"id is required for {op.op}")
+        obj = resolve(entity, op.id, index, "id")
+
+        if op.op == "update":
+            for key, value in _validate(UPDATE_SCHEMAS[entity], op.data, index).items():
+                setattr(obj, key, value)
+
+        elif op.op == "move":
+            parent = None
+            if op.parent_id is not None:
+                if entity == "episode":
+                    raise BatchError(index, 400, "episodes cannot change parent")
+                parent = resolve(PARENTS[entity], op.parent_id, index, "parent_id")
+                attach(obj, entity, parent)
+            if op.position is not None:
+                # 排序键等 flush 后按真实兄弟行统一重排（见 _apply_positions）
+                setattr(obj, POSITION_COLUMNS[entity], op.position)
+                positioned.append((entity, obj, op.position, parent if parent is not None else _parent_of(obj, entity)))
+            elif parent is not None:
+                obj.sort_key = tail_key(entity, parent)
+
+        else:  # delete
+            deleted.add((entity, id(obj)))
+            delete_targets.append((entity, obj))
+
+    db.flush()
+
+    # 删除：素材行和文件交给 file_gc（镜头 -> 素材没有级联），其余交给 ORM 级联
+    if delete_targets:
+        shot_ids = set()
+        for entity, obj in delete_targets:
+            shot_ids.update(_shot_ids_under(db, entity, obj.id))
+        file_gc.discard_shots(db, shot_ids)
+        for entity, obj in delete_targets:
+            if entity == "scene":
+                file_gc.tombstone_path(db, _scene_dir(project.name, obj.episode_id, obj.id))
+            elif entity == "episode":
+                file_gc.tombstone_path(db, f"{project.name}/storyboard/episode_{obj.id}")
+            db.delete(obj)
+        db.flush()
+
+    _apply_positions(db, [
+        entry for entry in positioned if (entry[0], id(entry[1])) not in deleted
+    ])
+
+    created_ids = {
+        ref: obj.id for ref, obj in created.items()
+        if not any((entity, id(obj)) in deleted for entity in ENTITIES)
+    }
+    return created_ids
@@ -0,0 +1,216 @@
+import json
+
+from sqlalchemy import Text, select, type_coerce
+from sqlalchemy.orm import Session
+
+from .. import models
+from .file_serving import file_url
+
+try:
+    import orjson
+except ImportError:  # 没装 orjson 时退回标准库，输出一致，只是慢一些
+    orjson = None
+
+# 大列表接口的快速序列化：按列投影查询，直接拼成响应结构，再一次性编码成 JSON 字节
+# - 不建 ORM 对象、不走 Pydantic from_attributes 逐个校验；大项目上耗时主要就在这两步
+# - 输出与 schemas 里的 EpisodeRead / AssetItemRead / EventRead 完全一致（字段顺序、计算字段 file_url / video_url）
+#   改这些 schema 时这里要一起改；benchmarks/bench_serialization.py 会核对两条路径的结果
+# - 同步执行（异步路由经 run_sync 调用），结果交给 response_cache 缓存
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _json_text(column):
+    """JSON 列按原文取出，用 orjson 解析（比 JSON 类型逐行走标准库 json.loads 快）"""
+    return type_coerce(column, Text).label(column.key)
+
+
+def _parse(text):
+    return None if text is None else _loads(text)
+
+
+ASSET_COLUMNS = (
+    models.Asset.file_path, models.Asset.file_type, _json_text(models.Asset.meta_data), models.Asset.is_favorite,
+    models.Asset.original_filename, models.Asset.id, models.Asset.created_at,
+)
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def _default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _group_assets(rows) -> dict:
+    """(父 id, *ASSET_COLUMNS) 行 -> {父 id: [AssetRead]}；按位置解包，比按名字取属性快"""
+    grouped = {}
+    for parent_id, file_path, file_type, meta_data, is_favorite, original_filename, asset_id, created_at in rows:
+        grouped.setdefault(parent_id, []).append({
+            "file_path": file_path,
+            "file_type": file_type,
+            "meta_data": None if meta_data is None else _loads(meta_data),
+            "is_favorite": bool(is_favorite),
+            "original_filename": original_filename,
+            "id": asset_id,
+            "created_at": created_at,
+            "file_url": file_url(file_path),
+        })
+    return grouped
+
+
+def script_tree(db: Session, project_id: int) -> list:
+    """List[EpisodeRead]：集 -> 场 -> 镜头 -> 素材，每层一条按项目过滤的查询"""
+    conn = db.connection()  # Core 结果行，跳过 ORM 的行处理
+    episodes = conn.execute(
+        select(models.Episode.id, models.Episode.title, models.Episode.order, models.Episode.sort_key)
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Episode.sort_key, models.Episode.id)
+    ).all()
+    scenes = conn.execute(
+        select(
+            models.Scene.id, models.Scene.episode_id, models.Scene.title,
+            models.Scene.sequence_number, models.Scene.sort_key,
+        )
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Scene.sort_key, models.Scene.id)
+    ).all()
+    shots = conn.execute(
+        select(
+            models.Shot.sequence_number, models.Shot.title, models.Shot.action_text, models.Shot.dialogue,
+            models.Shot.prompt, models.Shot.status, models.Shot.id, models.Shot.scene_id,
+            models.Shot.selected_asset_id, models.Shot.video_path, models.Shot.sort_key,
+        )
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Shot.sort_key, models.Shot.id)
+    ).all()
+    shot_assets = _group_assets(conn.execute(
+        select(models.Asset.shot_id, *ASSET_COLUMNS)
+        .join(models.Shot, models.Asset.shot_id == models.Shot.id)
+        .join(models.Scene, models.Shot.scene_id == models.Scene.id)
+        .join(models.Episode, models.Scene.episode_id == models.Episode.id)
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Asset.shot_id, models.Asset.id)
+    ))
+
+    scene_shots = {}
+    for row in shots:
+        scene_shots.setdefault(row.scene_id, []).append({
+            "sequence_number": row.sequence_number,
+            "title": row.title,
+            "action_text": row.action_text,
+            "dialogue": row.dialogue,
+            "prompt": row.prompt,
+            "status": row.status,
+            "id": row.id,
+            "scene_id": row.scene_id,
+            "assets": shot_assets.get(row.id, []),
+            "selected_asset_id": row.selected_asset_id,
+            "video_path": row.video_path,
+            "sort_key": row.sort_key,
+            "video_url": file_url(row.video_path),
+        })
+    episode_scenes = {}
+    for row in scenes:
+        episode_scenes.setdefault(row.episode_id, []).append({
+            "id": row.id,
+            "title": row.title,
+            "sequence_number": row.sequence_number,
+            "sort_key": row.sort_key,
+            "shots": scene_shots.get(row.id, []),
+        })
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "order": row.order,
+            "sort_key": row.sort_key,
+            "scenes": episode_scenes.get(row.id, []),
+        }
+        for row in episodes
+    ]
+
+
+def asset_items(db: Session, project_id: int, category: str = None) -> list:
+    """List[AssetItemRead]：资产条目带全部素材"""
+    conn = db.connection()  # Core 结果行，跳过 ORM 的行处理
+    stmt = select(
+        models.Character.id, models.Character.name, models.Character.description,
+        models.Character.base_prompt, models.Character.category, models.Character.avatar_asset_id,
+    ).where(models.Character.project_id == project_id).order_by(models.Character.id)
+    if category:
+        stmt = stmt.where(models.Character.category == category)
+    items = conn.execute(stmt).all()
+
+    asset_stmt = (
+        select(models.Asset.character_id, *ASSET_COLUMNS)
+        .join(models.Character, models.Asset.character_id == models.Character.id)
+        .where(models.Character.project_id == project_id)
+        .order_by(models.Asset.character_id, models.Asset.id)
+    )
+    if category:
+        asset_stmt = asset_stmt.where(models.Character.category == category)
+    item_assets = _group_assets(conn.execute(asset_stmt))
+
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "description": row.description,
+            "base_prompt": row.base_prompt,
+            "category": row.category,
+            "avatar_asset_id": row.avatar_asset_id,
+            "assets": item_assets.get(row.id, []),
+        }
+        for row in items
+    ]
+
+
+def event_list(db: Session, project_id: int) -> list:
+    """List[EventRead]：事件带全部节点"""
+    conn = db.connection()  # Core 结果行，跳过 ORM 的行处理
+    events = conn.execute(
+        select(
+            models.Event.id, models.Event.name, models.Event.color,
+            models.Event.description, _json_text(models.Event.graph_data),
+        )
+        .where(models.Event.project_id == project_id)
+        .order_by(models.Event.id)
+    ).all()
+    nodes = conn.execute(
+        select(
+            models.EventNode.event_id, models.EventNode.id, models.EventNode.target_type,
+            models.EventNode.target_id, models.EventNode.description,
+        )
+        .join(models.Event, models.EventNode.event_id == models.Event.id)
+        .where(models.Event.project_id == project_id)
+        .order_by(models.EventNode.event_id, models.EventNode.id)
+    ).all()
+
+    event_nodes = {}
+    for event_id, node_id, target_type, target_id, description in nodes:
+        event_nodes.setdefault(event_id, []).append({
+            "id": node_id,
+            "target_type": target_type,
+            "target_id": target_id,
+            "description": description,
+        })
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "color": row.color,
+            "description": row.description,
+            "graph_data": _parse(row.graph_data),
+            "nodes": event_nodes.get(row.id, []),
+        }
+        for row in events
+    ]
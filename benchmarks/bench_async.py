@@ -0,0 +1,213 @@
+# benchmarks/bench_async.py
+# 并发压测：异步路由（AsyncSession）与旧写法（同步 Session：def 路由占线程池、async 上传路由里同步查库阻塞事件循环）对比
+# 两边各起一个单进程 uvicorn，同一份种子数据，混合 GET 分页镜头 + 上传镜头资产
+# 用法：python -m benchmarks.bench_async [--seconds 5] [--concurrency 16,64,256] [--upload-ratio 0.2]（需要 httpx）
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+from fastapi import Depends, FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload, sessionmaker
+
+from backend.app import models, schemas
+from backend.app.database import Base, make_engine
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD = b"storyboard note\n" * 256  # 4 KB 文本，不触发元数据提取任务
+
+
+# ---------- 旧写法（移植前的同步数据层），只保留压测用到的两个接口 ----------
+
+legacy_app = FastAPI()
+_legacy_engine = None
+_LegacySession = None
+
+
+def _legacy_db():
+    global _legacy_engine, _LegacySession
+    if _LegacySession is None:
+        _legacy_engine = make_engine(f"sqlite:///{os.environ['AICOMIC_DB_PATH']}")
+        _LegacySession = sessionmaker(autocommit=False, autoflush=False, bind=_legacy_engine)
+    db = _LegacySession()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@legacy_app.get("/storyboard/scene/{scene_id}/shots", response_model=List[schemas.ShotRead])
+def legacy_scene_shots(scene_id: int, limit: int = 50, db: Session = Depends(_legacy_db)):
+    return db.query(models.Shot).options(selectinload(models.Shot.assets))\
+             .filter(models.Shot.scene_id == scene_id)\
+             .order_by(models.Shot.sequence_number, models.Shot.id).limit(limit).all()
+
+
+@legacy_app.post("/assets/shot/{shot_id}/upload", response_model=schemas.AssetRead)
+async def legacy_upload_shot_asset(shot_id: int, file: UploadFile = File(...), db: Session = Depends(_legacy_db)):
+    from backend.app.utils import blob_store
+
+    shot = db.query(models.Shot).filter(models.Shot.id == shot_id).first()
+    if not shot:
+        raise HTTPException(status_code=404, detail="Shot not found")
+    blob = await run_in_threadpool(blob_store.store_stream, db, file.file, file.filename)
+    db_asset = models.Asset(
+        shot_id=shot.id, file_path=blob.file_path, file_type="text", meta_data={},
+        is_favorite=False, blob_sha256=blob.sha256, original_filename=file.filename,
+    )
+    db.add(db_asset)
+    db.commit()
+    db.refresh(db_asset)
+    return db_asset
+
+
+# ---------- 压测 ----------
+
+def seed(db_path: str, scenes: int, shots_per_scene: int):
+    seed_engine = make_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=seed_engine)
+    db = sessionmaker(bind=seed_engine)()
+    try:
+        project = models.Project(name="bench")
+        episode = models.Episode(title="E1", order=1, project=project)
+        scene_rows = []
+        for s in range(scenes):
+            scene = models.Scene(title=f"S{s}", sequence_number=s, episode=episode)
+            for i in range(shots_per_scene):
+                shot = models.Shot(title=f"shot {i}", sequence_number=i, scene=scene)
+                shot.assets = [
+                    models.Asset(file_path=f"bench/{s}_{i}_{k}.png", file_type="image", meta_data={"seed": k})
+                    for k in range(3)
+                ]
+            scene_rows.append(scene)
+        db.add(project)
+        db.commit()
+        scene_ids = [scene.id for scene in scene_rows]
+        shot_ids = [shot.id for scene in scene_rows for shot in scene.shots]
+        return scene_ids, shot_ids
+    finally:
+        db.close()
+        seed_engine.dispose()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app_path: str, workdir: str, db_path: str):
+    port = _free_port()
+    env = dict(os.environ, AICOMIC_DB_PATH=db_path, PYTHONPATH=REPO_ROOT)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{base_url}/docs", timeout=1)
+            return proc, base_url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{app_path} failed to start")
+
+
+async def load(base_url: str, scene_ids, shot_ids, concurrency: int, seconds: float, upload_ratio: float) -> dict:
+    stats = {"read": [], "upload": [], "errors": 0}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + seconds
+
+        async def user():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                if random.random() < upload_ratio:
+                    kind = "upload"
+                    request = client.post(
+                        f"/assets/shot/{random.choice(shot_ids)}/upload",
+                        files={"file": ("note.txt", PAYLOAD + os.urandom(8), "text/plain")},
+                    )
+                else:
+                    kind = "read"
+                    request = client.get(f"/storyboard/scene/{random.choice(scene_ids)}/shots", params={"limit": 50})
+                try:
+                    r = await request
+                    if r.status_code != 200:
+                        stats["errors"] += 1
+                        continue
+                except httpx.HTTPError:
+                    stats["errors"] += 1
+                    continue
+                stats[kind].append(time.perf_counter() - started)
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return stats
+
+
+def summarize(latencies, seconds: float) -> dict:
+    lat = sorted(latencies) or [0.0]
+    return {
+        "rps": len(latencies) / seconds,
+        "p50_ms": statistics.median(lat) * 1000,
+        "p95_ms": lat[max(int(len(lat) * 0.95) - 1, 0)] * 1000,
+    }
+
+
+def run_variant(name: str, app_path: str, args, levels) -> list:
+    workdir = tempfile.mkdtemp(prefix=f"bench_async_{name}_")
+    try:
+        db_path = os.path.join(workdir, "bench.db")
+        scene_ids, shot_ids = seed(db_path, args.scenes, args.shots)
+        proc, base_url = start_server(app_path, workdir, db_path)
+        try:
+            asyncio.run(load(base_url, scene_ids, shot_ids, 4, 1.0, args.upload_ratio))  # 预热
+            results = []
+            for concurrency in levels:
+                stats = asyncio.run(load(base_url, scene_ids, shot_ids, concurrency, args.seconds, args.upload_ratio))
+                results.append((concurrency, stats))
+            return results
+        finally:
+            proc.terminate()
+            proc.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", default="16,64,256")
+    parser.add_argument("--upload-ratio", type=float, default=0.2)
+    parser.add_argument("--scenes", type=int, default=20)
+    parser.add_argument("--shots", type=int, default=50)
+    args = parser.parse_args()
+    levels = [int(x) for x in args.concurrency.split(",")]
+
+    print(f"{args.scenes} scenes x {args.shots} shots, {args.upload_ratio:.0%} uploads, {args.seconds}s per level")
+    print(f"{'variant':<8}{'conc':>6}{'req/s':>9}{'read p50':>10}{'read p95':>10}{'up p50':>9}{'up p95':>9}{'errors':>8}")
+    for name, app_path in (("sync", "benchmarks.bench_async:legacy_app"), ("async", "backend.app.main:app")):
+        for concurrency, stats in run_variant(name, app_path, args, levels):
+            read = summarize(stats["read"], args.seconds)
+            upload = summarize(stats["upload"], args.seconds)
+            print(
+                f"{name:<8}{concurrency:>6}{read['rps'] + upload['rps']:>9.1f}"
+                f"{read['p50_ms']:>10.1f}{read['p95_ms']:>10.1f}{upload['p50_ms']:>9.1f}{upload['p95_ms']:>9.1f}"
+                f"{stats['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
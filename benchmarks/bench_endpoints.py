@@ -0,0 +1,325 @@
+# benchmarks/bench_endpoints.py
+# 接口压测：在临时目录里用 synthetic 按种子生成项目，进程内驱动 FastAPI 应用（TestClient，后台任务线程照常运行）
+# - 读接口：从 OpenAPI 里找出全部 GET 路由，路径参数 / 必填查询参数用生成数据填；填不了的记为 skipped
+# - 写接口：挑一组可重复执行的写操作（改镜头、建镜头、移动、批量编辑、上传、事件节点……），放在读接口之后跑
+# - 每个接口报告 p50 / p95 延迟、吞吐（--concurrency 个线程并发）、单次请求的 Python 内存峰值（tracemalloc）
+# - 默认每次请求前清空响应缓存（测的是真正干活的路径），--cache warm 测命中缓存的情况
+# - 结果写成 JSON；--compare 旧结果.json 对比 p50 / p95，超过 --threshold 的标成回归
+# 用法：python -m benchmarks.bench_endpoints [--preset medium] [--requests 30] [--output bench.json] [--compare old.json]
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OK_STATUSES = {200, 201, 204, 206, 304}
+NON_API_PATHS = {"/"}
+# 同名参数在个别路由上含义不同（导入任务 id 不是 jobs 表的 id）
+ROUTE_FIXTURES = {"/assets/ingest/{job_id}": {"job_id": "ingest_id"}}
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# =======================
+# 用例
+# =======================
+
+def build_fixtures(client, summary: dict, image: bytes) -> dict:
+    """路径 / 查询参数名 -> 值；有些 id 要先调一次接口造出来"""
+    ids = summary["ids"]
+
+    def first(kind):
+        return ids[kind][0] if ids.get(kind) else None
+
+    fixtures = {
+        "project_id": summary["project_id"],
+        "episode_id": first("episode"),
+        "scene_id": first("scene"),
+        "shot_id": first("shot"),
+        "asset_id": first("asset"),
+        "item_id": first("asset_item"),
+        "char_id": first("asset_item"),
+        "character_id": first("asset_item"),
+        "event_id": first("event"),
+        "q": summary["sample_prompt_word"],
+        "preset": "thumb",
+        "file_path": summary["image_path"],
+    }
+    job = client.post("/storage/gc/sweep")
+    if job.status_code == 200:
+        fixtures["job_id"] = job.json()["id"]
+    upload = client.post("/uploads/", json={
+        "target_type": "shot_asset", "target_id": fixtures["shot_id"], "filename": "bench.png", "total_size": 16,
+    })
+    if upload.status_code == 200:
+        fixtures["upload_id"] = upload.json()["id"]
+    ingest = client.post(f"/assets/shot/{fixtures['shot_id']}/bulk", files=[("files", ("ingest.png", image, "image/png"))])
+    if ingest.status_code == 200:
+        fixtures["ingest_id"] = ingest.json()["id"]
+    return fixtures
+
+
+def read_cases(app, fixtures: dict):
+    """全部 GET 路由；返回 (用例列表, [(路由, 跳过原因)])"""
+    cases, skipped = [], []
+    for route, operations in app.openapi()["paths"].items():
+        operation = operations.get("get")
+        if operation is None or route in NON_API_PATHS:
+            continue
+        path, query, missing = route, {}, []
+        for param in operation.get("parameters", []):
+            if param["in"] != "path" and not param.get("required"):
+                continue
+            value = fixtures.get(ROUTE_FIXTURES.get(route, {}).get(param["name"], param["name"]))
+            if value is None:
+                missing.append(param["name"])
+            elif param["in"] == "path":
+                path = path.replace("{" + param["name"] + "}", str(value))
+            else:
+                query[param["name"]] = value
+        name = f"GET {route}"
+        if missing:
+            skipped.append((name, f"no fixture for {', '.join(missing)}"))
+            continue
+        cases.append({"name": name, "method": "GET", "request": lambda i, path=path, query=query: (path, {"params": query})})
+    return cases, skipped
+
+
+def write_cases(summary: dict, fixtures: dict, images: list):
+    """可重复执行的写操作；DELETE 每次取不同的行（从 id 区间两头往里取）"""
+    pid = fixtures["project_id"]
+    shot_id, scene_id, event_id = fixtures["shot_id"], fixtures["scene_id"], fixtures["event_id"]
+    shot_first, shot_last = summary["ids"]["shot"]
+    asset_first, _ = summary["ids"]["asset"]
+
+    def png(i):
+        return {"files": {"file": (f"bench_{i}.png", images[i % len(images)], "image/png")}}
+
+    cases = [
+        ("PATCH /storyboard/shot/{shot_id}", "PATCH",
+         lambda i: (f"/storyboard/shot/{shot_id}", {"json": {"title": f"bench {i}", "prompt": f"1girl, take {i}"}})),
+        ("POST /storyboard/scene/{scene_id}/shot", "POST",
+         lambda i: (f"/storyboard/scene/{scene_id}/shot", {"json": {"sequence_number": 1000 + i, "title": f"new {i}"}})),
+        ("POST /storyboard/shot/{shot_id}/move", "POST",
+         lambda i: (f"/storyboard/shot/{shot_id}/move", {"json": {"parent_id": scene_id}})),
+        ("POST /storyboard/project/{project_id}/batch", "POST",
+         lambda i: (f"/storyboard/project/{pid}/batch", {"json": {"ops": [
+             {"op": "update", "entity": "shot", "id": shot_first + k, "data": {"title": f"batch {i}.{k}"}}
+             for k in range(min(10, shot_last - shot_first + 1))
+         ]}})),
+        ("POST /assets/shot/{shot_id}/upload", "POST", lambda i: (f"/assets/shot/{shot_id}/upload", png(i))),
+        ("POST /assets/shot/{shot_id}/bulk", "POST",
+         lambda i: (f"/assets/shot/{shot_id}/bulk",
+                    {"files": [("files", (f"bulk_{i}.png", images[(i + 1) % len(images)], "image/png"))]})),
+        ("POST /projects/{project_id}/asset-items", "POST",
+         lambda i: (f"/projects/{pid}/asset-items", {"json": {"name": f"bench item {i}", "category": "prop"}})),
+    ]
+    if event_id is not None:
+        cases += [
+            ("POST /events/nodes/bulk", "POST", lambda i: ("/events/nodes/bulk", {"json": {"upserts": [
+                {"event_id": event_id, "target_type": "shot", "target_id": shot_first + (i + k) % (shot_last - shot_first + 1),
+                 "description": f"bench {i}"}
+                for k in range(20)
+            ]}})),
+            ("PATCH /events/{event_id}", "PATCH",
+             lambda i: (f"/events/{event_id}", {"json": {"graph_data": {"nodes": [{"id": str(i)}], "edges": []}}})),
+        ]
+    cases += [
+        ("DELETE /projects/assets/{asset_id}", "DELETE", lambda i: (f"/projects/assets/{asset_first + i}", {})),
+        ("DELETE /storyboard/shot/{shot_id}", "DELETE", lambda i: (f"/storyboard/shot/{shot_last - i}", {})),
+    ]
+    return [{"name": name, "method": method, "request": request} for name, method, request in cases]
+
+
+# =======================
+# 计时
+# =======================
+
+def measure(client, case: dict, requests: int, warmup: int, concurrency: int, cold: bool, clear_cache) -> dict:
+    counter = iter(range(warmup + requests + 1))  # 写用例每次拿不同的序号（DELETE 不会删同一行）
+
+    def call(index):
+        path, kwargs = case["request"](index)
+        if cold:
+            clear_cache()
+        started = time.perf_counter()
+        response = client.request(case["method"], path, **kwargs)
+        return time.perf_counter() - started, response.status_code
+
+    for _ in range(warmup):
+        call(next(counter))
+    indices = [next(counter) for _ in range(requests)]
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(call, indices))
+    else:
+        results = [call(index) for index in indices]
+    wall = time.perf_counter() - started
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    call(next(counter))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = [latency for latency, _ in results]
+    statuses = Counter(status for _, status in results)
+    return {
+        "name": case["name"],
+        "requests": requests,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "throughput_rps": round(requests / wall, 2) if wall else None,
+        "peak_kb": round(peak / 1024, 1),
+        "errors": sum(count for status, count in statuses.items() if status not in OK_STATUSES),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def compare(results: list, baseline_path: str, threshold: float) -> list:
+    """和旧结果比 p50 / p95；返回回归的接口名"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {row["name"]: row for row in json.load(f)["endpoints"]}
+    regressions = []
+    print(f"\ncompared with {baseline_path} (threshold {threshold:.0%})")
+    print(f"{'endpoint':<58}{'p50 Δ':>9}{'p95 Δ':>9}")
+    for row in results:
+        old = baseline.get(row["name"])
+        if not old or not old.get("p50_ms") or not old.get("p95_ms"):
+            continue
+        p50 = row["p50_ms"] / old["p50_ms"] - 1
+        p95 = row["p95_ms"] / old["p95_ms"] - 1
+        flag = ""
+        if p50 > threshold or p95 > threshold:
+            flag = "  REGRESSION"
+            regressions.append(row["name"])
+        print(f"{row['name'][:57]:<58}{p50:>+9.0%}{p95:>+9.0%}{flag}")
+    return regressions
+
+
+def main():
+    # data/ 和库路径在 backend.app 导入时按当前目录 / 环境变量确定：先只解析 --workdir，切过去再导入
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--workdir", default=None)
+    workdir_arg = pre.parse_known_args()[0].workdir
+    origin = os.getcwd()
+    workdir = os.path.abspath(workdir_arg or tempfile.mkdtemp(prefix="aicomic-bench-"))
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    os.environ["AICOMIC_DB_PATH"] = os.path.join(workdir, "database.db")
+    os.chdir(workdir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from benchmarks import synthetic
+
+    parser = argparse.ArgumentParser(description="进程内接口压测（合成数据）")
+    parser.add_argument("--requests", type=int, default=30, help="每个接口计时的请求数")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--cache", choices=("cold", "warm"), default="cold")
+    parser.add_argument("--only", default=None, help="只跑名字匹配这个正则的接口")
+    parser.add_argument("--no-writes", action="store_true")
+    parser.add_argument("--output", default="bench_endpoints.json")
+    parser.add_argument("--compare", default=None, help="旧结果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 / p95 变慢超过这个比例算回归")
+    parser.add_argument("--workdir", default=None, help="数据目录（默认临时目录，跑完删除）")
+    synthetic.add_count_arguments(parser)
+    args = parser.parse_args()
+    output = os.path.join(origin, args.output)
+    baseline = os.path.join(origin, args.compare) if args.compare else None
+
+    try:
+        engine, session_factory = synthetic.prepare_database(os.environ["AICOMIC_DB_PATH"])
+        counts = synthetic.counts_from_args(args)
+        started = time.perf_counter()
+        summary = synthetic.generate(session_factory, os.path.join(workdir, "data"), counts,
+                                     seed=args.seed, image_size=args.image_size)
+        engine.dispose()
+        rows = ", ".join(f"{count} {table}" for table, count in summary["rows"].items())
+        print(f"dataset (seed {args.seed}): {rows}; generated in {time.perf_counter() - started:.1f}s")
+
+        from fastapi.testclient import TestClient
+
+        from backend.app.main import app
+        from backend.app.utils.response_cache import response_cache
+
+        rng = random.Random(args.seed + 1)
+        upload_images = [synthetic.make_sd_png(rng, 256) for _ in range(16)]
+        results = []
+        with TestClient(app) as client:
+            fixtures = build_fixtures(client, summary, upload_images[0])
+            cases, skipped = read_cases(app, fixtures)
+            if not args.no_writes:
+                cases += write_cases(summary, fixtures, upload_images)
+            if args.only:
+                cases = [case for case in cases if re.search(args.only, case["name"])]
+
+            print(f"{len(cases)} endpoints, {args.requests} requests each, concurrency {args.concurrency}, cache {args.cache}")
+            print(f"{'endpoint':<58}{'p50 ms':>9}{'p95 ms':>9}{'req/s':>9}{'peak KB':>10}{'errors':>7}")
+            for case in cases:
+                row = measure(client, case, args.requests, args.warmup, args.concurrency,
+                              args.cache == "cold", response_cache.clear)
+                results.append(row)
+                print(f"{row['name'][:57]:<58}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+                      f"{row['throughput_rps'] or 0:>9.1f}{row['peak_kb']:>10.1f}{row['errors']:>7}")
+            for name, reason in skipped:
+                print(f"skipped {name}: {reason}")
+
+        report = {
+            "meta": {
+                "version": git_version(),
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "concurrency": args.concurrency,
+                "cache": args.cache,
+                "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            },
+            "dataset": summary,
+            "endpoints": results,
+            "skipped": [{"name": name, "reason": reason} for name, reason in skipped],
+        }
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"results written to {output}")
+
+        regressions = compare(results, baseline, args.threshold) if baseline else []
+    finally:
+        os.chdir(origin)
+        if not workdir_arg:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# benchmarks/bench_serialization.py
+# 大列表接口的两条序列化路径对比：ORM selectinload + Pydantic from_attributes（旧写法） vs 列投影 + orjson（utils/tree_json.py）
+# 覆盖完整剧本树、资产条目列表、事件列表；每个接口先核对两条路径输出一致，再分别计时（不含响应缓存）
+# 用法：python -m benchmarks.bench_serialization [--shots 10000] [--assets-per-shot 10] [--repeat 5]
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from backend.app import models, schemas
+from backend.app.database import Base, make_engine
+from backend.app.utils import tree_json
+
+SHOTS_PER_SCENE = 50
+SCENES_PER_EPISODE = 20
+ITEMS = 200
+EVENTS = 100
+NODES_PER_EVENT = 50
+
+
+def _blob_path(key: str) -> str:
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"_blobs/{digest[:2]}/{digest[2:4]}/{digest}.png"
+
+
+def _meta(i: int) -> dict:
+    return {"prompt": f"hero standing in the rain, shot {i}", "seed": i, "steps": 30, "cfg_scale": 7.0}
+
+
+def seed(session_factory, shots: int, assets_per_shot: int) -> int:
+    """Core 批量插入，几秒内铺好 shots 个镜头、shots * assets_per_shot 张素材"""
+    db = session_factory()
+    try:
+        project = models.Project(name="bench")
+        db.add(project)
+        db.flush()
+        scene_count = max(1, shots // SHOTS_PER_SCENE)
+        episode_count = max(1, scene_count // SCENES_PER_EPISODE)
+        db.execute(insert(models.Episode), [
+            {"id": e + 1, "project_id": project.id, "title": f"E{e + 1}", "order": e + 1, "sort_key": float(e + 1)}
+            for e in range(episode_count)
+        ])
+        db.execute(insert(models.Scene), [
+            {"id": s + 1, "episode_id": s % episode_count + 1, "title": f"S{s + 1}", "sequence_number": s + 1, "sort_key": float(s + 1)}
+            for s in range(scene_count)
+        ])
+        db.execute(insert(models.Shot), [
+            {
+                "id": i + 1, "scene_id": i % scene_count + 1, "sequence_number": i + 1, "title": f"shot {i}",
+                "action_text": "walks in", "dialogue": "……", "prompt": f"prompt {i}", "status": "draft",
+                "sort_key": float(i + 1),
+            }
+            for i in range(shots)
+        ])
+        asset_id = 0
+        batch = []
+        for i in range(shots):
+            for k in range(assets_per_shot):
+                asset_id += 1
+                batch.append({
+                    "id": asset_id, "shot_id": i + 1, "file_path": _blob_path(f"{i}-{k}"), "file_type": "image",
+                    "meta_data": _meta(asset_id), "is_favorite": False, "original_filename": f"{i}_{k}.png",
+                })
+            if len(batch) >= 10000:
+                db.execute(insert(models.Asset), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.Asset), batch)
+
+        db.execute(insert(models.Character), [
+            {"id": c + 1, "project_id": project.id, "name": f"item {c}", "category": "persona_visual", "base_prompt": "1girl"}
+            for c in range(ITEMS)
+        ])
+        db.execute(insert(models.Asset), [
+            {
+                "character_id": c + 1, "file_path": _blob_path(f"item-{c}-{k}"), "file_type": "image",
+                "meta_data": _meta(k), "is_favorite": True, "original_filename": f"item_{c}_{k}.png",
+            }
+            for c in range(ITEMS) for k in range(5)
+        ])
+        db.execute(insert(models.Event), [
+            {"id": e + 1, "project_id": project.id, "name": f"event {e}", "color": "#3B82F6", "graph_data": {"nodes": [], "edges": []}}
+            for e in range(EVENTS)
+        ])
+        db.execute(insert(models.EventNode), [
+            {"event_id": e + 1, "target_type": "shot", "target_id": (e * NODES_PER_EVENT + n) % shots + 1, "description": "turning point"}
+            for e in range(EVENTS) for n in range(NODES_PER_EVENT)
+        ])
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+# ---------- 旧写法：ORM 对象 + Pydantic 逐个校验 ----------
+
+_episode_list = TypeAdapter(List[schemas.EpisodeRead])
+_item_list = TypeAdapter(List[schemas.AssetItemRead])
+_event_list = TypeAdapter(List[schemas.EventRead])
+
+
+def orm_script(db, project_id: int) -> bytes:
+    episodes = db.execute(
+        select(models.Episode)
+        .options(selectinload(models.Episode.scenes).selectinload(models.Scene.shots).selectinload(models.Shot.assets))
+        .where(models.Episode.project_id == project_id)
+        .order_by(models.Episode.sort_key, models.Episode.id)
+    ).scalars().all()
+    return _episode_list.dump_json(_episode_list.validate_python(episodes, from_attributes=True))
+
+
+def orm_items(db, project_id: int) -> bytes:
+    items = db.execute(
+        select(models.Character).options(selectinload(models.Character.assets))
+        .where(models.Character.project_id == project_id)
+    ).scalars().all()
+    return _item_list.dump_json(_item_list.validate_python(items, from_attributes=True))
+
+
+def orm_events(db, project_id: int) -> bytes:
+    events = db.execute(
+        select(models.Event).options(selectinload(models.Event.nodes)).where(models.Event.project_id == project_id)
+    ).scalars().all()
+    return _event_list.dump_json(_event_list.validate_python(events, from_attributes=True))
+
+
+CASES = (
+    ("script tree", orm_script, lambda db, pid: tree_json.dumps(tree_json.script_tree(db, pid))),
+    ("asset items", orm_items, lambda db, pid: tree_json.dumps(tree_json.asset_items(db, pid))),
+    ("events", orm_events, lambda db, pid: tree_json.dumps(tree_json.event_list(db, pid))),
+)
+
+
+def timed(session_factory, fn, project_id: int, repeat: int):
+    latencies = []
+    body = None
+    for _ in range(repeat):
+        db = session_factory()  # 每轮新会话：不让 identity map 把 ORM 对象留到下一轮
+        try:
+            started = time.perf_counter()
+            body = fn(db, project_id)
+            latencies.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    return statistics.median(latencies), body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shots", type=int, default=10000)
+    parser.add_argument("--assets-per-shot", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile="tuned")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+        started = time.perf_counter()
+        project_id = seed(Session, args.shots, args.assets_per_shot)
+        print(f"seeded {args.shots} shots / {args.shots * args.assets_per_shot} assets in {time.perf_counter() - started:.1f}s"
+              f" (encoder: {'orjson' if tree_json.orjson else 'json'}), median of {args.repeat}")
+
+        print(f"{'endpoint':<14}{'orm+pydantic ms':>17}{'projected ms':>14}{'speedup':>9}{'MB':>8}")
+        for name, old, new in CASES:
+            old_s, old_body = timed(Session, old, project_id, args.repeat)
+            new_s, new_body = timed(Session, new, project_id, args.repeat)
+            if json.loads(old_body) != json.loads(new_body):
+                raise SystemExit(f"{name}: fast path output differs from the Pydantic schema")
+            print(f"{name:<14}{old_s * 1000:>17.1f}{new_s * 1000:>14.1f}{old_s / new_s:>8.1f}x{len(new_body) / 1e6:>8.1f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
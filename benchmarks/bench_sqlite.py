@@ -0,0 +1,124 @@
+# benchmarks/bench_sqlite.py
+# 对比旧的 SQLite 默认配置与 tuned 配置（WAL + 读写分池）在并发读写下的吞吐与延迟
+# 用法：python -m benchmarks.bench_sqlite [--seconds 5] [--writers 4] [--readers 8] [--shots 300]
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from backend.app import models
+from backend.app.database import Base, make_engine
+
+
+def seed(session_factory, shots: int):
+    db = session_factory()
+    try:
+        project = models.Project(name="bench")
+        episode = models.Episode(title="E1", order=1, project=project)
+        scene = models.Scene(title="S1", sequence_number=1, episode=episode)
+        for i in range(shots):
+            shot = models.Shot(title=f"shot {i}", sequence_number=i, scene=scene)
+            shot.assets = [
+                models.Asset(file_path=f"bench/{i}_{k}.png", file_type="image", meta_data={"seed": k})
+                for k in range(3)
+            ]
+        db.add(project)
+        db.commit()
+        return project.id, scene.id
+    finally:
+        db.close()
+
+
+def writer(session_factory, scene_id: int, stop: threading.Event, stats: dict):
+    while not stop.is_set():
+        started = time.perf_counter()
+        db = session_factory()
+        try:
+            shot = models.Shot(title="new", sequence_number=0, scene_id=scene_id)
+            db.add(shot)
+            db.flush()
+            db.add(models.Asset(shot_id=shot.id, file_path="bench/new.png", file_type="image", meta_data={}))
+            db.commit()
+            stats["latencies"].append(time.perf_counter() - started)
+        except OperationalError:
+            db.rollback()
+            stats["errors"] += 1
+        finally:
+            db.close()
+
+
+def reader(session_factory, project_id: int, stop: threading.Event, stats: dict):
+    while not stop.is_set():
+        started = time.perf_counter()
+        db = session_factory()
+        try:
+            db.query(models.Episode).options(
+                selectinload(models.Episode.scenes).selectinload(models.Scene.shots).selectinload(models.Shot.assets)
+            ).filter(models.Episode.project_id == project_id).all()
+            stats["latencies"].append(time.perf_counter() - started)
+        except OperationalError:
+            stats["errors"] += 1
+        finally:
+            db.close()
+
+
+def run_profile(profile: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        write_engine = make_engine(url, profile=profile)
+        read_engine = make_engine(url, profile=profile, readonly=True) if profile == "tuned" else write_engine
+        Base.metadata.create_all(bind=write_engine)
+        WriteSession = sessionmaker(bind=write_engine, autoflush=False)
+        ReadSession = sessionmaker(bind=read_engine, autoflush=False)
+        project_id, scene_id = seed(WriteSession, args.shots)
+
+        stop = threading.Event()
+        write_stats = {"latencies": [], "errors": 0}
+        read_stats = {"latencies": [], "errors": 0}
+        threads = [threading.Thread(target=writer, args=(WriteSession, scene_id, stop, write_stats)) for _ in range(args.writers)]
+        threads += [threading.Thread(target=reader, args=(ReadSession, project_id, stop, read_stats)) for _ in range(args.readers)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        write_engine.dispose()
+        read_engine.dispose()
+
+    def summarize(stats):
+        lat = sorted(stats["latencies"]) or [0.0]
+        return {
+            "ops_per_s": len(stats["latencies"]) / args.seconds,
+            "p50_ms": statistics.median(lat) * 1000,
+            "p95_ms": lat[int(len(lat) * 0.95) - 1 if len(lat) > 1 else 0] * 1000,
+            "errors": stats["errors"],
+        }
+
+    return {"write": summarize(write_stats), "read": summarize(read_stats)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--shots", type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers / {args.readers} readers, {args.seconds}s each, script tree of {args.shots} shots")
+    print(f"{'profile':<10}{'kind':<7}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for profile in ("default", "tuned"):
+        result = run_profile(profile, args)
+        for kind in ("write", "read"):
+            r = result[kind]
+            print(f"{profile:<10}{kind:<7}{r['ops_per_s']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+# benchmarks/synthetic.py
+# 按种子生成可复现的大项目：集 / 场 / 镜头 / 素材 / 资产条目 / 事件 / 事件节点，外加带 SD parameters 文本块的 PNG
+# - 同一个种子、同样的数量，生成的行和文件逐字节一致，版本之间的压测结果才有可比性
+# - 行用 Core 批量插入（库里的触发器照常维护全文索引、存储统计）；图片进内容寻址存储，素材轮流引用
+# - 素材的 meta_data / phash 由真实的 extract_metadata / dhash 从生成的图片里算出来，和上传路径一致
+# 用法：python -m benchmarks.synthetic --out ./synthetic [--preset medium] [--seed 42] [--episodes 8 ...]
+#       之后 AICOMIC_DB_PATH=./synthetic/database.db，在 ./synthetic 下启动后端即可打开生成的项目
+import argparse
+import datetime
+import hashlib
+import io
+import os
+import random
+import shutil
+import time
+
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+from sqlalchemy import bindparam, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import models
+from backend.app.database import Base, make_engine
+from backend.app.migrations import run_migrations
+from backend.app.ordering import SORT_KEY_STEP
+from backend.app.utils.blob_store import blob_relative_path
+from backend.app.utils.image_hash import dhash_file
+from backend.app.utils.metadata_parser import extract_metadata
+
+# 数量都是“每个上级多少个”；images 是不同图片文件数，素材按顺序轮流引用
+PRESETS = {
+    "small": {
+        "episodes": 2, "scenes": 5, "shots": 10, "assets": 3,
+        "items": 10, "item_assets": 2, "events": 5, "nodes": 10, "images": 20, "videos": 5,
+    },
+    "medium": {
+        "episodes": 8, "scenes": 10, "shots": 25, "assets": 5,
+        "items": 60, "item_assets": 4, "events": 40, "nodes": 50, "images": 120, "videos": 40,
+    },
+    "large": {
+        "episodes": 20, "scenes": 25, "shots": 20, "assets": 10,
+        "items": 300, "item_assets": 6, "events": 200, "nodes": 200, "images": 400, "videos": 200,
+    },
+}
+COUNT_KEYS = tuple(PRESETS["small"])
+INSERT_CHUNK = 5000
+VIDEO_BYTES = 256 * 1024
+BASE_TIME = datetime.datetime(2024, 1, 1)  # created_at 也固定下来，接口输出才能逐字节复现
+
+SUBJECTS = ["1girl", "1boy", "old monk", "young swordsman", "fox spirit", "village elder", "black cat", "disciple"]
+ACTIONS = ["standing in the rain", "drawing a sword", "kneeling", "running through a forest", "meditating",
+           "looking back", "holding a lantern", "falling from a cliff"]
+PLACES = ["ruined temple", "bamboo forest", "mountain peak", "village street", "misty lake", "cave", "palace hall"]
+STYLES = ["masterpiece", "best quality", "cinematic lighting", "ink wash", "dramatic", "wide shot", "close-up",
+          "night", "volumetric fog", "detailed background"]
+NEGATIVE = "lowres, bad anatomy, bad hands, text, error, missing fingers, watermark, blurry"
+SAMPLERS = ["DPM++ 2M Karras", "Euler a", "DPM++ SDE Karras", "UniPC"]
+CATEGORIES = ["persona_visual", "persona_visual", "background", "prop"]
+TARGET_TYPES = ("episode", "scene", "shot")
+COLORS = ["#3B82F6", "#EF4444", "#F59E0B", "#10B981", "#8B5CF6"]
+LINES = ["“快走！”", "“师父……”", "“这把剑不该由你来拿。”", "", "（沉默）", "“天要亮了。”"]
+
+
+def resolve_counts(preset: str = "small", **overrides) -> dict:
+    counts = dict(PRESETS[preset])
+    counts.update({key: value for key, value in overrides.items() if value is not None})
+    return counts
+
+
+def _prompt(rng: random.Random) -> str:
+    tags = rng.sample(STYLES, 3) + [rng.choice(SUBJECTS), rng.choice(ACTIONS), rng.choice(PLACES)]
+    return ", ".join(tags)
+
+
+def _parameters(rng: random.Random, prompt: str, size: int) -> str:
+    """WebUI 写进 PNG 的 parameters 文本：提示词 / 反向提示词 / 参数行"""
+    return (
+        f"{prompt}\n"
+        f"Negative prompt: {NEGATIVE}\n"
+        f"Steps: {rng.choice((20, 25, 28, 30))}, Sampler: {rng.choice(SAMPLERS)}, "
+        f"CFG scale: {rng.choice((5, 6, 7, 7.5))}, Seed: {rng.randrange(2 ** 32)}, "
+        f"Size: {size}x{size}, Model hash: {rng.randbytes(5).hex()}, Model: sdxl_base"
+    )
+
+
+def make_png(rng: random.Random, size: int, parameters: str) -> bytes:
+    """低分辨率噪声放大成平滑纹理：压缩率接近真实出图，又能逐字节复现"""
+    tile = max(4, size // 8)
+    img = Image.frombytes("RGB", (tile, tile), rng.randbytes(tile * tile * 3))
+    img = img.resize((size, size), Image.Resampling.BICUBIC)
+    info = PngInfo()
+    info.add_text("parameters", parameters)
+    out = io.BytesIO()
+    img.save(out, format="PNG", pnginfo=info, compress_level=6)
+    return out.getvalue()
+
+
+def make_sd_png(rng: random.Random, size: int) -> bytes:
+    """随机提示词 + 参数的一张出图"""
+    return make_png(rng, size, _parameters(rng, _prompt(rng), size))
+
+
+def _write_images(rng: random.Random, data_root: str, count: int, size: int) -> list:
+    """生成 count 张图片放进 _blobs/；返回 [{sha256, file_path, size, meta_data, phash}]"""
+    images = []
+    for _ in range(count):
+        body = make_sd_png(rng, size)
+        sha256 = hashlib.sha256(body).hexdigest()
+        relative_path = blob_relative_path(sha256, ".png")
+        full_path = os.path.join(data_root, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(body)
+        images.append({
+            "sha256": sha256,
+            "file_path": relative_path,
+            "size": len(body),
+            "meta_data": extract_metadata(full_path),
+            "phash": dhash_file(full_path),
+        })
+    return images
+
+
+def _next_ids(db, *tables) -> dict:
+    """追加到已有库时接着现有最大 id 往后排"""
+    return {
+        model: (db.execute(select(func.max(model.id))).scalar() or 0) + 1
+        for model in tables
+    }
+
+
+def _insert(db, model, rows: list):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(model), rows[start:start + INSERT_CHUNK])
+
+
+def generate(session_factory, data_root: str, counts: dict, seed: int = 42, image_size: int = 512, name: str = None) -> dict:
+    """
+    生成一个项目（提交），返回 {project_id, counts, ids: {表: [首个 id, 末个 id]}, files, bytes}
+    data_root 对应后端的 data/ 目录；session_factory 绑定的库需已建表并跑过迁移
+    """
+    rng = random.Random(seed)
+    images = _write_images(rng, data_root, counts["images"], image_size)
+    db = session_factory()
+    try:
+        project = models.Project(name=name or f"synthetic-{seed}", description=f"seed={seed} {counts}")
+        db.add(project)
+        db.flush()
+        pid = project.id
+        next_id = _next_ids(db, models.Episode, models.Scene, models.Shot, models.Asset,
+                            models.Character, models.Event, models.EventNode)
+
+        episodes, scenes, shots, assets = [], [], [], []
+        image_refs = [0] * len(images)
+        for e in range(counts["episodes"]):
+            episode_id = next_id[models.Episode] + len(episodes)
+            episodes.append({
+                "id": episode_id, "project_id": pid, "title": f"第{e + 1}集：{rng.choice(PLACES)}",
+                "order": e + 1, "sort_key": (e + 1) * SORT_KEY_STEP,
+            })
+            for s in range(counts["scenes"]):
+                scene_id = next_id[models.Scene] + len(scenes)
+                scenes.append({
+                    "id": scene_id, "episode_id": episode_id, "sequence_number": s + 1,
+                    "title": f"{rng.choice(PLACES)}·{rng.choice(ACTIONS)}", "sort_key": (s + 1) * SORT_KEY_STEP,
+                })
+                for k in range(counts["shots"]):
+                    shot_id = next_id[models.Shot] + len(shots)
+                    shot_assets = []
+                    for _ in range(counts["assets"]):
+                        index = len(assets) % len(images) if images else None
+                        image = images[index] if images else None
+                        if image is not None:
+                            image_refs[index] += 1
+                        shot_assets.append({
+                            "id": next_id[models.Asset] + len(assets), "shot_id": shot_id,
+                            "created_at": BASE_TIME + datetime.timedelta(seconds=len(assets)),
+                            "file_path": image["file_path"] if image else None, "file_type": "image",
+                            "meta_data": image["meta_data"] if image else None, "is_favorite": rng.random() < 0.1,
+                            "blob_sha256": image["sha256"] if image else None,
+                            "original_filename": f"{rng.randrange(10 ** 6):06d}-{rng.randrange(2 ** 32)}.png",
+                            "phash": image["phash"] if image else None, "file_size": image["size"] if image else None,
+                        })
+                        assets.append(shot_assets[-1])
+                    shots.append({
+                        "id": shot_id, "scene_id": scene_id, "sequence_number": k + 1, "sort_key": (k + 1) * SORT_KEY_STEP,
+                        "title": rng.choice(["全景", "中景", "近景", "特写", "俯拍", "跟拍"]),
+                        "action_text": f"{rng.choice(SUBJECTS)} {rng.choice(ACTIONS)}，{rng.choice(PLACES)}。",
+                        "dialogue": rng.choice(LINES), "prompt": _prompt(rng), "negative_prompt": NEGATIVE,
+                        "status": rng.choice(["draft", "draft", "generating", "done"]),
+                        "selected_asset_id": rng.choice(shot_assets)["id"] if shot_assets and rng.random() < 0.7 else None,
+                    })
+
+        items = []
+        for c in range(counts["items"]):
+            item_id = next_id[models.Character] + c
+            items.append({
+                "id": item_id, "project_id": pid, "name": f"{rng.choice(SUBJECTS)} #{c + 1}",
+                "description": f"{rng.choice(PLACES)}出身", "base_prompt": _prompt(rng),
+                "category": rng.choice(CATEGORIES), "avatar_asset_id": None,
+            })
+            for a in range(counts["item_assets"]):
+                index = len(assets) % len(images) if images else None
+                image = images[index] if images else None
+                if image is None:
+                    break
+                image_refs[index] += 1
+                assets.append({
+                    "id": next_id[models.Asset] + len(assets), "character_id": item_id,
+                    "created_at": BASE_TIME + datetime.timedelta(seconds=len(assets)),
+                    "file_path": image["file_path"], "file_type": "image", "meta_data": image["meta_data"],
+                    "is_favorite": True, "blob_sha256": image["sha256"], "original_filename": f"{item_id}_{a}.png",
+                    "phash": image["phash"], "file_size": image["size"],
+                })
+                if a == 0:
+                    items[-1]["avatar_asset_id"] = assets[-1]["id"]
+
+        targets = {
+            "episode": [row["id"] for row in episodes],
+            "scene": [row["id"] for row in scenes],
+            "shot": [row["id"] for row in shots],
+        }
+        events, nodes = [], []
+        for v in range(counts["events"]):
+            event_id = next_id[models.Event] + v
+            events.append({
+                "id": event_id, "project_id": pid, "name": f"事件 {v + 1}：{rng.choice(ACTIONS)}",
+                "color": rng.choice(COLORS), "start_time_sort_key": v, "description": _prompt(rng),
+                "graph_data": {"nodes": [{"id": str(n), "position": {"x": n * 120, "y": 0}} for n in range(3)], "edges": []},
+            })
+            seen = set()
+            for _ in range(counts["nodes"]):
+                target_type = rng.choice(TARGET_TYPES)
+                if not targets[target_type]:
+                    continue
+                target_id = rng.choice(targets[target_type])
+                if (target_type, target_id) in seen:  # ux_event_nodes_target
+                    continue
+                seen.add((target_type, target_id))
+                nodes.append({
+                    "id": next_id[models.EventNode] + len(nodes), "event_id": event_id,
+                    "target_type": target_type, "target_id": target_id, "description": rng.choice(ACTIONS),
+                })
+
+        # blob 先于素材（外键）；选中素材 / 头像指向素材，素材之后再回填
+        existing = set(db.execute(
+            select(models.Blob.sha256).where(models.Blob.sha256.in_([image["sha256"] for image in images]))
+        ).scalars()) if images else set()
+        _insert(db, models.Blob, [
+            {"sha256": image["sha256"], "file_path": image["file_path"], "size": image["size"], "ref_count": refs}
+            for image, refs in zip(images, image_refs) if image["sha256"] not in existing
+        ])
+        for image, refs in zip(images, image_refs):
+            if image["sha256"] in existing:
+                db.execute(
+                    models.Blob.__table__.update().where(models.Blob.sha256 == image["sha256"])
+                    .values(ref_count=models.Blob.ref_count + refs)
+                )
+        _insert(db, models.Episode, episodes)
+        _insert(db, models.Scene, scenes)
+        selected = {row["id"]: row.pop("selected_asset_id") for row in shots}
+        _insert(db, models.Shot, shots)
+        _insert(db, models.Character, [{**row, "avatar_asset_id": None} for row in items])
+        _insert(db, models.Asset, assets)
+        _update_refs(db, models.Shot, "selected_asset_id", selected)
+        _update_refs(db, models.Character, "avatar_asset_id", {row["id"]: row["avatar_asset_id"] for row in items})
+        _insert(db, models.Event, events)
+        _insert(db, models.EventNode, nodes)
+
+        files = len(images)
+        total_bytes = sum(image["size"] for image in images)
+        if counts["videos"] and shots:
+            files_written, size = _write_videos(db, rng, data_root, project.name, shots, scenes, counts["videos"])
+            files += files_written
+            total_bytes += size
+        db.commit()
+
+        def span(rows):
+            return [rows[0]["id"], rows[-1]["id"]] if rows else None
+
+        return {
+            "project_id": pid,
+            "seed": seed,
+            "counts": counts,
+            "rows": {
+                "episodes": len(episodes), "scenes": len(scenes), "shots": len(shots), "assets": len(assets),
+                "asset_items": len(items), "events": len(events), "event_nodes": len(nodes),
+            },
+            "ids": {
+                "episode": span(episodes), "scene": span(scenes), "shot": span(shots), "asset": span(assets),
+                "asset_item": span(items), "event": span(events), "event_node": span(nodes),
+            },
+            "sample_prompt_word": rng.choice(ACTIONS).split()[0],
+            "image_path": images[0]["file_path"] if images else None,
+            "files": files,
+            "bytes": total_bytes,
+        }
+    finally:
+        db.close()
+
+
+def _update_refs(db, model, column: str, values: dict):
+    table = model.__table__
+    rows = [{"_id": row_id, "_ref": ref} for row_id, ref in values.items() if ref is not None]
+    if rows:
+        db.execute(table.update().where(table.c.id == bindparam("_id")).values({column: bindparam("_ref")}), rows)
+
+
+def _write_videos(db, rng: random.Random, data_root: str, project_name: str, shots: list, scenes: list, count: int):
+    """随机挑镜头挂上视频（随机字节，只用来测 /files 和存储统计），目录结构与上传路径一致"""
+    episode_of = {row["id"]: row["episode_id"] for row in scenes}
+    chosen = rng.sample(shots, min(count, len(shots)))
+    rows = []
+    for shot in chosen:
+        body = rng.randbytes(VIDEO_BYTES)
+        hierarchy_path = os.path.join(
+            project_name, "storyboard", f"episode_{episode_of[shot['scene_id']]}",
+            f"scene_{shot['scene_id']}", f"shot_{shot['id']}", "video",
+        )
+        filename = f"{hashlib.sha256(body).hexdigest()[:16]}.mp4"
+        os.makedirs(os.path.join(data_root, hierarchy_path), exist_ok=True)
+        with open(os.path.join(data_root, hierarchy_path, filename), "wb") as f:
+            f.write(body)
+        rows.append({
+            "_id": shot["id"],
+            "_path": os.path.join(hierarchy_path, filename).replace("\\", "/"),
+            "_size": len(body),
+        })
+    table = models.Shot.__table__
+    db.execute(
+        table.update().where(table.c.id == bindparam("_id"))
+        .values(video_path=bindparam("_path"), video_size=bindparam("_size")),
+        rows,
+    )
+    return len(rows), len(rows) * VIDEO_BYTES
+
+
+def prepare_database(db_path: str):
+    """建表 + 跑迁移（触发器要在插入前建好），返回 (engine, session_factory)"""
+    engine = make_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    return engine, sessionmaker(bind=engine, autoflush=False)
+
+
+def add_count_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--image-size", type=int, default=512)
+    for key in COUNT_KEYS:
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, default=None, help=f"覆盖预设里的 {key}")
+
+
+def counts_from_args(args) -> dict:
+    return resolve_counts(args.preset, **{key: getattr(args, key) for key in COUNT_KEYS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成可复现的合成大项目")
+    parser.add_argument("--out", required=True, help="输出目录：<out>/database.db + <out>/data/")
+    parser.add_argument("--name", default=None)
+    parser.add_argument("--fresh", action="store_true", help="先清空输出目录")
+    add_count_arguments(parser)
+    args = parser.parse_args()
+
+    if args.fresh and os.path.isdir(args.out):
+        shutil.rmtree(args.out)
+    os.makedirs(os.path.join(args.out, "data"), exist_ok=True)
+    engine, session_factory = prepare_database(os.path.join(args.out, "database.db"))
+    started = time.perf_counter()
+    summary = generate(
+        session_factory, os.path.join(args.out, "data"), counts_from_args(args),
+        seed=args.seed, image_size=args.image_size, name=args.name,
+    )
+    engine.dispose()
+    rows = ", ".join(f"{count} {table}" for table, count in summary["rows"].items())
+    print(f"project {summary['project_id']}: {rows}; {summary['files']} files, "
+          f"{summary['bytes'] / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,13 +12,31 @@ export default {
   getProjects: () => apiClient.get('/projects/'),
   createProject: (data) => apiClient.post('/projects/', data),
   updateProject: (id, data) => apiClient.patch(`/projects/${id}`, data),
+  // 项目打包：导出为 tar（浏览器直接下载），导入总是新建项目
+  exportProjectUrl: (id) => `${apiClient.defaults.baseURL}/projects/${id}/export`,
+  importProject: (file, name) => apiClient.post('/projects/import', file, {
+    params: { name },
+    headers: { 'Content-Type': 'application/x-tar' },
+  }),
   
   // 剧本 (Episode/Scene/Shot)
   getScript: (projectId) => apiClient.get(`/storyboard/project/${projectId}`),
+  // 增量同步：返回修订号 since 之后变更的行
+  getScriptChanges: (projectId, since) => apiClient.get(`/storyboard/project/${projectId}/changes`, { params: { since } }),
+  // 分层加载：先拿骨架，再按场/集分页拉镜头（assets: all / selected / none）
+  getScriptSkeleton: (projectId) => apiClient.get(`/storyboard/project/${projectId}/skeleton`),
+  getSceneShots: (sceneId, params = {}) => apiClient.get(`/storyboard/scene/${sceneId}/shots`, { params }),
+  getEpisodeShots: (episodeId, params = {}) => apiClient.get(`/storyboard/episode/${episodeId}/shots`, { params }),
+  // 批量编辑：ops 按顺序在一个事务里执行，返回 ref -> 新 id
+  batchEditScript: (projectId, ops) => apiClient.post(`/storyboard/project/${projectId}/batch`, { ops }),
   createEpisode: (projectId, data) => apiClient.post(`/storyboard/project/${projectId}/episode`, data),
   createScene: (episodeId, data) => apiClient.post(`/storyboard/episode/${episodeId}/scene`, data),
   createShot: (sceneId, data) => apiClient.post(`/storyboard/scene/${sceneId}/shot`, data),
   updateShot: (shotId, data) => apiClient.patch(`/storyboard/shot/${shotId}`, data),
+  // 排序/移动：{ parent_id?, before_id?, after_id? }，只改被移动的一行
+  moveEpisode: (episodeId, data) => apiClient.post(`/storyboard/episode/${episodeId}/move`, data),
+  moveScene: (sceneId, data) => apiClient.post(`/storyboard/scene/${sceneId}/move`, data),
+  moveShot: (shotId, data) => apiClient.post(`/storyboard/shot/${shotId}/move`, data),
   updateScene: (sceneId, data) => apiClient.patch(`/storyboard/scene/${sceneId}`, data),
   
   // 资产
@@ -26,9 +44,26 @@ export default {
   
   // 事件
   getEvents: (projectId) => apiClient.get(`/events/project/${projectId}`),
+  // 稀疏事件矩阵（列按剧本顺序，镜头节点已上卷到场/集）
+  getEventMatrix: (projectId) => apiClient.get(`/events/matrix/${projectId}`),
   createEvent: (projectId, data) => apiClient.post(`/events/project/${projectId}`, data),
   updateEvent: (eventId, data) => apiClient.patch(`/events/${eventId}`, data),
   upsertEventNode: (eventId, data) => apiClient.post(`/events/nodes/${eventId}`, data),
+  // 批量写节点：{ upserts: [{event_id, target_type, target_id, description}], deletes: [{event_id, target_type, target_id}] }
+  bulkEventNodes: (data) => apiClient.post('/events/nodes/bulk', data),
+
+  // 文件回收：删除后的文件由后台清扫；对账扫描的结果在任务 result 里（轮询 /jobs/{id}）
+  getGcStatus: () => apiClient.get('/storage/gc'),
+  sweepFiles: () => apiClient.post('/storage/gc/sweep'),
+  reconcileFiles: (apply = false) => apiClient.post('/storage/reconcile', null, { params: { apply } }),
+  // 存储统计：各项目总量 / 单项目按分类、集、场拆分；rebuild 为读盘重算的后台任务
+  getProjectsStorage: () => apiClient.get('/storage/projects'),
+  getProjectStorage: (projectId) => apiClient.get(`/storage/project/${projectId}`),
+  rebuildStorageUsage: () => apiClient.post('/storage/usage/rebuild'),
+
+  // 全文检索：types 逗号分隔（shot / asset_item / asset），返回 { items, next_offset }
+  searchProject: (projectId, q, { types, limit = 20, offset = 0 } = {}) =>
+    apiClient.get(`/search/project/${projectId}`, { params: { q, types, limit, offset } }),
   
   // 人设
   // 资产条目（项目级）
@@ -62,6 +97,21 @@ export default {
     });
   },
   
+  // 提示词近似重复：按组返回，每组第一项是建议保留的
+  getNearDuplicates: (projectId, { threshold, limit } = {}) =>
+    apiClient.get(`/assets/project/${projectId}/near-duplicates`, { params: { threshold, limit } }),
+  getAssetNearDuplicates: (assetId, threshold) =>
+    apiClient.get(`/assets/${assetId}/near-duplicates`, { params: { threshold } }),
+  // 相似图片（感知哈希）：上传前查重可以只传缩略图
+  getSimilarImages: (assetId, maxDistance) =>
+    apiClient.get(`/assets/${assetId}/similar-images`, { params: { max_distance: maxDistance } }),
+  checkImageDuplicates: (projectId, formData, maxDistance) =>
+    apiClient.post(`/assets/project/${projectId}/image-check`, formData, {
+      params: { max_distance: maxDistance },
+      headers: { 'Content-Type': 'multipart/form-data' }
+    }),
+  pruneAssets: (projectId, assetIds) => apiClient.post(`/assets/project/${projectId}/prune`, { asset_ids: assetIds }),
+
   uploadShotVideo(shotId, formData) {
     return apiClient.post(`/assets/shot/${shotId}/video`, formData, {
       headers: {
@@ -8,7 +8,9 @@ export const useProjectStore = defineStore('project', {
     
     // 数据缓存
     episodes: [], // 剧本树
+    scriptRevision: null, // 剧本树对应的项目修订号（增量同步用）
     events: [],   // 事件列表
+    eventMatrix: null, // 稀疏事件矩阵（事件纵览用）
     assetItems: [], // 资产条目列表（项目级，按分类查询）
         
     // UI 状态
@@ -32,6 +34,8 @@ export const useProjectStore = defineStore('project', {
     
     async selectProject(id) {
       this.currentProjectId = id;
+      this.scriptRevision = null;
+      this.eventMatrix = null;
       this.currentScene = null;
       this.currentShot = null;
       await Promise.all([
@@ -43,8 +47,74 @@ export const useProjectStore = defineStore('project', {
     
     async fetchScript() {
       if (!this.currentProjectId) return;
-      const { data } = await api.getScript(this.currentProjectId);
+      // 已有剧本树时只拉增量，拼不上再整树重拉
+      if (this.scriptRevision !== null) {
+        const { data } = await api.getScriptChanges(this.currentProjectId, this.scriptRevision);
+        if (!data.reset && this.applyScriptChanges(data)) {
+          this.scriptRevision = data.revision;
+          return;
+        }
+      }
+      const { data, headers } = await api.getScript(this.currentProjectId);
       this.episodes = data;
+      // ETag 形如 W/"p1-r42"
+      const match = /-r(\d+)"/.exec(headers?.etag || '');
+      this.scriptRevision = match ? Number(match[1]) : null;
+    },
+
+    // 把 /changes 的结果合并进剧本树；父节点不在树里时返回 false
+    applyScriptChanges({ upserted = {}, deleted = {} }) {
+      const levels = [
+        { table: 'episodes', children: 'scenes', parentKey: null, sortKey: 'sort_key' },
+        { table: 'scenes', children: 'shots', parentKey: 'episode_id', sortKey: 'sort_key' },
+        { table: 'shots', children: 'assets', parentKey: 'scene_id', sortKey: 'sort_key' },
+        { table: 'assets', children: null, parentKey: 'shot_id', sortKey: 'id' },
+      ];
+      const index = {};
+      const walk = (nodes, depth, parent) => {
+        for (const node of nodes) {
+          index[`${levels[depth].table}:${node.id}`] = { node, parent };
+          const children = levels[depth].children;
+          if (children && node[children]) walk(node[children], depth + 1, node);
+        }
+      };
+      walk(this.episodes, 0, null);
+
+      const listOf = (depth, parent) => (parent ? parent[levels[depth - 1].children] : this.episodes);
+      const detach = (depth, id) => {
+        const hit = index[`${levels[depth].table}:${id}`];
+        if (!hit) return;
+        const list = listOf(depth, hit.parent);
+        const pos = list.indexOf(hit.node);
+        if (pos >= 0) list.splice(pos, 1);
+      };
+
+      for (let depth = levels.length - 1; depth >= 0; depth--) {
+        for (const id of deleted[levels[depth].table] || []) detach(depth, id);
+      }
+      for (let depth = 0; depth < levels.length; depth++) {
+        const { table, children, parentKey, sortKey } = levels[depth];
+        for (const row of upserted[table] || []) {
+          if (table === 'assets' && row.shot_id == null) continue; // 资产条目素材不在剧本树里
+          let parent = null;
+          if (parentKey) {
+            parent = index[`${levels[depth - 1].table}:${row[parentKey]}`]?.node;
+            if (!parent) return false;
+          }
+          const existing = index[`${table}:${row.id}`];
+          let node;
+          if (existing && existing.parent === parent) {
+            node = Object.assign(existing.node, row);
+          } else {
+            if (existing) detach(depth, row.id);
+            node = existing ? Object.assign(existing.node, row) : { ...row, ...(children ? { [children]: [] } : {}) };
+            listOf(depth, parent).push(node);
+            index[`${table}:${row.id}`] = { node, parent };
+          }
+          listOf(depth, parent).sort((a, b) => (a[sortKey] ?? 0) - (b[sortKey] ?? 0) || a.id - b.id);
+        }
+      }
+      return true;
     },
     
     async fetchEvents() {
@@ -53,6 +123,12 @@ export const useProjectStore = defineStore('project', {
       this.events = data;
     },
 
+    async fetchEventMatrix() {
+      if (!this.currentProjectId) return;
+      const { data } = await api.getEventMatrix(this.currentProjectId);
+      this.eventMatrix = data;
+    },
+
     async fetchAssetItems(category) {
       if (!this.currentProjectId) return;
       const { data } = await api.getAssetItems(this.currentProjectId, category);